@@ -1,14 +1,20 @@
-from flask import Flask, render_template, request, jsonify, Response
-import google.generativeai as genai
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+import contextvars
 import json
 import os
+import queue
+import re
+import threading
 from dotenv import load_dotenv
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Load environment variables
 load_dotenv()
 
-from models.book import db, Book, Series
+from models.book import db, Book, Series, GenerationJob
+from models.migrations import add_missing_columns, add_missing_indexes, fill_missing_stats, fill_search_columns, move_text_to_chapters
+from utils import book_parser, jobs, llm, llm_json, metrics, pagination, passages, quiz, summaries
 import config
 
 # Initialize Flask app
@@ -18,7 +24,7 @@ app.config['SECRET_KEY'] = config.SECRET_KEY
 # Use absolute path for database
 basedir = os.path.abspath(os.path.dirname(__file__))
 db_path = os.path.join(basedir, 'database', 'books.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+app.config['SQLALCHEMY_DATABASE_URI'] = config.DATABASE_URL or f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize database
@@ -26,74 +32,67 @@ db.init_app(app)
 
 # Configure Gemini API
 print(f"DEBUG: API KEY FOUND? {'Yes' if config.GEMINI_API_KEY else 'No'}")
-if not config.GEMINI_API_KEY:
+if not config.GEMINI_API_KEY and config.LLM_BACKEND in ('gemini', 'record'):
     print("ERROR: GEMINI_API_KEY is missing from environment variables!")
 
-genai.configure(api_key=config.GEMINI_API_KEY)
+llm.configure(config.GEMINI_API_KEY)
 
-def generate_book_with_gemini(theme, style, num_chapters, num_pages=50, language='pt-pt'):
-    """
-    Generate a complete book using Google Gemini API.
-    Returns title, chapters list, and full text.
-    """
-    # Calculate words: ~250 words per page
-    total_words = num_pages * 250
-    words_per_chapter = total_words // num_chapters
-    
-    # Language configuration
-    language_config = {
-        'pt-pt': {
-            'name': 'Português de Portugal',
-            'chapter': 'Capítulo',
-            'instructions': 'Escreve em Português Europeu (Portugal), usando vocabulário e expressões típicas de Portugal.'
-        },
-        'pt-br': {
-            'name': 'Português do Brasil',
-            'chapter': 'Capítulo',
-            'instructions': 'Escreve em Português Brasileiro, usando vocabulário e expressões típicas do Brasil.'
-        },
-        'en': {
-            'name': 'English',
-            'chapter': 'Chapter',
-            'instructions': 'Write in English, using proper grammar and vocabulary.'
-        },
-        'fr': {
-            'name': 'Français',
-            'chapter': 'Chapitre',
-            'instructions': 'Écris en Français, en utilisant un vocabulaire et une grammaire corrects.'
-        },
-        'de': {
-            'name': 'Deutsch',
-            'chapter': 'Kapitel',
-            'instructions': 'Schreibe auf Deutsch mit korrekter Grammatik und Wortschatz.'
-        },
-        'it': {
-            'name': 'Italiano',
-            'chapter': 'Capitolo',
-            'instructions': 'Scrivi in Italiano, usando vocabolario e grammatica corretti.'
-        }
+# Language configuration
+LANGUAGE_CONFIG = {
+    'pt-pt': {
+        'name': 'Português de Portugal',
+        'chapter': 'Capítulo',
+        'instructions': 'Escreve em Português Europeu (Portugal), usando vocabulário e expressões típicas de Portugal.'
+    },
+    'pt-br': {
+        'name': 'Português do Brasil',
+        'chapter': 'Capítulo',
+        'instructions': 'Escreve em Português Brasileiro, usando vocabulário e expressões típicas do Brasil.'
+    },
+    'en': {
+        'name': 'English',
+        'chapter': 'Chapter',
+        'instructions': 'Write in English, using proper grammar and vocabulary.'
+    },
+    'fr': {
+        'name': 'Français',
+        'chapter': 'Chapitre',
+        'instructions': 'Écris en Français, en utilisant un vocabulaire et une grammaire corrects.'
+    },
+    'de': {
+        'name': 'Deutsch',
+        'chapter': 'Kapitel',
+        'instructions': 'Schreibe auf Deutsch mit korrekter Grammatik und Wortschatz.'
+    },
+    'it': {
+        'name': 'Italiano',
+        'chapter': 'Capitolo',
+        'instructions': 'Scrivi in Italiano, usando vocabolario e grammatica corretti.'
     }
-    
-    lang = language_config.get(language, language_config['pt-pt'])
+}
+
+# Chapter headings the response parser recognises, in every language
+CHAPTER_WORDS = sorted({lang['chapter'] for lang in LANGUAGE_CONFIG.values()})
+
+# Style-specific instructions
+STYLE_INSTRUCTIONS = {
+    'tecnico': 'Escreve de forma técnica e informativa, com explicações claras, exemplos práticos e linguagem profissional. Inclui definições, conceitos-chave e referências quando apropriado.',
+    'tutorial': 'Escreve como um guia passo-a-passo, com instruções claras, dicas práticas, exemplos concretos e exercícios. Usa uma linguagem acessível e direta.',
+    'educacional': 'Escreve de forma didática e pedagógica, com explicações progressivas, exemplos ilustrativos, resumos e perguntas de revisão. Adequado para aprendizagem.',
+    'autoajuda': 'Escreve de forma motivacional e prática, com reflexões, exercícios de autoconhecimento, histórias inspiradoras e estratégias aplicáveis ao dia-a-dia.'
+}
+
+def build_outline_prompt(theme, style, num_chapters, num_pages=50, language='pt-pt'):
+    """Build the prompt that asks for the title, index and chapter synopses"""
+    total_words = num_pages * 250
+    lang = LANGUAGE_CONFIG.get(language, LANGUAGE_CONFIG['pt-pt'])
     chapter_word = lang['chapter']
     
-    # Style-specific instructions
-    style_instructions = {
-        'tecnico': 'Escreve de forma técnica e informativa, com explicações claras, exemplos práticos e linguagem profissional. Inclui definições, conceitos-chave e referências quando apropriado.',
-        'tutorial': 'Escreve como um guia passo-a-passo, com instruções claras, dicas práticas, exemplos concretos e exercícios. Usa uma linguagem acessível e direta.',
-        'educacional': 'Escreve de forma didática e pedagógica, com explicações progressivas, exemplos ilustrativos, resumos e perguntas de revisão. Adequado para aprendizagem.',
-        'autoajuda': 'Escreve de forma motivacional e prática, com reflexões, exercícios de autoconhecimento, histórias inspiradoras e estratégias aplicáveis ao dia-a-dia.'
-    }
-    
-    style_extra = style_instructions.get(style, '')
-    is_technical = style in ['tecnico', 'tutorial', 'educacional', 'autoajuda']
-    
-    prompt = f"""Cria um livro completo.
+    prompt = f"""Planeia um livro completo.
 Tema: {theme}.
 Estilo literário: {style}.
 Número de capítulos: {num_chapters}.
-Número total de páginas: aproximadamente {num_pages} páginas.
-Total de palavras: aproximadamente {total_words} palavras.
+Número total de páginas: aproximadamente {num_pages} páginas ({total_words} palavras).
 Idioma: {lang['name']}.
 
 {lang['instructions']}
@@ -101,14 +100,11 @@ Idioma: {lang['name']}.
 Gera:
 1. Um título original e apelativo
 2. Uma lista de capítulos numerada
-3. O texto completo do livro, com narrativa contínua e coerente, com subtítulo de cada capítulo.
+3. Uma sinopse de 2-3 frases para cada capítulo, formando uma narrativa contínua e coerente
 
-IMPORTANTE: 
-- O livro DEVE ser escrito inteiramente em {lang['name']}.
-- O livro deve ter aproximadamente {num_pages} páginas ({total_words} palavras no total).
-- Cada capítulo deve ter aproximadamente {words_per_chapter} palavras.
-{f'- {style_extra}' if style_extra else '- Escreve uma narrativa rica, detalhada e envolvente.'}
-{f'- Para livros técnicos: inclui introdução, conceitos fundamentais, exemplos práticos, e conclusão em cada capítulo.' if is_technical else ''}
+IMPORTANTE:
+- Tudo DEVE ser escrito em {lang['name']}.
+- Gera EXATAMENTE {num_chapters} capítulos.
 - Formata a resposta EXATAMENTE assim:
 
 ===TÍTULO===
@@ -119,58 +115,194 @@ IMPORTANTE:
 {chapter_word} 2: [Nome do capítulo]
 [... continuar para todos os capítulos]
 
-===TEXTO COMPLETO===
-[Texto completo do livro com todos os capítulos, cada um começando com "{chapter_word} X: Nome"]
+===SINOPSES===
+1: [Sinopse do capítulo 1]
+2: [Sinopse do capítulo 2]
+[... continuar para todos os capítulos]
 """
+    return prompt
 
+def generate_book_outline(theme, style, num_chapters, num_pages=50, language='pt-pt'):
+    """
+    Generate the title, chapter index and chapter synopses of a book in a single call.
+    Returns a dict with title, chapters and synopses (one per chapter).
+    """
+    chapter_word = LANGUAGE_CONFIG.get(language, LANGUAGE_CONFIG['pt-pt'])['chapter']
+    prompt = build_outline_prompt(theme, style, num_chapters, num_pages, language)
+    
     try:
-        # Use Gemini Pro model
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt)
+        response = llm.generate(prompt, route='generate_book_outline')
         
         if response and response.text:
-            return parse_book_response(response.text)
+            return parse_book_outline(response.text, num_chapters, chapter_word)
         else:
             raise Exception("Resposta vazia do Gemini")
             
     except Exception as e:
-        raise Exception(f"Erro ao gerar livro: {str(e)}")
+        raise Exception(f"Erro ao gerar índice do livro: {str(e)}")
 
-def translate_book_with_gemini(original_book, target_language):
+def parse_book_outline(response_text, num_chapters, chapter_word='Capítulo'):
     """
-    Translate an existing book to a target language using Gemini API.
-    Maintains the same story, just in a different language.
+    Parse an outline response into title, chapters and synopses.
+    Always returns exactly num_chapters chapters and synopses.
     """
-    language_config = {
-        'pt-pt': {'name': 'Português de Portugal', 'chapter': 'Capítulo'},
-        'pt-br': {'name': 'Português do Brasil', 'chapter': 'Capítulo'},
-        'en': {'name': 'English', 'chapter': 'Chapter'},
-        'fr': {'name': 'Français', 'chapter': 'Chapitre'},
-        'de': {'name': 'Deutsch', 'chapter': 'Kapitel'},
-        'it': {'name': 'Italiano', 'chapter': 'Capitolo'}
+    return outline_from_parser(book_parser.parse(response_text, CHAPTER_WORDS), num_chapters, chapter_word)
+
+def outline_from_parser(parser, num_chapters, chapter_word='Capítulo'):
+    """Build the outline from a closed BookStreamParser, padding missing chapters"""
+    chapters = parser.index[:num_chapters]
+    for n in range(len(chapters) + 1, num_chapters + 1):
+        chapters.append(f"{chapter_word} {n}")
+    
+    return {
+        'title': parser.title or book_parser.DEFAULT_TITLE,
+        'chapters': chapters,
+        'synopses': [parser.synopses.get(n, '') for n in range(1, num_chapters + 1)]
     }
+
+def build_chapter_prompt(outline, index, theme, style, words_per_chapter, language='pt-pt'):
+    """
+    Build the prompt for one chapter of the book outline.
+    The prompt carries the full index plus the synopses of the neighbouring chapters.
+    """
+    lang = LANGUAGE_CONFIG.get(language, LANGUAGE_CONFIG['pt-pt'])
+    style_extra = STYLE_INSTRUCTIONS.get(style, '')
+    is_technical = style in STYLE_INSTRUCTIONS
+    
+    chapters = outline['chapters']
+    synopses = outline['synopses']
+    chapter_title = chapters[index]
+    
+    neighbours = ""
+    if index > 0:
+        neighbours += f"\nCapítulo anterior ({chapters[index - 1]}): {synopses[index - 1]}"
+    if index + 1 < len(chapters):
+        neighbours += f"\nCapítulo seguinte ({chapters[index + 1]}): {synopses[index + 1]}"
+    
+    prompt = f"""Escreve um capítulo de um livro.
+Título do livro: {outline['title']}
+Tema: {theme}.
+Estilo literário: {style}.
+Idioma: {lang['name']}.
+
+{lang['instructions']}
+
+ÍNDICE COMPLETO:
+{chr(10).join(chapters)}
+
+CAPÍTULO A ESCREVER: {chapter_title}
+Sinopse: {synopses[index]}
+{neighbours}
+
+IMPORTANTE:
+- O capítulo DEVE ser escrito inteiramente em {lang['name']}.
+- O capítulo deve ter aproximadamente {words_per_chapter} palavras.
+- Mantém a continuidade com os capítulos anterior e seguinte.
+{f'- {style_extra}' if style_extra else '- Escreve uma narrativa rica, detalhada e envolvente.'}
+{f'- Para livros técnicos: inclui introdução, conceitos fundamentais, exemplos práticos, e conclusão.' if is_technical else ''}
+- Escreve APENAS o texto do capítulo, começando com "{chapter_title}".
+"""
+    return prompt
+
+def generate_chapter_with_gemini(outline, index, theme, style, words_per_chapter, language='pt-pt'):
+    """Generate the text of one chapter from the book outline"""
+    chapter_title = outline['chapters'][index]
+    prompt = build_chapter_prompt(outline, index, theme, style, words_per_chapter, language)
+    
+    response = llm.generate(prompt, route='generate_chapter_with_gemini')
     
-    lang = language_config.get(target_language, language_config['pt-pt'])
+    if not response or not response.text:
+        raise Exception(f"Resposta vazia do Gemini para {chapter_title}")
+    
+    content = response.text.strip()
+    if not content.startswith(chapter_title):
+        content = f"{chapter_title}\n\n{content}"
+    return content
+
+def generate_book_with_gemini(theme, style, num_chapters, num_pages=50, language='pt-pt', checkpoint=None):
+    """
+    Generate a complete book using Google Gemini API.
+    The outline is generated first, then every chapter is generated concurrently.
+    Returns title, chapters list, full text, per-chapter content and LLM usage.
+    With a checkpoint (utils.jobs.JobCheckpoint), the outline and each finished chapter
+    are saved as they complete and saved pieces are not generated again.
+    """
+    # Calculate words: ~250 words per page
+    total_words = num_pages * 250
+    words_per_chapter = total_words // num_chapters
+    
+    with metrics.metered() as usage:
+        outline = checkpoint.load_outline() if checkpoint else None
+        if not outline:
+            outline = generate_book_outline(theme, style, num_chapters, num_pages, language)
+            if checkpoint:
+                checkpoint.save_outline(outline)
+        
+        contents = [None] * num_chapters
+        if checkpoint:
+            for i, content in checkpoint.load_chapters().items():
+                if i < num_chapters:
+                    contents[i] = content
+        
+        # Keep the chapters that did finish even if another one fails
+        error = None
+        with ThreadPoolExecutor(max_workers=config.CHAPTER_WORKERS) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, generate_chapter_with_gemini, outline, i, theme, style, words_per_chapter, language): i
+                for i in range(num_chapters) if contents[i] is None
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    contents[i] = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if checkpoint:
+                    checkpoint.save_chapter(i, contents[i])
+    
+    if error:
+        raise Exception(f"Erro ao gerar livro: {str(error)}")
+    
+    return {
+        'title': outline['title'],
+        'chapters': outline['chapters'],
+        'full_text': '\n\n'.join(contents),
+        'chapters_content': [
+            {'title': title, 'content': content}
+            for title, content in zip(outline['chapters'], contents)
+        ],
+        'usage': usage.to_dict()
+    }
+
+def build_translation_glossary(original_book, chapters_content, target_language):
+    """
+    Translate the title and index of a book and build a glossary of names and terms.
+    Returns a dict with title, chapters and glossary (original -> translation).
+    """
+    lang = LANGUAGE_CONFIG.get(target_language, LANGUAGE_CONFIG['pt-pt'])
     chapter_word = lang['chapter']
+    num_chapters = len(chapters_content)
     
-    prompt = f"""Traduz o seguinte livro para {lang['name']}.
-Mantém a mesma história, personagens, enredo e estrutura.
-Adapta apenas o idioma, mantendo o estilo e tom do original.
+    # The opening of each chapter is enough to find the recurring names and terms
+    excerpts = "\n\n".join(
+        f"{chapter['title']}:\n{chapter['content'][:1500]}" for chapter in chapters_content
+    )
+    
+    prompt = f"""Prepara a tradução de um livro para {lang['name']}.
 
 LIVRO ORIGINAL:
 Título: {original_book['title']}
 
 Índice:
-{chr(10).join(original_book['chapters'])}
+{chr(10).join(chapter['title'] for chapter in chapters_content)}
 
-Texto completo:
-{original_book['full_text']}
+Excertos:
+{excerpts}
 
-IMPORTANTE:
-- Traduz TUDO para {lang['name']}.
-- Mantém a mesma estrutura de capítulos.
-- Os capítulos devem usar a palavra "{chapter_word}" em vez do original.
-- Mantém a mesma história e detalhes, apenas traduzidos.
+TAREFA:
+1. Traduz o título e o índice para {lang['name']}. Os capítulos devem usar a palavra "{chapter_word}".
+2. Cria um glossário com os nomes próprios, lugares e termos recorrentes e a forma como devem ser escritos em {lang['name']} (mantém os nomes próprios que não se traduzem).
 
 Formata a resposta EXATAMENTE assim:
 
@@ -182,86 +314,137 @@ Formata a resposta EXATAMENTE assim:
 {chapter_word} 2: [Nome traduzido]
 [... todos os capítulos]
 
-===TEXTO COMPLETO===
-[Texto completo traduzido]
+===GLOSSÁRIO===
+[Termo original] = [Tradução]
+[... um termo por linha]
 """
 
-    try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt)
-        
-        if response and response.text:
-            return parse_book_response(response.text)
-        else:
-            raise Exception("Resposta vazia do Gemini na tradução")
-            
-    except Exception as e:
-        raise Exception(f"Erro ao traduzir livro: {str(e)}")
+    response = llm.generate(prompt, route='build_translation_glossary')
+    
+    if not response or not response.text:
+        raise Exception("Resposta vazia do Gemini na tradução")
+    
+    outline = parse_book_outline(response.text, num_chapters, chapter_word)
+    glossary = {}
+    if "===GLOSSÁRIO===" in response.text:
+        for line in response.text.split("===GLOSSÁRIO===", 1)[1].split('\n'):
+            original, sep, translated = line.strip().lstrip('-*').partition('=')
+            if sep and original.strip() and translated.strip():
+                glossary[original.strip()] = translated.strip()
+    
+    return {
+        'title': outline['title'],
+        'chapters': outline['chapters'],
+        'glossary': glossary
+    }
+
+def translate_chapter_with_gemini(chapter, translated_title, glossary, target_language):
+    """Translate the content of one chapter, following the shared glossary"""
+    lang = LANGUAGE_CONFIG.get(target_language, LANGUAGE_CONFIG['pt-pt'])
+    glossary_text = "\n".join(f"- {original} = {translated}" for original, translated in glossary.items())
+    
+    prompt = f"""Traduz o seguinte capítulo de um livro para {lang['name']}.
+Mantém a mesma história, personagens e detalhes.
+Adapta apenas o idioma, mantendo o estilo e tom do original.
+
+{f"GLOSSÁRIO (usa SEMPRE estas traduções):{chr(10)}{glossary_text}" if glossary_text else ""}
+
+CAPÍTULO ORIGINAL:
+{chapter['content']}
 
-def parse_book_response(response_text):
+IMPORTANTE:
+- Traduz TUDO para {lang['name']}.
+- Começa o capítulo com o título traduzido: "{translated_title}".
+- Escreve APENAS o capítulo traduzido, sem comentários.
+"""
+
+    response = llm.generate(prompt, route='translate_chapter_with_gemini')
+    
+    if not response or not response.text:
+        raise Exception(f"Resposta vazia do Gemini na tradução de {chapter['title']}")
+    
+    content = response.text.strip()
+    if not content.startswith(translated_title):
+        content = f"{translated_title}\n\n{content}"
+    return content
+
+def translate_book_with_gemini(original_book, target_language):
     """
-    Parse the Gemini response to extract title, chapters, and full text.
+    Translate an existing book to a target language using Gemini API.
+    Maintains the same story, just in a different language.
+    The book is split into chapters that are translated concurrently with a shared glossary.
     """
-    title = "Livro Sem Título"
-    chapters = []
-    full_text = ""
+    chapters_content = original_book.get('chapters_content')
+    if not chapters_content:
+        book = Book(full_text=original_book['full_text'])
+        book.set_chapters(original_book['chapters'])
+        chapters_content = book.get_chapters_content()
     
     try:
-        # Try to parse structured response
-        if "===TÍTULO===" in response_text:
-            parts = response_text.split("===")
-            
-            for i, part in enumerate(parts):
-                if "TÍTULO" in part and i + 1 < len(parts):
-                    title = parts[i + 1].strip()
-                elif "ÍNDICE" in part and i + 1 < len(parts):
-                    index_text = parts[i + 1].strip()
-                    # Extract chapter names
-                    for line in index_text.split('\n'):
-                        line = line.strip()
-                        if line and ('Capítulo' in line or 'capitulo' in line.lower()):
-                            chapters.append(line)
-                elif "TEXTO COMPLETO" in part and i + 1 < len(parts):
-                    full_text = parts[i + 1].strip()
-        else:
-            # Fallback: try to extract from unstructured response
-            lines = response_text.split('\n')
-            
-            # First non-empty line might be the title
-            for line in lines:
-                if line.strip():
-                    title = line.strip().replace('#', '').strip()
-                    break
-            
-            # Extract chapters from lines containing "Capítulo"
-            for line in lines:
-                if 'Capítulo' in line or 'capitulo' in line.lower():
-                    if ':' in line:
-                        chapters.append(line.strip())
-            
-            # Full text is everything
-            full_text = response_text
-        
-        # Ensure we have at least some chapters
-        if not chapters:
-            chapters = ["Capítulo 1: Início", "Capítulo 2: Desenvolvimento", "Capítulo 3: Conclusão"]
-        
-        # Ensure full_text is not empty
-        if not full_text:
-            full_text = response_text
+        with metrics.metered() as usage:
+            plan = build_translation_glossary(original_book, chapters_content, target_language)
             
+            contents = [None] * len(chapters_content)
+            # Not a with block: when a chapter fails the chapters not started yet are
+            # cancelled instead of translated and discarded
+            executor = ThreadPoolExecutor(max_workers=config.CHAPTER_WORKERS)
+            try:
+                futures = {
+                    executor.submit(contextvars.copy_context().run, translate_chapter_with_gemini, chapter, plan['chapters'][i], plan['glossary'], target_language): i
+                    for i, chapter in enumerate(chapters_content)
+                }
+                for future in as_completed(futures):
+                    contents[futures[future]] = future.result()
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
     except Exception as e:
-        print(f"Error parsing response: {e}")
-        title = "Livro Gerado"
-        chapters = ["Capítulo 1"]
-        full_text = response_text
+        raise Exception(f"Erro ao traduzir livro: {str(e)}")
     
     return {
-        'title': title,
-        'chapters': chapters,
-        'full_text': full_text
+        'title': plan['title'],
+        'chapters': plan['chapters'],
+        'full_text': '\n\n'.join(contents),
+        'chapters_content': [
+            {'title': title, 'content': content}
+            for title, content in zip(plan['chapters'], contents)
+        ],
+        'usage': usage.to_dict()
     }
 
+def translate_book_to_languages(original_book, languages, checkpoint=None):
+    """
+    Translate a book to several languages concurrently.
+    Returns a dict language -> book data, or the Exception raised for that language.
+    With a checkpoint, finished translations are saved and saved ones are reused.
+    """
+    results = {}
+    if checkpoint:
+        for language in languages:
+            saved = checkpoint.load_translation(language)
+            if saved:
+                results[language] = saved
+    
+    pending = [language for language in languages if language not in results]
+    if not pending:
+        return results
+    
+    with ThreadPoolExecutor(max_workers=min(config.TRANSLATION_WORKERS, len(pending))) as executor:
+        futures = {
+            executor.submit(translate_book_with_gemini, original_book, language): language
+            for language in pending
+        }
+        for future in as_completed(futures):
+            language = futures[future]
+            try:
+                results[language] = future.result()
+            except Exception as e:
+                results[language] = e
+                continue
+            if checkpoint:
+                checkpoint.save_translation(language, results[language])
+    
+    return results
+
 # Routes
 @app.route('/')
 def index():
@@ -270,7 +453,7 @@ def index():
 
 @app.route('/generate', methods=['POST'])
 def generate():
-    """Generate a new book using Gemini API"""
+    """Start a background job that generates a new book using Gemini API"""
     try:
         data = request.get_json()
         
@@ -296,20 +479,70 @@ def generate():
         if not languages or len(languages) == 0:
             return jsonify({'success': False, 'error': 'Por favor, selecione pelo menos um idioma.'}), 400
         
-        # Generate a book for each selected language
-        created_books = []
-        original_book_data = None
+        job = GenerationJob(id=jobs.new_job_id(), chapters_total=num_chapters)
+        job.set_params({
+            'theme': theme,
+            'style': style,
+            'num_chapters': num_chapters,
+            'num_pages': num_pages,
+            'languages': languages
+        })
+        db.session.add(job)
+        db.session.commit()
+        
+        jobs.submit_job(app, run_generation_job, job.id)
         
-        for i, language in enumerate(languages):
-            if i == 0:
-                # Generate the first book from scratch
-                book_data = generate_book_with_gemini(theme, style, num_chapters, num_pages, language)
-                original_book_data = book_data
-            else:
-                # Translate the original book to this language
-                book_data = translate_book_with_gemini(original_book_data, language)
-            
-            # Create new book record
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': f"/api/jobs/{job.id}",
+            'message': 'Geração iniciada!'
+        }), 202
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def run_generation_job(job_id):
+    """
+    Generate the books requested by a job.
+    Runs on the background executor; progress is stored on the job row.
+    """
+    job = GenerationJob.query.get(job_id)
+    if not job or job.status == 'completed':
+        return
+    
+    checkpoint = jobs.JobCheckpoint(job)
+    params = job.get_params()
+    theme = params['theme']
+    style = params['style']
+    languages = params['languages']
+    
+    job.status = 'running'
+    job.phase = 'generating'
+    db.session.commit()
+    
+    try:
+        # Generate the first book from scratch
+        original_language = languages[0]
+        original_book_data = generate_book_with_gemini(theme, style, params['num_chapters'], params['num_pages'], original_language, checkpoint=checkpoint)
+        
+        # Translate the original book to the other languages
+        results = [(original_language, original_book_data)]
+        if len(languages) > 1:
+            job.phase = 'translating'
+            db.session.commit()
+            translations = translate_book_to_languages(original_book_data, languages[1:], checkpoint=checkpoint)
+            for language in languages[1:]:
+                book_data = translations[language]
+                if isinstance(book_data, Exception):
+                    job.add_error(f"{language}: {book_data}")
+                else:
+                    results.append((language, book_data))
+        
+        # Save every book in a single transaction
+        job.phase = 'saving'
+        for language, book_data in results:
             new_book = Book(
                 title=book_data['title'],
                 theme=theme,
@@ -318,49 +551,253 @@ def generate():
                 language=language
             )
             new_book.set_chapters(book_data['chapters'])
-            new_book.word_count = new_book.calculate_word_count()
-            
-            # Save to database
+            if book_data.get('chapters_content'):
+                new_book.set_chapters_content(book_data['chapters_content'])
+            else:
+                new_book.refresh_stats()
+            new_book.add_usage(book_data.get('usage'))
             db.session.add(new_book)
-            db.session.commit()
-            
-            created_books.append({
-                'id': new_book.id,
-                'title': new_book.title,
-                'language': language
-            })
+            db.session.flush()
+            job.add_book(new_book)
         
-        # Return response
-        if len(created_books) == 1:
-            return jsonify({
-                'success': True,
-                'book_id': created_books[0]['id'],
-                'title': created_books[0]['title'],
-                'message': 'Livro gerado com sucesso!'
-            })
-        else:
-            return jsonify({
-                'success': True,
-                'books': created_books,
-                'message': f'{len(created_books)} livros gerados com sucesso!'
-            })
+        # The books are saved, the checkpoints are no longer needed
+        checkpoint.clear()
+        job.status = 'completed'
+        job.phase = 'done'
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job.add_error(str(e))
+        job.status = 'failed'
+    
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """Get the status of a generation job"""
+    job = GenerationJob.query.get_or_404(job_id)
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+@app.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Restart a failed generation job from its last checkpoint"""
+    try:
+        job = GenerationJob.query.get_or_404(job_id)
         
+        if job.status != 'failed':
+            return jsonify({'success': False, 'error': 'Só é possível retomar gerações que falharam.'}), 400
+        
+        job.status = 'queued'
+        job.phase = 'queued'
+        job.finished_at = None
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+        
+        jobs.submit_job(app, run_generation_job, job.id)
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict(),
+            'message': 'Geração retomada!'
+        })
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def sse_event(event, data):
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_outline_events(prompt, num_chapters, chapter_word, usage=None):
+    """
+    Stream the outline call and yield ('title' | 'index', data) as soon as each part is parsed.
+    Finally yields ('outline', outline) with the fully parsed outline.
+    """
+    parser = book_parser.BookStreamParser(CHAPTER_WORDS)
+    received = False
+    title_sent = False
+    
+    def visible(events):
+        for event, data in events:
+            if event == 'title' or (event == 'index' and data['index'] < num_chapters):
+                yield event, data
+    
+    for text in llm.stream(prompt, route='generate_stream', meter=usage):
+        received = received or bool(text)
+        for event, data in visible(parser.feed(text)):
+            title_sent = title_sent or event == 'title'
+            yield event, data
+    
+    if not received:
+        raise Exception("Resposta vazia do Gemini")
+    
+    for event, data in visible(parser.close()):
+        title_sent = title_sent or event == 'title'
+        yield event, data
+    
+    outline = outline_from_parser(parser, num_chapters, chapter_word)
+    if not title_sent:
+        yield 'title', {'title': outline['title']}
+    yield 'outline', outline
+
+def stream_chapter_to_queue(events, outline, index, theme, style, words_per_chapter, language, usage=None, cancelled=None):
+    """
+    Stream one chapter and push its text deltas onto the events queue.
+    Stops between chunks once cancelled (a threading.Event) is set.
+    """
+    chapter_title = outline['chapters'][index]
+    prompt = build_chapter_prompt(outline, index, theme, style, words_per_chapter, language)
+    
+    try:
+        parts = []
+        stream = llm.stream(prompt, route='generate_stream', meter=usage)
+        for text in stream:
+            if cancelled is not None and cancelled.is_set():
+                stream.close()
+                return
+            if text:
+                parts.append(text)
+                events.put(('chapter', {'index': index, 'text': text}))
+        
+        content = ''.join(parts).strip()
+        if not content:
+            raise Exception(f"Resposta vazia do Gemini para {chapter_title}")
+        if not content.startswith(chapter_title):
+            content = f"{chapter_title}\n\n{content}"
+        events.put(('chapter_done', {'index': index, 'title': chapter_title, 'content': content}))
+    except Exception as e:
+        events.put(('chapter_error', {'index': index, 'error': str(e)}))
+
+@app.route('/generate/stream')
+def generate_stream():
+    """Generate a new book and stream it to the browser as Server-Sent Events"""
+    theme = request.args.get('theme', '').strip()
+    style = request.args.get('style', 'romance').strip()
+    language = request.args.get('language', 'pt-pt').strip()
+    try:
+        num_chapters = int(request.args.get('num_chapters', 5))
+        num_pages = int(request.args.get('num_pages', 50))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parâmetros inválidos.'}), 400
+    
+    if not theme:
+        return jsonify({'success': False, 'error': 'Por favor, insira um tema para o livro.'}), 400
+    
+    if num_chapters < 1 or num_chapters > 20:
+        return jsonify({'success': False, 'error': 'Número de capítulos deve ser entre 1 e 20.'}), 400
+    
+    if num_pages < 5 or num_pages > 300:
+        return jsonify({'success': False, 'error': 'Número de páginas deve ser entre 5 e 300.'}), 400
+    
+    chapter_word = LANGUAGE_CONFIG.get(language, LANGUAGE_CONFIG['pt-pt'])['chapter']
+    words_per_chapter = (num_pages * 250) // num_chapters
+    
+    def events():
+        try:
+            outline = None
+            usage = metrics.UsageMeter()
+            prompt = build_outline_prompt(theme, style, num_chapters, num_pages, language)
+            for event, data in stream_outline_events(prompt, num_chapters, chapter_word, usage):
+                if event == 'outline':
+                    outline = data
+                else:
+                    yield sse_event(event, data)
+            
+            yield sse_event('outline', {'chapters': outline['chapters'], 'synopses': outline['synopses']})
+            
+            # Chapters stream concurrently; their deltas are interleaved through a queue
+            chapter_events = queue.Queue()
+            contents = [None] * num_chapters
+            pending = num_chapters
+            # Not a with block: on an error or a client disconnect the other chapters
+            # are stopped instead of waited for
+            cancelled = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=config.CHAPTER_WORKERS)
+            try:
+                for i in range(num_chapters):
+                    executor.submit(
+                        stream_chapter_to_queue, chapter_events, outline, i, theme, style,
+                        words_per_chapter, language, usage, cancelled
+                    )
+                
+                while pending:
+                    event, data = chapter_events.get()
+                    if event == 'chapter_error':
+                        raise Exception(data['error'])
+                    if event == 'chapter_done':
+                        contents[data['index']] = data['content']
+                        pending -= 1
+                        yield sse_event(event, {'index': data['index'], 'title': data['title']})
+                    else:
+                        yield sse_event(event, data)
+            finally:
+                cancelled.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+            
+            # Save the book once the stream is complete
+            new_book = Book(
+                title=outline['title'],
+                theme=theme,
+                style=style,
+                full_text='\n\n'.join(contents),
+                language=language
+            )
+            new_book.set_chapters(outline['chapters'])
+            new_book.set_chapters_content([
+                {'title': title, 'content': content}
+                for title, content in zip(outline['chapters'], contents)
+            ])
+            new_book.add_usage(usage.to_dict())
+            db.session.add(new_book)
+            db.session.commit()
+            
+            yield sse_event('done', {'book_id': new_book.id, 'title': new_book.title})
+        except Exception as e:
+            db.session.rollback()
+            yield sse_event('error', {'error': f"Erro ao gerar livro: {str(e)}"})
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @app.route('/books')
 def list_books():
     """List all generated books"""
     return render_template('list_books.html')
 
+def requested_fields(default=None):
+    """Book fields asked for with ?fields=title,word_count,... (default when absent)"""
+    fields = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    return fields or default
+
 @app.route('/api/books')
 def api_books():
-    """API endpoint to get all books"""
-    books = Book.query.order_by(Book.created_at.desc()).all()
+    """
+    API endpoint to list the books, newest first, one page at a time (?limit=, ?cursor=
+    with the next_cursor of the previous page). Returns the Book.SUMMARY_FIELDS unless ?fields= is given.
+    """
+    fields = requested_fields(Book.SUMMARY_FIELDS)
+    try:
+        books, next_cursor = pagination.paginate(
+            Book.query.options(*Book.load_options(fields)), Book,
+            request.args.get('cursor'), pagination.page_limit(request.args.get('limit'))
+        )
+    except pagination.InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     return jsonify({
         'success': True,
-        'books': [book.to_dict() for book in books]
+        'books': [book.to_dict(fields) for book in books],
+        'next_cursor': next_cursor
     })
 
 @app.route('/book/<int:book_id>')
@@ -371,11 +808,12 @@ def view_book(book_id):
 
 @app.route('/api/book/<int:book_id>')
 def api_book(book_id):
-    """API endpoint to get a specific book"""
-    book = Book.query.get_or_404(book_id)
+    """API endpoint to get a specific book (every field unless ?fields= is given)"""
+    fields = requested_fields()
+    book = Book.query.options(*Book.load_options(fields)).filter_by(id=book_id).first_or_404()
     return jsonify({
         'success': True,
-        'book': book.to_dict()
+        'book': book.to_dict(fields)
     })
 
 @app.route('/download/<int:book_id>')
@@ -577,14 +1015,15 @@ def update_tags(book_id):
 
 @app.route('/api/books/search')
 def search_books():
-    """Search books by title, theme, or tags"""
-    query = request.args.get('q', '').strip().lower()
+    """Search books by title, theme, or tags; paged like /api/books"""
+    query = request.args.get('q', '').strip()
     tag = request.args.get('tag', '').strip()
     favorites_only = request.args.get('favorites', '').lower() == 'true'
     style = request.args.get('style', '').strip()
     language = request.args.get('language', '').strip()
+    fields = requested_fields(Book.SUMMARY_FIELDS)
     
-    books = Book.query
+    books = Book.query.options(*Book.load_options(fields))
     
     if favorites_only:
         books = books.filter(Book.is_favorite == True)
@@ -595,34 +1034,32 @@ def search_books():
     if language:
         books = books.filter(Book.language == language)
     
-    books = books.order_by(Book.created_at.desc()).all()
+    # Search in title and theme (casefolded copies, so accents and non-ASCII case match)
+    if query:
+        books = books.filter(Book.search_text.contains(query.casefold(), autoescape=True))
     
-    # Filter by query and tags in Python (SQLite doesn't support good JSON queries)
-    results = []
-    for book in books:
-        # Search in title and theme
-        if query:
-            if query not in book.title.lower() and query not in book.theme.lower():
-                continue
-        
-        # Filter by tag
-        if tag:
-            book_tags = [t.lower() for t in book.get_tags()]
-            if tag.lower() not in book_tags:
-                continue
-        
-        results.append(book.to_dict())
+    # Filter by tag: the casefolded tag as a JSON string inside the tags array
+    if tag:
+        books = books.filter(Book.search_tags.contains(json.dumps(tag.casefold(), ensure_ascii=False), autoescape=True))
+    
+    try:
+        books, next_cursor = pagination.paginate(
+            books, Book, request.args.get('cursor'), pagination.page_limit(request.args.get('limit'))
+        )
+    except pagination.InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
     return jsonify({
         'success': True,
-        'books': results,
-        'count': len(results)
+        'books': [book.to_dict(fields) for book in books],
+        'count': len(books),  # Books on this page, not all the matches
+        'next_cursor': next_cursor
     })
 
 @app.route('/api/books/tags')
 def get_all_tags():
     """Get all unique tags used across all books"""
-    books = Book.query.all()
+    books = Book.query.options(*Book.load_options(fields=(), columns=('tags',))).all()
     all_tags = set()
     
     for book in books:
@@ -660,12 +1097,11 @@ def duplicate_book(book_id):
             title=f"{original.title} (Cópia)",
             theme=original.theme,
             style=original.style,
-            full_text=original.full_text,
             language=original.language,
-            word_count=original.word_count,
             parent_id=original.id
         )
         new_book.set_chapters(original.get_chapters())
+        new_book.set_chapters_content(original.get_chapters_content())
         new_book.set_tags(original.get_tags())
         
         db.session.add(new_book)
@@ -725,25 +1161,29 @@ def view_shared_book(share_token):
     book = Book.query.filter_by(share_token=share_token).first_or_404()
     return render_template('view_book.html', book=book, is_shared=True)
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """LLM telemetry (latency, tokens, retries, errors, cache hits) in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/stats/global')
 def get_global_stats():
     """Get global statistics"""
-    books = Book.query.all()
-    
-    total_books = len(books)
-    total_words = sum(b.word_count or b.calculate_word_count() for b in books)
-    total_chapters = sum(len(b.get_chapters()) for b in books)
+    total_books, total_words, total_chapters, favorites_count = db.session.query(
+        db.func.count(Book.id),
+        db.func.coalesce(db.func.sum(Book.word_count), 0),
+        db.func.coalesce(db.func.sum(Book.chapter_count), 0),
+        db.func.coalesce(db.func.sum(db.case((Book.is_favorite.is_(True), 1), else_=0)), 0)
+    ).one()
     
     # Count by style
-    styles = {}
-    for book in books:
-        styles[book.style] = styles.get(book.style, 0) + 1
+    styles = dict(db.session.query(Book.style, db.func.count(Book.id)).group_by(Book.style).all())
     
     # Count by language
     languages = {}
-    for book in books:
-        lang = book.language or 'pt-pt'
-        languages[lang] = languages.get(lang, 0) + 1
+    for lang, count in db.session.query(Book.language, db.func.count(Book.id)).group_by(Book.language):
+        lang = lang or 'pt-pt'
+        languages[lang] = languages.get(lang, 0) + count
     
     return jsonify({
         'success': True,
@@ -755,7 +1195,7 @@ def get_global_stats():
             'avg_words_per_book': round(total_words / total_books) if total_books else 0,
             'by_style': styles,
             'by_language': languages,
-            'favorites_count': sum(1 for b in books if b.is_favorite)
+            'favorites_count': favorites_count
         }
     })
 
@@ -778,23 +1218,25 @@ def get_dashboard_data():
     from collections import defaultdict
     from datetime import timedelta
     
-    books = Book.query.order_by(Book.created_at.desc()).all()
+    fields = requested_fields(Book.SUMMARY_FIELDS)
     
-    total_books = len(books)
-    total_words = sum(b.word_count or b.calculate_word_count() for b in books)
-    total_chapters = sum(len(b.get_chapters()) for b in books)
-    total_reading_time = sum(b.get_reading_time() for b in books)
+    # Totals from the stored statistics
+    total_books, total_words, total_chapters, total_reading_time, favorites_count, total_series = db.session.query(
+        db.func.count(Book.id),
+        db.func.coalesce(db.func.sum(Book.word_count), 0),
+        db.func.coalesce(db.func.sum(Book.chapter_count), 0),
+        db.func.coalesce(db.func.sum(Book.reading_time), 0),
+        db.func.coalesce(db.func.sum(db.case((Book.is_favorite.is_(True), 1), else_=0)), 0),
+        db.func.count(db.distinct(Book.parent_id))  # Series: books with copies
+    ).one()
     
     # Count by style
-    styles = defaultdict(int)
-    for book in books:
-        styles[book.style] += 1
+    styles = dict(db.session.query(Book.style, db.func.count(Book.id)).group_by(Book.style).all())
     
     # Count by language
     languages = defaultdict(int)
-    for book in books:
-        lang = book.language or 'pt-pt'
-        languages[lang] += 1
+    for lang, count in db.session.query(Book.language, db.func.count(Book.id)).group_by(Book.language):
+        languages[lang or 'pt-pt'] += count
     
     # Activity by day (last 30 days)
     activity = defaultdict(int)
@@ -803,32 +1245,33 @@ def get_dashboard_data():
         day = today - timedelta(days=i)
         activity[day.strftime('%d/%m')] = 0
     
-    for book in books:
-        if book.created_at:
-            day_key = book.created_at.strftime('%d/%m')
-            if day_key in activity:
-                activity[day_key] += 1
+    since = datetime.combine(today - timedelta(days=29), datetime.min.time())
+    created_day = db.func.date(Book.created_at)
+    for day, count in db.session.query(created_day, db.func.count(Book.id)).filter(
+        Book.created_at >= since
+    ).group_by(created_day):
+        day_key = datetime.strptime(str(day)[:10], '%Y-%m-%d').strftime('%d/%m')
+        if day_key in activity:
+            activity[day_key] += count
     
     # Reverse to show oldest first
     activity = dict(reversed(list(activity.items())))
     
-    # All tags with counts
+    # All tags with counts (only the tags column is read)
     all_tags = defaultdict(int)
-    for book in books:
-        for tag in book.get_tags():
-            all_tags[tag] += 1
+    for (tags,) in db.session.query(Book.tags).filter(Book.tags.isnot(None), Book.tags != '[]'):
+        try:
+            for tag in json.loads(tags):
+                all_tags[tag] += 1
+        except ValueError:
+            continue
     
     top_tags = sorted([{'name': k, 'count': v} for k, v in all_tags.items()], 
                       key=lambda x: x['count'], reverse=True)
     
-    # Count series (books with parent_id or that are parents)
-    series_ids = set()
-    for book in books:
-        if book.parent_id:
-            series_ids.add(book.parent_id)
-    
     # Recent books for display
-    recent_books = [b.to_dict() for b in books[:10]]
+    recent_books, _ = pagination.paginate(Book.query.options(*Book.load_options(fields)), Book, limit=10)
+    recent_books = [b.to_dict(fields) for b in recent_books]
     
     return jsonify({
         'success': True,
@@ -839,8 +1282,8 @@ def get_dashboard_data():
             'total_pages': round(total_words / 250) if total_words else 0,
             'avg_words_per_book': round(total_words / total_books) if total_books else 0,
             'total_reading_time': total_reading_time,
-            'favorites_count': sum(1 for b in books if b.is_favorite),
-            'total_series': len(series_ids),
+            'favorites_count': favorites_count,
+            'total_series': total_series,
             'unique_tags': len(all_tags),
             'by_style': dict(styles),
             'by_language': dict(languages),
@@ -927,7 +1370,10 @@ def get_book_chapters(book_id):
 def update_chapter(book_id, chapter_index):
     """Update a specific chapter's content"""
     try:
-        book = Book.query.get_or_404(book_id)
+        # Only the book columns the edit touches; the chapter row is read on its own
+        book = Book.query.options(
+            *Book.load_options(fields=(), columns=Book.CHAPTER_EDIT_COLUMNS)
+        ).filter_by(id=book_id).first_or_404()
         data = request.get_json()
         
         new_content = data.get('content')
@@ -939,12 +1385,13 @@ def update_chapter(book_id, chapter_index):
         if new_title:
             book.update_chapter_title(chapter_index, new_title)
         
+        word_count = book.word_count
         db.session.commit()
         
         return jsonify({
             'success': True,
             'message': 'Capítulo atualizado!',
-            'word_count': book.word_count
+            'word_count': word_count
         })
     except Exception as e:
         db.session.rollback()
@@ -995,12 +1442,12 @@ Conteúdo original para referência:
 
 Escreve APENAS o conteúdo do capítulo, começando com o título."""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        response = llm.generate(prompt, route='regenerate_chapter')
         new_content = response.text.strip()
         
         # Update the chapter
         book.update_chapter(chapter_index, new_content)
+        book.add_usage(response.usage)
         db.session.commit()
         
         return jsonify({
@@ -1164,7 +1611,6 @@ def update_book_template(book_id):
 @app.route('/api/ai/suggest-themes', methods=['POST'])
 def suggest_themes():
     """Generate theme suggestions based on style and preferences"""
-    response_text = ""
     try:
         data = request.get_json() or {}
         style = data.get('style', 'romance')
@@ -1187,31 +1633,17 @@ Responde APENAS em formato JSON válido, como array:
 
 Sê criativo e original. Evita clichés. Os temas devem ser adequados para um livro completo."""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        response_text = response.text
-        
-        # Parse JSON from response
-        text = response_text.strip()
-        # Remove markdown code blocks if present
-        if text.startswith('```'):
-            text = text.split('```')[1]
-            if text.startswith('json'):
-                text = text[4:]
-        text = text.strip()
-        
-        themes = json.loads(text)
+        themes, _ = llm_json.generate(prompt, llm_json.THEMES, route='suggest_themes', count=count)
         
         return jsonify({
             'success': True,
             'themes': themes
         })
-    except json.JSONDecodeError as e:
-        print(f"JSON Decode Error: {e}")
-        print(f"Response text: {response_text[:500]}")
+    except llm_json.JSONExtractionError as e:
+        print(f"JSON Extraction Error: {e}")
         return jsonify({
             'success': True,
-            'themes': [{'title': 'Tema sugerido', 'description': response_text[:200] if response_text else 'Erro ao processar resposta', 'appeal': ''}]
+            'themes': [{'title': 'Tema sugerido', 'description': 'Erro ao processar resposta', 'appeal': ''}]
         })
     except Exception as e:
         print(f"Error in suggest_themes: {e}")
@@ -1270,26 +1702,16 @@ Responde APENAS em formato JSON válido:
 
 Cada variação deve ser significativamente diferente das outras."""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        
-        text = response.text.strip()
-        if text.startswith('```'):
-            text = text.split('```')[1]
-            if text.startswith('json'):
-                text = text[4:]
-        text = text.strip()
-        
-        plots = json.loads(text)
+        plots, _ = llm_json.generate(prompt, llm_json.PLOTS, route='generate_plot_variations', count=count)
         
         return jsonify({
             'success': True,
             'plots': plots
         })
-    except json.JSONDecodeError:
+    except llm_json.JSONExtractionError:
         return jsonify({
             'success': True,
-            'plots': [{'title': 'Erro', 'synopsis': response.text[:300], 'tone': '', 'conflicts': [], 'chapters': []}]
+            'plots': [{'title': 'Erro', 'synopsis': 'Erro ao processar resposta', 'tone': '', 'conflicts': [], 'chapters': []}]
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1354,34 +1776,24 @@ Responde APENAS em formato JSON válido:
   "summary": "Resumo geral da análise em 2-3 frases"
 }}"""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        
-        text_response = response.text.strip()
-        if text_response.startswith('```'):
-            text_response = text_response.split('```')[1]
-            if text_response.startswith('json'):
-                text_response = text_response[4:]
-        text_response = text_response.strip()
-        
-        analysis = json.loads(text_response)
+        analysis, usage = llm_json.generate(prompt, llm_json.ANALYSIS, route='analyze_text')
         
         # Save analysis if book_id provided
         if book_id:
             book = Book.query.get(book_id)
             if book:
                 book.set_ai_analysis(analysis)
+                book.add_usage(usage)
                 db.session.commit()
         
         return jsonify({
             'success': True,
             'analysis': analysis
         })
-    except json.JSONDecodeError:
+    except llm_json.JSONExtractionError:
         return jsonify({
             'success': False,
-            'error': 'Erro ao processar análise',
-            'raw': response.text[:500] if 'response' in dir() else ''
+            'error': 'Erro ao processar análise'
         }), 500
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1429,17 +1841,7 @@ Responde APENAS em formato JSON válido:
 
 Cria personagens diversos, complexos e memoráveis."""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        
-        text = response.text.strip()
-        if text.startswith('```'):
-            text = text.split('```')[1]
-            if text.startswith('json'):
-                text = text[4:]
-        text = text.strip()
-        
-        characters = json.loads(text)
+        characters, _ = llm_json.generate(prompt, llm_json.CHARACTERS, route='generate_characters', count=count)
         
         return jsonify({
             'success': True,
@@ -1484,17 +1886,7 @@ Responde APENAS em formato JSON válido:
 
 Sê criativo e consistente com o género."""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        
-        text = response.text.strip()
-        if text.startswith('```'):
-            text = text.split('```')[1]
-            if text.startswith('json'):
-                text = text[4:]
-        text = text.strip()
-        
-        world = json.loads(text)
+        world, _ = llm_json.generate(prompt, llm_json.WORLD, route='generate_world', cache_ttl=config.LLM_CACHE_TTL)
         
         return jsonify({
             'success': True,
@@ -1622,11 +2014,12 @@ def manage_single_series(series_id):
     series = Series.query.get_or_404(series_id)
     
     if request.method == 'GET':
-        books = Book.query.filter_by(series_id=series_id).order_by(Book.series_order).all()
+        fields = requested_fields(Book.SUMMARY_FIELDS)
+        books = Book.query.options(*Book.load_options(fields)).filter_by(series_id=series_id).order_by(Book.series_order).all()
         return jsonify({
             'success': True,
             'series': series.to_dict(),
-            'books': [b.to_dict() for b in books]
+            'books': [b.to_dict(fields) for b in books]
         })
     
     if request.method == 'DELETE':
@@ -1701,15 +2094,22 @@ def manage_synopsis(book_id):
         })
     
     try:
-        # Generate synopsis with AI
+        # The whole story from the summary tree, plus the opening for the voice
+        tree, usage = summaries.get_summary_tree(book)
+        summary_context = summaries.format_summary_context(tree, opening_chapters=config.SUMMARY_CONTEXT_CHAPTERS)
+        opening = summaries.head_words(book.full_text, config.SYNOPSIS_OPENING_WORDS)
+        book.add_usage(usage)  # After the text is read, so the update isn't flushed before the LLM call
+
         prompt = f"""Cria uma sinopse envolvente para este livro.
 
 Título: {book.title}
 Tema: {book.theme}
 Estilo: {book.style}
 
-Primeiras 2000 palavras do livro:
-{book.full_text[:8000]}
+{summary_context}
+
+Início do livro:
+{opening}
 
 Escreve uma sinopse de 2-3 parágrafos que:
 1. Apresente o contexto/cenário
@@ -1718,11 +2118,11 @@ Escreve uma sinopse de 2-3 parágrafos que:
 
 Responde APENAS com a sinopse, sem títulos ou explicações."""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        response = llm.generate(prompt, route='manage_synopsis')
         synopsis = response.text.strip()
         
         book.synopsis = synopsis
+        book.add_usage(response.usage)
         db.session.commit()
         
         return jsonify({
@@ -1736,33 +2136,20 @@ Responde APENAS com a sinopse, sem títulos ou explicações."""
 
 @app.route('/api/book/<int:book_id>/chapter-summaries', methods=['POST'])
 def generate_chapter_summaries(book_id):
-    """Generate summaries for each chapter"""
+    """Get the summary of each chapter, generating only the missing or outdated ones"""
     try:
         book = Book.query.get_or_404(book_id)
-        chapters = book.get_chapters_content()
-        
-        summaries = []
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        
-        for i, chapter in enumerate(chapters):
-            prompt = f"""Resume este capítulo em 2-3 frases concisas.
-
-Capítulo: {chapter.get('title', f'Capítulo {i+1}')}
-Conteúdo: {chapter.get('content', '')[:3000]}
-
-Responde APENAS com o resumo, sem títulos."""
-
-            response = model.generate_content(prompt)
-            summaries.append({
-                'title': chapter.get('title', f'Capítulo {i+1}'),
-                'summary': response.text.strip()
-            })
+        tree, usage = summaries.get_summary_tree(book)
+        book.add_usage(usage)
+        db.session.commit()
         
         return jsonify({
             'success': True,
-            'summaries': summaries
+            'summaries': tree['chapters'],
+            'book_summary': tree['book']
         })
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # ==================== CHAT WITH BOOK ====================
@@ -1787,8 +2174,21 @@ def chat_with_book(book_id):
                 role = "Utilizador" if msg.get('role') == 'user' else "Assistente"
                 history_text += f"{role}: {msg.get('content', '')}\n"
         
-        # Get book content (limit to avoid token limits)
-        book_content = book.full_text[:30000]  # ~7500 words
+        # Retrieve the passages relevant to the question; the previous question helps with follow-ups
+        previous_questions = [
+            msg.get('content', '') for msg in chat_history[-6:]
+            if msg.get('role') == 'user' and msg.get('content') != question
+        ]
+        index = passages.get_book_index(book)
+        selected = index.select(
+            ' '.join([question] + previous_questions[-1:]),
+            k=config.CHAT_PASSAGES,
+            max_words=config.CHAT_CONTEXT_WORDS
+        )
+        sources = [index.passages[passage_id] for passage_id in selected]
+        book_content = "\n\n".join(
+            f"[{n}] {source['title']}\n{source['text']}" for n, source in enumerate(sources, 1)
+        )
         chapters = book.get_chapters()
         characters = book.get_characters()
         world = book.get_world_setting()
@@ -1797,7 +2197,7 @@ def chat_with_book(book_id):
         context_parts = [f"Título: {book.title}", f"Tema: {book.theme}", f"Estilo: {book.style}"]
         
         if chapters:
-            context_parts.append(f"Capítulos: {', '.join(chapters[:10])}")
+            context_parts.append(f"Capítulos: {', '.join(chapters)}")
         
         if characters:
             char_names = [c.get('name', '') for c in characters[:5]]
@@ -1809,6 +2209,9 @@ def chat_with_book(book_id):
             if world.get('time_period'):
                 context_parts.append(f"Época: {world.get('time_period')}")
         
+        if book.synopsis:
+            context_parts.append(f"Sinopse: {book.synopsis}")
+        
         book_context = "\n".join(context_parts)
         
         prompt = f"""És um assistente especializado neste livro. Responde às perguntas do utilizador APENAS com base no conteúdo do livro fornecido.
@@ -1816,14 +2219,14 @@ def chat_with_book(book_id):
 === INFORMAÇÕES DO LIVRO ===
 {book_context}
 
-=== CONTEÚDO DO LIVRO ===
+=== EXCERTOS DO LIVRO RELEVANTES PARA A PERGUNTA ===
 {book_content}
 
 === INSTRUÇÕES ===
-1. Responde APENAS com base no conteúdo do livro acima
-2. Se a informação não estiver no livro, diz "Essa informação não está presente no livro"
+1. Responde APENAS com base nas informações e excertos acima
+2. Se a informação não estiver nos excertos, diz "Essa informação não está presente no livro"
 3. Sê conciso mas informativo
-4. Podes fazer citações relevantes do texto
+4. Indica a fonte de cada afirmação com o número do excerto entre parênteses retos, por exemplo [2]
 5. Responde sempre em português
 {history_text}
 === PERGUNTA DO UTILIZADOR ===
@@ -1831,14 +2234,28 @@ def chat_with_book(book_id):
 
 === RESPOSTA ==="""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        response = llm.generate(prompt, route='chat_with_book')
         answer = response.text.strip()
+        book.add_usage(response.usage)
+        db.session.commit()
+        
+        # Citations are the excerpts the answer refers to, e.g. [2]
+        cited = sorted({int(n) for n in re.findall(r'\[(\d+)\]', answer) if 1 <= int(n) <= len(sources)})
+        citations = [
+            {
+                'ref': n,
+                'chapter_index': sources[n - 1]['chapter'],
+                'chapter_title': sources[n - 1]['title'],
+                'excerpt': sources[n - 1]['text'][:200]
+            }
+            for n in cited
+        ]
         
         return jsonify({
             'success': True,
             'answer': answer,
-            'question': question
+            'question': question,
+            'citations': citations
         })
         
     except Exception as e:
@@ -1858,6 +2275,9 @@ def book_explorer_page():
     """Book Explorer page - analyze any existing book"""
     return render_template('book_explorer.html')
 
+# Explorer aspects that are conversations or creative writing and must not be cached
+CREATIVE_EXPLORER_ASPECTS = {'chat', 'interview', 'continue', 'alternate', 'playlist', 'trailer', 'cover', 'casting'}
+
 @app.route('/api/explore-book', methods=['POST'])
 def explore_book():
     """Explore and analyze any existing book using AI"""
@@ -2064,16 +2484,8 @@ O campo "correct" é o índice (0-3) da opção correta.
 Cria perguntas variadas sobre enredo, personagens, temas e detalhes.
 Responde APENAS com o JSON, sem texto adicional."""
 
-            model = genai.GenerativeModel("gemini-2.0-flash")
-            response = model.generate_content(prompt)
-            text = response.text.strip()
-            
-            if text.startswith('```'):
-                text = text.split('\n', 1)[1].rsplit('```', 1)[0]
-            
-            import json
-            questions = json.loads(text)
-            return jsonify({'success': True, 'questions': questions})
+            questions, _ = llm_json.generate(prompt, llm_json.QUIZ_QUESTIONS, route='explore_book', count=10)
+            return jsonify({'success': True, 'questions': quiz.validate_questions(questions)})
 
         elif aspect == 'continue':
             # Continue the story
@@ -2208,8 +2620,9 @@ Responde em português."""
         else:
             prompt = aspect_prompts.get(aspect, aspect_prompts['info'])
         
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        # Reference aspects only depend on the book, so their answers are cached
+        cache_ttl = config.LLM_CACHE_TTL if aspect not in CREATIVE_EXPLORER_ASPECTS else None
+        response = llm.generate(prompt, route='explore_book', cache_ttl=cache_ttl)
         content = response.text.strip()
         
         result = {'success': True, 'content': content}
@@ -2256,8 +2669,13 @@ def interview_character(book_id):
                 char_info = f"\nInformações do personagem:\n- Papel: {char.get('role', 'N/A')}\n- Personalidade: {char.get('personality', 'N/A')}\n- Background: {char.get('background', 'N/A')}"
                 break
         
-        # Get book excerpt for context
-        book_excerpt = book.full_text[:15000] if book.full_text else ""
+        # Ground the answer in the character's own scenes; fall back to the passages closest to the question
+        scenes = book.get_character_scenes(character_name, max_words=config.INTERVIEW_CONTEXT_WORDS)
+        if not scenes:
+            index = passages.get_book_index(book)
+            selected = index.select(f"{character_name} {message}", k=config.CHAT_PASSAGES, max_words=config.INTERVIEW_CONTEXT_WORDS)
+            scenes = [index.passages[passage_id] for passage_id in selected]
+        book_excerpt = "\n\n".join(f"({scene['title']})\n{scene['text']}" for scene in scenes)
         
         # Build conversation history
         history_text = ""
@@ -2274,8 +2692,8 @@ Responde às perguntas do entrevistador COMO SE FOSSES esse personagem.
 {book_context}
 {char_info}
 
-=== EXCERTO DO LIVRO ===
-{book_excerpt[:10000]}
+=== CENAS DO LIVRO COM {character_name.upper()} ===
+{book_excerpt}
 
 === INSTRUÇÕES ===
 1. Responde SEMPRE na primeira pessoa, como se fosses {character_name}
@@ -2292,8 +2710,9 @@ Responde às perguntas do entrevistador COMO SE FOSSES esse personagem.
 
 === RESPOSTA DE {character_name.upper()} ==="""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        response = llm.generate(prompt, route='interview_character')
+        book.add_usage(response.usage)
+        db.session.commit()  # Also saves the mention index if it was brought up to date
         
         return jsonify({
             'success': True,
@@ -2330,16 +2749,12 @@ Lista os 5-8 personagens mais importantes no formato JSON:
 
 Responde APENAS com o JSON, sem texto adicional."""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        
-        import json
-        text = response.text.strip()
-        # Clean up response
-        if text.startswith('```'):
-            text = text.split('\n', 1)[1].rsplit('```', 1)[0]
+        char_list, usage = llm_json.generate(
+            prompt, llm_json.CHARACTER_LIST, route='get_book_characters_list', cache_ttl=config.LLM_CACHE_TTL
+        )
+        book.add_usage(usage)
+        db.session.commit()
         
-        char_list = json.loads(text)
         return jsonify({'success': True, 'characters': char_list})
         
     except Exception as e:
@@ -2357,8 +2772,13 @@ def continue_story(book_id):
         continuation_type = data.get('type', 'chapter')  # chapter, epilogue, sequel
         direction = data.get('direction', '')  # Optional direction for the story
         
-        # Get the last part of the book
-        last_text = book.full_text[-10000:] if book.full_text else ""
+        # The story so far from the summary tree, plus the last pages in full
+        tree, usage = summaries.get_summary_tree(book)
+        summary_context = summaries.format_summary_context(tree, recent_chapters=config.SUMMARY_CONTEXT_CHAPTERS)
+        last_text = summaries.tail_words(book.full_text, config.CONTINUE_RECENT_WORDS)
+        # After the text is read: loading the chapters would flush the usage update and
+        # keep the database locked for the whole generation below
+        book.add_usage(usage)
         
         # Get characters and world info
         characters = book.get_characters()
@@ -2398,6 +2818,9 @@ Estilo: {book.style}
 {char_info}
 {world_info}
 
+=== A HISTÓRIA ATÉ AGORA ===
+{summary_context}
+
 === ÚLTIMAS PÁGINAS DO LIVRO ===
 {last_text}
 
@@ -2415,8 +2838,9 @@ Estilo: {book.style}
 
 === CONTINUAÇÃO ==="""
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        response = llm.generate(prompt, route='continue_story')
+        book.add_usage(response.usage)
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -2425,6 +2849,7 @@ Estilo: {book.style}
         })
         
     except Exception as e:
+        db.session.rollback()
         print(f"Continue story error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2436,60 +2861,54 @@ def quiz_page(book_id):
     book = Book.query.get_or_404(book_id)
     return render_template('book_quiz.html', book=book)
 
+@app.route('/api/book/<int:book_id>/quiz/prepare', methods=['POST'])
+def prepare_quiz(book_id):
+    """
+    Start filling the question bank in the background if it is running low, so the
+    questions are ready by the time the quiz starts. Called by the quiz page; a POST,
+    so crawlers and prefetching never start paid generation.
+    """
+    try:
+        book = Book.query.get_or_404(book_id)
+        difficulty = (request.get_json(silent=True) or {}).get('difficulty', 'medium')
+        if difficulty not in quiz.DIFFICULTIES:
+            difficulty = 'medium'
+        
+        by_chapter = quiz.current_questions(book, difficulty)
+        db.session.commit()
+        filling = quiz.bank_is_low(by_chapter, len(book.get_chapters_content()))
+        if filling:
+            quiz.fill_bank_in_background(app, book.id, difficulty)
+        
+        return jsonify({'success': True, 'filling': filling})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/book/<int:book_id>/quiz', methods=['POST'])
 def generate_quiz(book_id):
-    """Generate a quiz about the book"""
+    """Get a quiz about the book, sampled from its question bank"""
     try:
         book = Book.query.get_or_404(book_id)
         data = request.get_json()
         difficulty = data.get('difficulty', 'medium')  # easy, medium, hard
+        if difficulty not in quiz.DIFFICULTIES:
+            difficulty = 'medium'
         num_questions = min(data.get('num_questions', 10), 20)
         
-        difficulty_prompts = {
-            'easy': 'Perguntas simples sobre factos básicos da história.',
-            'medium': 'Perguntas que requerem boa compreensão da história e personagens.',
-            'hard': 'Perguntas difíceis sobre detalhes, simbolismo e análise profunda.'
-        }
-        
-        prompt = f"""Cria um quiz sobre o livro com base no conteúdo fornecido.
-
-=== LIVRO ===
-Título: {book.title}
-Tema: {book.theme}
-Estilo: {book.style}
-
-Conteúdo:
-{book.full_text[:20000]}
-
-=== TAREFA ===
-Cria {num_questions} perguntas de escolha múltipla.
-Dificuldade: {difficulty} - {difficulty_prompts.get(difficulty, '')}
-
-=== FORMATO JSON ===
-Responde APENAS com JSON válido neste formato:
-[
-  {{
-    "question": "Pergunta aqui?",
-    "options": ["Opção A", "Opção B", "Opção C", "Opção D"],
-    "correct": 0,
-    "explanation": "Explicação da resposta correta"
-  }}
-]
-
-O campo "correct" é o índice (0-3) da opção correta.
-Responde APENAS com o JSON, sem texto adicional."""
-
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        
-        import json
-        text = response.text.strip()
+        by_chapter = quiz.current_questions(book, difficulty)
+        db.session.commit()
         
-        # Clean up JSON response
-        if text.startswith('```'):
-            text = text.split('\n', 1)[1].rsplit('```', 1)[0]
+        # Only an empty (or almost empty) bank is filled while the user waits
+        if sum(len(questions) for questions in by_chapter.values()) < num_questions:
+            quiz.fill_bank(book.id, difficulty)
+            by_chapter = quiz.current_questions(book, difficulty)
+        elif quiz.bank_is_low(by_chapter, len(book.get_chapters_content())):
+            quiz.fill_bank_in_background(app, book.id, difficulty)
         
-        questions = json.loads(text)
+        questions = [question.to_dict() for question in quiz.sample(by_chapter, num_questions)]
+        if not questions:
+            return jsonify({'success': False, 'error': 'Erro ao gerar quiz. Tente novamente.'}), 500
         
         return jsonify({
             'success': True,
@@ -2498,10 +2917,8 @@ Responde APENAS com o JSON, sem texto adicional."""
             'difficulty': difficulty
         })
         
-    except json.JSONDecodeError as e:
-        print(f"Quiz JSON error: {e}")
-        return jsonify({'success': False, 'error': 'Erro ao gerar quiz. Tente novamente.'}), 500
     except Exception as e:
+        db.session.rollback()
         print(f"Quiz error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2513,7 +2930,23 @@ with app.app_context():
         os.makedirs(db_dir)
     
     db.create_all()
+    for column in add_missing_columns(db):
+        print(f"Added column {column}")
+    for index in add_missing_indexes(db):
+        print(f"Added index {index}")
+    moved = move_text_to_chapters(db)
+    if moved:
+        print(f"Moved the text of {moved} books to the chapters table")
+    counted = fill_missing_stats(db)
+    if counted:
+        print(f"Computed the statistics of {counted} books")
+    indexed = fill_search_columns(db)
+    if indexed:
+        print(f"Filled the search columns of {indexed} books")
     print("Database tables created successfully!")
 
+# Resume generation jobs left unfinished by a worker that died
+jobs.start_monitor(app, run_generation_job)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,128 @@
+"""
+BookCreatorAI - Parser Benchmark
+Measures the throughput of utils/book_parser.py on large structured book responses:
+the ===SECTION=== responses recorded in LLM_CASSETTE_DIR, plus responses built
+with the fake backend in every language of LANGUAGE_CONFIG.
+
+    python -m benchmarks.parser
+    python -m benchmarks.parser --responses 50 --words 80000 --chunk 40
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+
+def configure_environment():
+    """Import the app against a throwaway database and the fake backend"""
+    data_dir = tempfile.mkdtemp(prefix='bookcreator-parser-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(data_dir, 'books.db')}"
+    os.environ['LLM_BACKEND'] = 'fake'
+    os.environ['LLM_CACHE_ENABLED'] = 'false'
+    os.environ['RATE_LIMIT_DB'] = os.path.join(data_dir, 'ratelimit.db')
+
+
+def recorded_responses(cassette_dir):
+    """Texts of the recorded responses that use the ===SECTION=== format"""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(cassette_dir, '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            text = json.load(f).get('text', '')
+        if '===' in text:
+            texts.append(text)
+    return texts
+
+
+def generated_response(app, llm_backends, language, index, words):
+    """A full book response (title, index, synopses and text) in one language"""
+    num_chapters = 10 + index % 11
+    words_per_chapter = max(words // num_chapters, 1)
+    prompt = app.build_outline_prompt(f'tema {index}', 'romance', num_chapters, words // 250, language)
+    outline_text = llm_backends.fake_text(prompt)
+    outline = app.parse_book_outline(outline_text, num_chapters, app.LANGUAGE_CONFIG[language]['chapter'])
+
+    chapters = []
+    for i in range(num_chapters):
+        prompt = app.build_chapter_prompt(outline, i, f'tema {index}', 'romance', words_per_chapter, language)
+        text = llm_backends.fake_text(prompt)
+        # Break the prose into paragraphs, as real chapters are
+        sentences = text.split('. ')
+        paragraphs = ['. '.join(sentences[j:j + 6]) for j in range(0, len(sentences), 6)]
+        chapters.append('\n\n'.join(paragraphs))
+
+    return f"{outline_text.rstrip()}\n\n===TEXTO COMPLETO===\n" + '\n\n'.join(chapters) + '\n'
+
+
+def measure(texts, chapter_words, chunk_size, parse_module):
+    """Parse every text whole and in chunk_size pieces; returns MB/s and counts"""
+    total_bytes = sum(len(text.encode('utf-8')) for text in texts)
+    results = {}
+
+    started = time.perf_counter()
+    chapters = 0
+    for text in texts:
+        chapters += len(parse_module.parse(text, chapter_words).chapters)
+    elapsed = time.perf_counter() - started
+    results['whole'] = {'seconds': round(elapsed, 4), 'mb_per_s': round(total_bytes / 1e6 / elapsed, 2), 'chapters': chapters}
+
+    started = time.perf_counter()
+    events = 0
+    for text in texts:
+        parser = parse_module.BookStreamParser(chapter_words)
+        for start in range(0, len(text), chunk_size):
+            events += len(parser.feed(text[start:start + chunk_size]))
+        events += len(parser.close())
+    elapsed = time.perf_counter() - started
+    results['stream'] = {'seconds': round(elapsed, 4), 'mb_per_s': round(total_bytes / 1e6 / elapsed, 2), 'events': events}
+
+    results['bytes'] = total_bytes
+    results['responses'] = len(texts)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do parser de respostas do BookCreatorAI')
+    parser.add_argument('--responses', type=int, default=24, help='Respostas geradas (repartidas pelos idiomas)')
+    parser.add_argument('--words', type=int, default=50000, help='Palavras por resposta gerada')
+    parser.add_argument('--chunk', type=int, default=80, help='Tamanho dos pedaços no modo stream (caracteres)')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'parser-latest.json'))
+    args = parser.parse_args(argv)
+
+    configure_environment()
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+    import config
+    import app
+    from utils import book_parser, llm_backends
+
+    languages = list(app.LANGUAGE_CONFIG)
+    generated = [
+        generated_response(app, llm_backends, languages[i % len(languages)], i, args.words)
+        for i in range(args.responses)
+    ]
+    recorded = recorded_responses(config.LLM_CASSETTE_DIR)
+
+    results = {'chunk': args.chunk}
+    print(f"{'conjunto':<10} {'respostas':>9} {'MB':>7} {'inteiro MB/s':>13} {'stream MB/s':>12}")
+    for name, texts in (('generated', generated), ('recorded', recorded)):
+        if not texts:
+            continue
+        stats = measure(texts, app.CHAPTER_WORDS, args.chunk, book_parser)
+        results[name] = stats
+        print(f"{name:<10} {stats['responses']:>9} {stats['bytes'] / 1e6:>7.1f} "
+              f"{stats['whole']['mb_per_s']:>13} {stats['stream']['mb_per_s']:>12}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados em {args.output}")
+
+
+if __name__ == '__main__':
+    main()
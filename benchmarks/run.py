@@ -0,0 +1,307 @@
+"""
+BookCreatorAI - HTTP Benchmarks
+Runs the real app on a local HTTP server against a seeded library, with the fake
+LLM backend, and reports latency percentiles, throughput and peak RSS per endpoint.
+
+    python -m benchmarks.run                       # run and compare with the baseline
+    python -m benchmarks.run --save-baseline       # run and store the result as the new baseline
+    python -m benchmarks.run --only book,search --scale 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(BENCH_DIR, 'data', 'library.db')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+
+# name -> (method, path, JSON body, requests, concurrency)
+# {id} is replaced by a random book id for every request.
+# Endpoints that load the whole library get fewer requests.
+ENDPOINTS = {
+    'books': ('GET', '/api/books', None, 10, 2),
+    'search': ('GET', '/api/books/search?q=mar&style=romance', None, 20, 4),
+    'dashboard': ('GET', '/api/dashboard', None, 10, 2),
+    'stats_global': ('GET', '/api/stats/global', None, 10, 2),
+    'book': ('GET', '/api/book/{id}', None, 500, 8),
+    'book_stats': ('GET', '/api/book/{id}/stats', None, 500, 8),
+    'download_pdf': ('GET', '/download/{id}/pdf', None, 40, 4),
+    'download_epub': ('GET', '/download/{id}/epub', None, 40, 4),
+    'ai_chat': ('POST', '/api/book/{id}/chat', {'question': 'Quem é a personagem principal?'}, 100, 8),
+    'ai_quiz': ('POST', '/api/book/{id}/quiz', {'num_questions': 5, 'difficulty': 'medium'}, 100, 8),
+    'ai_continue': ('POST', '/api/book/{id}/continue', {'type': 'chapter'}, 100, 8),
+    'ai_synopsis': ('POST', '/api/book/{id}/synopsis', None, 100, 8),
+    'ai_explore': ('POST', '/api/explore-book', {'title': 'Os Maias', 'author': 'Eça de Queirós', 'aspect': 'summary'}, 100, 8),
+    'generate_stream': ('GET', '/generate/stream?theme=mar&style=romance&num_chapters=5&num_pages=20', None, 20, 4)
+}
+
+# Metrics compared with the baseline: name -> True if higher is worse
+COMPARED = {'p50_ms': True, 'p95_ms': True, 'throughput_rps': False}
+
+# Run settings that must match the baseline's for the numbers to be comparable
+COMPARABLE_META = ('books', 'words_per_book', 'scale', 'llm_latency', 'llm_tokens_per_second', 'llm_cache')
+
+
+def configure_environment(args):
+    """Point the app at the benchmark library and the fake backend (before app is imported)"""
+    data_dir = os.path.dirname(os.path.abspath(args.db))
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    os.environ['LLM_BACKEND'] = 'fake'
+    os.environ['LLM_FAKE_LATENCY'] = str(args.llm_latency)
+    os.environ['LLM_FAKE_TOKENS_PER_SECOND'] = str(args.llm_tokens_per_second)
+    os.environ['LLM_CACHE_ENABLED'] = 'true' if args.llm_cache else 'false'
+    os.environ['LLM_CACHE_DB'] = os.path.join(data_dir, 'llm_cache.db')
+    os.environ['RATE_LIMIT_DB'] = os.path.join(data_dir, 'ratelimit.db')
+    os.environ['LLM_REQUESTS_PER_MINUTE'] = '0'
+    os.environ['LLM_TOKENS_PER_MINUTE'] = '0'
+
+
+class RSSSampler:
+    """Samples the resident set size of this process and keeps the peak"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current():
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            # No /proc (macOS): fall back to the lifetime peak
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def quiet_request_handler():
+    from werkzeug.serving import WSGIRequestHandler
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    return QuietRequestHandler
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def request_once(base_url, method, path, body):
+    """Send one request and read the whole response; returns (seconds, status, bytes)"""
+    data = json.dumps(body).encode('utf-8') if body is not None else (b'' if method == 'POST' else None)
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=600) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        size = len(e.read())
+        status = e.code
+    return time.perf_counter() - started, status, size
+
+
+def run_endpoint(base_url, spec, book_ids, scale, concurrency, rng):
+    method, path, body, requests, default_concurrency = spec
+    requests = max(int(requests * scale), 1)
+    concurrency = concurrency or default_concurrency
+    paths = [path.replace('{id}', str(rng.choice(book_ids))) for _ in range(requests)]
+
+    # One untimed request first, so the first endpoint measured doesn't pay for a cold database cache
+    request_once(base_url, method, paths[0], body)
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda p: request_once(base_url, method, p, body), paths))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, _, _ in results)
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': sum(1 for _, status, _ in results if status >= 400),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'throughput_rps': round(requests / elapsed, 2),
+        'avg_response_kb': round(sum(size for _, _, size in results) / len(results) / 1024, 1),
+        'peak_rss_mb': round(rss.peak / (1024 * 1024), 1)
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change against the baseline; returns the list of regressions.
+    Runs with other settings than the baseline (COMPARABLE_META) are not compared.
+    """
+    regressions = []
+    differences = [
+        f"{key} {baseline['meta'].get(key)} -> {results['meta'].get(key)}"
+        for key in COMPARABLE_META if baseline['meta'].get(key) != results['meta'].get(key)
+    ]
+    if differences:
+        print(f"\nSem comparação: a baseline foi medida com outras opções ({', '.join(differences)})")
+        return regressions
+
+    print(f"\nComparação com a baseline ({baseline['meta'].get('timestamp')}, commit {baseline['meta'].get('commit')}):")
+    for name, stats in results['endpoints'].items():
+        previous = baseline['endpoints'].get(name)
+        if not previous:
+            continue
+        changes = []
+        for metric, higher_is_worse in COMPARED.items():
+            old, new = previous.get(metric), stats.get(metric)
+            if not old:
+                continue
+            change = (new - old) / old
+            changes.append(f"{metric} {change:+.0%}")
+            if (change if higher_is_worse else -change) > threshold:
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change:+.0%})")
+        print(f"  {name:<16} {'  '.join(changes)}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks HTTP do BookCreatorAI')
+    parser.add_argument('--books', type=int, default=10000, help='Livros na biblioteca de teste')
+    parser.add_argument('--words-per-book', type=int, default=2000)
+    parser.add_argument('--db', default=DEFAULT_DB, help='Ficheiro SQLite da biblioteca de teste')
+    parser.add_argument('--reseed', action='store_true', help='Recriar a biblioteca mesmo que já exista')
+    parser.add_argument('--only', help='Endpoints a medir, separados por vírgulas')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplicador do número de pedidos')
+    parser.add_argument('--concurrency', type=int, default=0, help='Clientes simultâneos (0 = valor de cada endpoint)')
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='Latência simulada do Gemini (s)')
+    parser.add_argument('--llm-tokens-per-second', type=float, default=0, help='Velocidade simulada do Gemini (0 = instantâneo)')
+    parser.add_argument('--llm-cache', action='store_true', help='Ativar a cache de respostas do LLM')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'latest.json'))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Guardar o resultado como nova baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Variação a partir da qual é regressão')
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(ENDPOINTS)
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Endpoints desconhecidos: {', '.join(unknown)} (opções: {', '.join(ENDPOINTS)})")
+
+    configure_environment(args)
+    from werkzeug.serving import make_server
+    from app import app
+    from models.book import db, Book
+    from benchmarks.seed import seed_library, library_size
+
+    with app.app_context():
+        if args.reseed or library_size() != args.books:
+            print(f"A criar biblioteca de {args.books} livros em {args.db}...")
+            started = time.perf_counter()
+            seed_library(args.books, args.words_per_book)
+            print(f"Biblioteca criada em {time.perf_counter() - started:.1f}s")
+        book_ids = [row[0] for row in db.session.query(Book.id)]
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=quiet_request_handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    rng = random.Random(1234)
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'books': args.books,
+            'words_per_book': args.words_per_book,
+            'scale': args.scale,
+            'llm_latency': args.llm_latency,
+            'llm_tokens_per_second': args.llm_tokens_per_second,
+            'llm_cache': args.llm_cache
+        },
+        'endpoints': {}
+    }
+
+    print(f"{'endpoint':<16} {'reqs':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'KB':>9} {'RSS MB':>7}")
+    try:
+        for name in names:
+            stats = run_endpoint(base_url, ENDPOINTS[name], book_ids, args.scale, args.concurrency, rng)
+            results['endpoints'][name] = stats
+            print(f"{name:<16} {stats['requests']:>5} {stats['errors']:>4} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+                  f"{stats['p99_ms']:>9} {stats['throughput_rps']:>8} {stats['avg_response_kb']:>9} {stats['peak_rss_mb']:>7}")
+    finally:
+        server.shutdown()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados em {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Baseline guardada em {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("\nRegressões:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+BookCreatorAI - Benchmark Library
+Fills the database with a deterministic library of generated books
+"""
+
+import hashlib
+import json
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from models.book import db, Book, Chapter, ChapterSummary, QuizQuestion, count_words
+
+STYLES = ['romance', 'fantasia', 'ficção científica', 'mistério', 'terror', 'aventura', 'infantil', 'técnico']
+LANGUAGES = ['pt-pt', 'pt-br', 'en', 'fr', 'de', 'it']
+TAGS = ['favorito', 'rever', 'publicar', 'série', 'rascunho', 'clássico', 'curto', 'escola', 'presente', 'inglês']
+WORDS = (
+    'a o de que e do da em um uma para com não se por mais como mas ao ele ela das tinha sobre noite '
+    'cidade porta caminho silêncio mar luz sombra olhos mão voz tempo segredo casa Maria João Lisboa '
+    'castelo floresta carta memória vento chuva rio dragão viagem navio estrela montanha janela'
+).split()
+
+BATCH_SIZE = 500
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words))
+
+
+def build_book(rng, index, words_per_book, now):
+    """
+    Row values for one book (with id index + 1) and for its chapters,
+    shaped like the books the app generates
+    """
+    num_chapters = rng.randint(5, 12)
+    words_per_chapter = max(words_per_book // num_chapters, 1)
+    chapters = [f"Capítulo {i + 1}: {_text(rng, 3).title()}" for i in range(num_chapters)]
+    contents = [f"{title}\n\n{_text(rng, words_per_chapter)}" for title in chapters]
+    created_at = now - timedelta(minutes=rng.randint(0, 90 * 24 * 60))
+
+    chapter_rows = [
+        {
+            'book_id': index + 1,
+            'position': position,
+            'title': title,
+            'content': content,
+            'word_count': count_words(content),
+            'char_count': len(content),
+            'content_hash': hashlib.sha1(content.encode('utf-8')).hexdigest(),
+            'updated_at': created_at
+        }
+        for position, (title, content) in enumerate(zip(chapters, contents))
+    ]
+    words = [row['word_count'] for row in chapter_rows]
+
+    book = {
+        'id': index + 1,
+        'title': f"{_text(rng, 3).title()} {index}",
+        'theme': _text(rng, 6),
+        'style': rng.choice(STYLES),
+        'language': rng.choice(LANGUAGES),
+        'chapters': json.dumps(chapters, ensure_ascii=False),
+        'word_count': sum(words),
+        'char_count': len('\n\n'.join(contents)),
+        'chapter_count': num_chapters,
+        'page_count': max(1, round(sum(words) / 250)),
+        'reading_time': max(1, round(sum(words) / 200)),
+        'chapter_word_counts': json.dumps(words),
+        'tags': json.dumps(rng.sample(TAGS, rng.randint(0, 3)), ensure_ascii=False),
+        'is_favorite': rng.random() < 0.1,
+        'synopsis': _text(rng, 60) if rng.random() < 0.3 else None,
+        'created_at': created_at,
+        'updated_at': created_at,
+        'style_template': 'standard',
+        'series_order': 0
+    }
+    # Written by Book.refresh_search() for books saved through the ORM
+    book['search_text'] = f"{book['title']}\n{book['theme']}".casefold()
+    book['search_tags'] = json.dumps([tag.casefold() for tag in json.loads(book['tags'])], ensure_ascii=False)
+    return book, chapter_rows
+
+
+def seed_library(num_books, words_per_book=2000, seed=42):
+    """
+    Replace every book in the current database with num_books generated books.
+    The same arguments always produce the same library.
+    Must run inside an application context.
+    """
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1)
+
+    for model in (QuizQuestion, ChapterSummary, Chapter, Book):
+        db.session.execute(model.__table__.delete())
+    for start in range(0, num_books, BATCH_SIZE):
+        books = [build_book(rng, i, words_per_book, now) for i in range(start, min(start + BATCH_SIZE, num_books))]
+        db.session.execute(insert(Book), [book for book, _ in books])
+        db.session.execute(insert(Chapter), [row for _, rows in books for row in rows])
+        db.session.commit()
+
+
+def library_size():
+    """Number of books in the current database"""
+    return db.session.query(Book.id).count()
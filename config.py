@@ -8,6 +8,85 @@ GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 # Database configuration
 SQLALCHEMY_DATABASE_URI = 'sqlite:///database/books.db'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+DATABASE_URL = os.environ.get('DATABASE_URL')  # Overrides database/books.db (e.g. the benchmark library)
 
 # Secret key for Flask sessions
 SECRET_KEY = 'your-secret-key-change-in-production'
+
+# Background generation jobs: number of books generated at the same time per worker process
+GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 2))
+
+# Number of chapters generated concurrently for a single book
+CHAPTER_WORKERS = int(os.environ.get('CHAPTER_WORKERS', 5))
+
+# Number of languages translated concurrently for a multi-language request
+TRANSLATION_WORKERS = int(os.environ.get('TRANSLATION_WORKERS', 3))
+
+# Generation job monitor: heartbeat interval and how long without a heartbeat before a job is resumed
+JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 180))
+
+# LLM gateway (utils/llm.py)
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gemini-2.0-flash')
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 300))  # Seconds per call, retries included
+LLM_STREAM_CHUNK_TIMEOUT = float(os.environ.get('LLM_STREAM_CHUNK_TIMEOUT', 60))  # Seconds between two chunks of a stream
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 4))
+LLM_RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY', 1))
+LLM_RETRY_MAX_DELAY = float(os.environ.get('LLM_RETRY_MAX_DELAY', 30))
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 64))  # Calls in flight per worker process
+
+# Gemini quota shared by all worker processes (0 disables a limit)
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE', 2000))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE', 4000000))
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 60))  # Seconds a call may queue for quota
+RATE_LIMIT_DB = os.environ.get(
+    'RATE_LIMIT_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'ratelimit.db')
+)
+
+# LLM response cache for the routes that opt in (in-process LRU + SQLite file)
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600))  # Seconds
+LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get('LLM_CACHE_MEMORY_ENTRIES', 500))
+LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+LLM_CACHE_DB = os.environ.get(
+    'LLM_CACHE_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'llm_cache.db')
+)
+LLM_SINGLEFLIGHT_POLL = float(os.environ.get('LLM_SINGLEFLIGHT_POLL', 0.25))  # Seconds between checks while another worker fetches
+
+# LLM telemetry (utils/metrics.py): prices in USD per million tokens, used for cost estimates
+LLM_INPUT_PRICE = float(os.environ.get('LLM_INPUT_PRICE', 0.10))
+LLM_OUTPUT_PRICE = float(os.environ.get('LLM_OUTPUT_PRICE', 0.40))
+
+# LLM backend (utils/llm_backends.py): gemini, fake (offline canned responses),
+# record (gemini + save cassettes) or replay (serve saved cassettes)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+LLM_CASSETTE_DIR = os.environ.get(
+    'LLM_CASSETTE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cassettes')
+)
+LLM_FAKE_LATENCY = float(os.environ.get('LLM_FAKE_LATENCY', 0.5))  # Seconds before the first token
+LLM_FAKE_TOKENS_PER_SECOND = float(os.environ.get('LLM_FAKE_TOKENS_PER_SECOND', 200))  # 0 = instant
+
+# Chat with a book (utils/passages.py): passages retrieved per question and their total size
+CHAT_PASSAGES = int(os.environ.get('CHAT_PASSAGES', 8))
+CHAT_CONTEXT_WORDS = int(os.environ.get('CHAT_CONTEXT_WORDS', 1500))
+
+# Character interviews (utils/mentions.py): words of the character's own scenes sent per question
+INTERVIEW_CONTEXT_WORDS = int(os.environ.get('INTERVIEW_CONTEXT_WORDS', 1500))
+
+# Summary tree (utils/summaries.py) used by continue_story and the synopsis
+SUMMARY_SECTION_WORDS = int(os.environ.get('SUMMARY_SECTION_WORDS', 3000))  # Longer chapters are summarized in sections
+SUMMARY_CONTEXT_CHAPTERS = int(os.environ.get('SUMMARY_CONTEXT_CHAPTERS', 4))  # Chapter summaries listed in prompts (the last ones for continuations, the first ones for synopses)
+CONTINUE_RECENT_WORDS = int(os.environ.get('CONTINUE_RECENT_WORDS', 1500))  # Raw text from the end of the book
+SYNOPSIS_OPENING_WORDS = int(os.environ.get('SYNOPSIS_OPENING_WORDS', 600))  # Raw text from the start of the book
+
+# Quiz question bank (utils/quiz.py)
+QUIZ_QUESTIONS_PER_CHAPTER = int(os.environ.get('QUIZ_QUESTIONS_PER_CHAPTER', 5))  # Per chapter and difficulty
+QUIZ_BANK_MIN_QUESTIONS = int(os.environ.get('QUIZ_BANK_MIN_QUESTIONS', 20))  # Below this the bank is topped up in the background
+QUIZ_FILL_WORKERS = int(os.environ.get('QUIZ_FILL_WORKERS', 1))  # Background fills at the same time per worker process
+
+# Book listings (utils/pagination.py): books per page when no limit is given, and the largest limit accepted
+BOOKS_PAGE_SIZE = int(os.environ.get('BOOKS_PAGE_SIZE', 60))
+BOOKS_PAGE_MAX = int(os.environ.get('BOOKS_PAGE_MAX', 500))
@@ -1,11 +1,24 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
+from sqlalchemy.orm import lazyload, load_only, selectinload
 from datetime import datetime
+import copy
+import functools
+import hashlib
 import json
 import secrets
 import re
 
+from utils import mentions
+
 db = SQLAlchemy()
 
+
+def count_words(text):
+    """Number of words in a text"""
+    return len(re.findall(r'\w+', text)) if text else 0
+
+
 class Series(db.Model):
     """Book series/collection model"""
     __tablename__ = 'series'
@@ -32,26 +45,52 @@ class Series(db.Model):
 
 class Book(db.Model):
     __tablename__ = 'books'
+    __table_args__ = (
+        # Listings are newest first, optionally filtered by one of these columns (utils/pagination.py)
+        db.Index('ix_books_created', 'created_at', 'id'),
+        db.Index('ix_books_favorite_created', 'is_favorite', 'created_at', 'id'),
+        db.Index('ix_books_style_created', 'style', 'created_at', 'id'),
+        db.Index('ix_books_language_created', 'language', 'created_at', 'id'),
+        db.Index('ix_books_series_order', 'series_id', 'series_order'),
+    )
+    
+    # Parsed values of the JSON columns are cached per instance; setting one of these
+    # attributes drops the cached values that depend on it (see _forget_parsed below)
+    PARSED_FROM = {
+        'chapters': ('chapters', 'chapters_content'),
+        'tags': ('tags',),
+        'characters': ('characters',),
+        'world_setting': ('world_setting',),
+        'ai_analysis': ('ai_analysis',),
+        'chapter_word_counts': ('chapter_word_counts',),
+        'character_mentions': ('character_mentions',),
+        'chapters_content': ('chapters_content',),
+        '_full_text': ('chapters_content',)
+    }
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(500), nullable=False)
     theme = db.Column(db.String(500), nullable=False)
     style = db.Column(db.String(100), nullable=False)
     chapters = db.Column(db.Text, nullable=False)  # JSON string
-    full_text = db.Column(db.Text, nullable=False)
+    # Legacy copy of the text; books keep their text in the chapters table (see full_text)
+    _full_text = db.Column('full_text', db.Text, nullable=False, default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # New fields
     language = db.Column(db.String(10), default='pt-pt')
     is_favorite = db.Column(db.Boolean, default=False)
     tags = db.Column(db.Text, default='[]')  # JSON array of tags
+    # Casefolded copies searched by /api/books/search (SQL LIKE only folds ASCII); kept by _refresh_search
+    search_text = db.Column(db.Text, nullable=True)  # Title and theme
+    search_tags = db.Column(db.Text, nullable=True)  # JSON array of tags
     share_token = db.Column(db.String(32), unique=True, nullable=True)
     word_count = db.Column(db.Integer, default=0)
     parent_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=True)
     
     # Cover and editing fields
     cover_image = db.Column(db.Text, nullable=True)  # Base64 or URL
-    chapters_content = db.Column(db.Text, nullable=True)  # JSON with individual chapter content
+    chapters_content = db.Column(db.Text, nullable=True)  # Legacy JSON with individual chapter content
     style_template = db.Column(db.String(50), default='standard')  # Template used
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -60,62 +99,192 @@ class Book(db.Model):
     world_setting = db.Column(db.Text, nullable=True)  # JSON with worldbuilding details
     plot_outline = db.Column(db.Text, nullable=True)  # Selected plot outline
     ai_analysis = db.Column(db.Text, nullable=True)  # JSON with AI analysis results
+    character_mentions = db.Column(db.Text, nullable=True)  # JSON index of the paragraphs where each character appears
     
     # Series/Collection
     series_id = db.Column(db.Integer, db.ForeignKey('series.id'), nullable=True)
     series_order = db.Column(db.Integer, default=0)  # Order within series
     synopsis = db.Column(db.Text, nullable=True)  # Book synopsis/summary
     
+    # Statistics, stored when the text changes (see refresh_stats); char_count is NULL until computed
+    char_count = db.Column(db.Integer, nullable=True)
+    chapter_count = db.Column(db.Integer, default=0)
+    page_count = db.Column(db.Integer, default=0)
+    reading_time = db.Column(db.Integer, default=0)  # Minutes
+    chapter_word_counts = db.Column(db.Text, nullable=True)  # JSON array with the words of each chapter
+    
+    # Cumulative LLM usage of everything generated for this book
+    llm_calls = db.Column(db.Integer, default=0)
+    prompt_tokens = db.Column(db.Integer, default=0)
+    output_tokens = db.Column(db.Integer, default=0)
+    llm_cost = db.Column(db.Float, default=0.0)  # Estimated USD
+    
+    # Chapter text, one row per chapter
+    chapter_rows = db.relationship(
+        'Chapter', backref='book', lazy='select', order_by='Chapter.position', cascade='all, delete-orphan'
+    )
+    
+    # Cached summaries of the chapters and of the whole book
+    summaries = db.relationship('ChapterSummary', backref='book', lazy='dynamic', cascade='all, delete-orphan')
+    quiz_questions = db.relationship('QuizQuestion', backref='book', lazy='dynamic', cascade='all, delete-orphan')
+    
     def __repr__(self):
         return f'<Book {self.title}>'
     
-    def to_dict(self):
+    @property
+    def full_text(self):
+        """The whole text, assembled from the chapters"""
+        if self.chapter_rows:
+            return '\n\n'.join(row.content for row in self.chapter_rows)
+        return self._full_text or ''
+    
+    @full_text.setter
+    def full_text(self, value):
+        """
+        Set the text of a book that has no chapter rows yet (it is split into chapters
+        by set_chapters_content later). A book with chapter rows reads its text from them,
+        so the assignment would be lost: it raises ValueError, use set_chapters_content.
+        """
+        if self.chapter_rows:
+            raise ValueError('Book text is kept in its chapters; use set_chapters_content()')
+        self._full_text = value or ''
+    
+    # Fields of to_dict()
+    FIELDS = {
+        'id': lambda book: book.id,
+        'title': lambda book: book.title,
+        'theme': lambda book: book.theme,
+        'style': lambda book: book.style,
+        'language': lambda book: book.language or 'pt-pt',
+        'chapters': lambda book: book.get_chapters(),
+        'full_text': lambda book: book.full_text,
+        'created_at': lambda book: book.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'updated_at': lambda book: book.updated_at.strftime('%Y-%m-%d %H:%M:%S') if book.updated_at else None,
+        'is_favorite': lambda book: book.is_favorite or False,
+        'tags': lambda book: book.get_tags(),
+        'share_token': lambda book: book.share_token,
+        'word_count': lambda book: book.get_word_count(),
+        'reading_time': lambda book: book.get_reading_time(),
+        'page_count': lambda book: book.get_page_count(),
+        'chapter_count': lambda book: book.chapter_count or 0,
+        'parent_id': lambda book: book.parent_id,
+        'cover_image': lambda book: book.cover_image,
+        'style_template': lambda book: book.style_template or 'standard',
+        'chapters_content': lambda book: book.get_chapters_content(),
+        'characters': lambda book: book.get_characters(),
+        'world_setting': lambda book: book.get_world_setting(),
+        'plot_outline': lambda book: book.plot_outline,
+        'ai_analysis': lambda book: book.get_ai_analysis(),
+        'series_id': lambda book: book.series_id,
+        'series_order': lambda book: book.series_order or 0,
+        'synopsis': lambda book: book.synopsis,
+        'usage': lambda book: book.get_usage()
+    }
+    
+    # Fields sent in book listings: no text, cover or AI data
+    SUMMARY_FIELDS = (
+        'id', 'title', 'theme', 'style', 'language', 'chapters', 'created_at', 'updated_at',
+        'is_favorite', 'tags', 'share_token', 'word_count', 'reading_time', 'page_count',
+        'chapter_count', 'parent_id', 'style_template', 'series_id', 'series_order'
+    )
+    
+    # Columns read by the fields that don't just read the column of the same name
+    FIELD_COLUMNS = {
+        'full_text': ('_full_text', 'chapters'),
+        'word_count': ('word_count', 'char_count'),
+        'reading_time': ('reading_time', 'char_count'),
+        'page_count': ('page_count', 'char_count'),
+        'chapters_content': ('chapters_content', '_full_text', 'chapters'),
+        'usage': ('llm_calls', 'prompt_tokens', 'output_tokens', 'llm_cost')
+    }
+    
+    # Fields that read the chapter rows
+    TEXT_FIELDS = ('full_text', 'chapters_content')
+    
+    # Columns a chapter edit reads or writes (update_chapter, update_chapter_title)
+    CHAPTER_EDIT_COLUMNS = (
+        'chapters', 'characters', 'character_mentions', 'word_count', 'char_count',
+        'chapter_count', 'page_count', 'reading_time', 'chapter_word_counts', 'updated_at'
+    )
+    
+    def to_dict(self, fields=None):
+        """The book as a dict; fields limits it to those keys (unknown names are ignored)"""
+        names = self.FIELDS if fields is None else [name for name in fields if name in self.FIELDS]
+        return {name: self.FIELDS[name](self) for name in names}
+    
+    @classmethod
+    def load_options(cls, fields=None, columns=()):
+        """
+        Query options that load only the columns the given to_dict() fields need
+        (plus columns, by attribute name), and the chapter rows only for the text fields.
+        With fields None every column is loaded. The options are built once per field set.
+        """
+        if fields is not None or columns:
+            fields = tuple(sorted(name for name in (cls.FIELDS if fields is None else fields) if name in cls.FIELDS))
+        return _load_options(fields, tuple(sorted(columns)))
+    
+    def get_usage(self):
+        """Get the cumulative LLM usage as a dict"""
         return {
-            'id': self.id,
-            'title': self.title,
-            'theme': self.theme,
-            'style': self.style,
-            'language': self.language or 'pt-pt',
-            'chapters': json.loads(self.chapters) if self.chapters else [],
-            'full_text': self.full_text,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None,
-            'is_favorite': self.is_favorite or False,
-            'tags': self.get_tags(),
-            'share_token': self.share_token,
-            'word_count': self.word_count or self.calculate_word_count(),
-            'reading_time': self.get_reading_time(),
-            'parent_id': self.parent_id,
-            'cover_image': self.cover_image,
-            'style_template': self.style_template or 'standard',
-            'chapters_content': self.get_chapters_content(),
-            'characters': self.get_characters(),
-            'world_setting': self.get_world_setting(),
-            'plot_outline': self.plot_outline,
-            'ai_analysis': self.get_ai_analysis(),
-            'series_id': self.series_id,
-            'series_order': self.series_order or 0,
-            'synopsis': self.synopsis
+            'calls': self.llm_calls or 0,
+            'prompt_tokens': self.prompt_tokens or 0,
+            'output_tokens': self.output_tokens or 0,
+            'cost': round(self.llm_cost or 0.0, 6)
         }
     
+    def add_usage(self, usage):
+        """Add the usage of one LLM call (LLMResponse.usage) or of several (UsageMeter.to_dict())"""
+        if not usage:
+            return
+        self.llm_calls = (self.llm_calls or 0) + usage.get('calls', 1)
+        self.prompt_tokens = (self.prompt_tokens or 0) + usage['prompt_tokens']
+        self.output_tokens = (self.output_tokens or 0) + usage['output_tokens']
+        self.llm_cost = (self.llm_cost or 0.0) + usage['cost']
+    
+    def _parsed(self):
+        """Cache of parsed JSON values for this instance"""
+        return vars(self).setdefault('_parsed_json', {})
+    
+    def _get_json(self, column, empty):
+        """
+        Parsed value of a JSON column (empty() when unset or invalid), parsed once
+        and shared until the column changes. Callers that modify it must call the setter.
+        """
+        cache = self._parsed()
+        if column not in cache:
+            raw = getattr(self, column)
+            try:
+                cache[column] = json.loads(raw) if raw else empty()
+            except ValueError:
+                cache[column] = empty()
+        return cache[column]
+    
+    def _set_json(self, column, value):
+        """Store value in a JSON column and keep a copy of it as the parsed value"""
+        setattr(self, column, json.dumps(value, ensure_ascii=False))
+        self._parsed()[column] = copy.deepcopy(value)  # The caller may go on to change or share value
+    
     def set_chapters(self, chapters_list):
         """Set chapters from a list"""
-        self.chapters = json.dumps(chapters_list, ensure_ascii=False)
+        self._set_json('chapters', chapters_list)
+        self.chapter_count = len(chapters_list)
     
     def get_chapters(self):
         """Get chapters as a list"""
-        return json.loads(self.chapters) if self.chapters else []
+        return self._get_json('chapters', list)
     
     def set_tags(self, tags_list):
         """Set tags from a list"""
-        self.tags = json.dumps(tags_list, ensure_ascii=False)
+        self._set_json('tags', tags_list)
     
     def get_tags(self):
         """Get tags as a list"""
-        try:
-            return json.loads(self.tags) if self.tags else []
-        except:
-            return []
+        return self._get_json('tags', list)
+    
+    def refresh_search(self):
+        """Fill the casefolded copies of the title, theme and tags that searches filter on"""
+        self.search_text = f"{self.title or ''}\n{self.theme or ''}".casefold()
+        self.search_tags = json.dumps([str(tag).casefold() for tag in self.get_tags()], ensure_ascii=False)
     
     def add_tag(self, tag):
         """Add a single tag"""
@@ -132,22 +301,63 @@ class Book(db.Model):
             self.set_tags(tags)
     
     def calculate_word_count(self):
-        """Calculate word count from full text"""
-        if self.full_text:
-            words = len(re.findall(r'\w+', self.full_text))
-            return words
-        return 0
+        """Calculate word count from the chapters (or the full text)"""
+        if self.chapter_rows:
+            return sum(row.word_count or 0 for row in self.chapter_rows)
+        return count_words(self.full_text)
+    
+    def refresh_stats(self):
+        """Recompute the stored statistics from the chapters (or the full text of legacy books)"""
+        if self.chapter_rows:
+            for row in self.chapter_rows:
+                if row.char_count is None:
+                    row.char_count = len(row.content)
+            words = [row.word_count or 0 for row in self.chapter_rows]
+            self.char_count = sum(row.char_count for row in self.chapter_rows) + 2 * (len(self.chapter_rows) - 1)
+        else:
+            words = [count_words(chapter.get('content')) for chapter in self.get_chapters_content()]
+            self.char_count = len(self.full_text)
+        self._set_json('chapter_word_counts', words)
+        self.chapter_count = len(self.get_chapters())
+        self._set_word_count(sum(words) if self.chapter_rows else count_words(self.full_text))
+    
+    def _set_word_count(self, words):
+        """Set the word count and the estimates derived from it"""
+        self.word_count = words
+        self.reading_time = max(1, round(words / 200))  # avg 200 words/min
+        self.page_count = max(1, round(words / 250))  # avg 250 words/page
+    
+    def _add_chapter_delta(self, index, words, chars):
+        """Apply the change of one chapter (words and characters added) to the stored statistics"""
+        if self.char_count is None:
+            self.refresh_stats()
+            return
+        counts = self._get_json('chapter_word_counts', list)
+        if 0 <= index < len(counts):
+            counts[index] += words
+            self._set_json('chapter_word_counts', counts)
+        self.char_count += chars
+        self._set_word_count((self.word_count or 0) + words)
+    
+    def _ensure_stats(self):
+        """Compute the statistics of a book saved before they were stored"""
+        if self.char_count is None:
+            self.refresh_stats()
+    
+    def get_word_count(self):
+        """Stored word count"""
+        self._ensure_stats()
+        return self.word_count or 0
     
     def get_reading_time(self):
         """Estimate reading time in minutes (avg 200 words/min)"""
-        words = self.word_count or self.calculate_word_count()
-        minutes = max(1, round(words / 200))
-        return minutes
+        self._ensure_stats()
+        return self.reading_time
     
     def get_page_count(self):
         """Estimate page count (avg 250 words/page)"""
-        words = self.word_count or self.calculate_word_count()
-        return max(1, round(words / 250))
+        self._ensure_stats()
+        return self.page_count
     
     def generate_share_token(self):
         """Generate a unique share token"""
@@ -155,30 +365,61 @@ class Book(db.Model):
         return self.share_token
     
     def get_stats(self):
-        """Get book statistics"""
-        word_count = self.word_count or self.calculate_word_count()
+        """Get book statistics (stored columns, see refresh_stats)"""
+        self._ensure_stats()
+        word_count = self.word_count or 0
         return {
             'word_count': word_count,
-            'page_count': self.get_page_count(),
-            'chapter_count': len(self.get_chapters()),
-            'reading_time': self.get_reading_time(),
-            'character_count': len(self.full_text) if self.full_text else 0,
-            'avg_words_per_chapter': round(word_count / max(1, len(self.get_chapters())))
+            'page_count': self.page_count,
+            'chapter_count': self.chapter_count or 0,
+            'reading_time': self.reading_time,
+            'character_count': self.char_count,
+            'avg_words_per_chapter': round(word_count / max(1, self.chapter_count or 0)),
+            'chapter_words': self._get_json('chapter_word_counts', list)
         }
     
     def get_chapters_content(self):
         """Get individual chapter contents as a list"""
-        if self.chapters_content:
+        if self.chapter_rows:
+            return [{'title': row.title, 'content': row.content} for row in self.chapter_rows]
+        cache = self._parsed()
+        if 'chapters_content' not in cache:
             try:
-                return json.loads(self.chapters_content)
-            except:
-                pass
-        # Parse from full_text if not stored separately
-        return self.parse_chapters_from_text()
+                cache['chapters_content'] = json.loads(self.chapters_content) if self.chapters_content else None
+            except ValueError:
+                cache['chapters_content'] = None
+            if cache['chapters_content'] is None:
+                # Parse from full_text if not stored separately
+                cache['chapters_content'] = self.parse_chapters_from_text()
+        return cache['chapters_content']
     
     def set_chapters_content(self, chapters_list):
-        """Set individual chapter contents"""
-        self.chapters_content = json.dumps(chapters_list, ensure_ascii=False)
+        """
+        Set individual chapter contents.
+        Only the chapter rows whose title or content changed are written.
+        """
+        rows = list(self.chapter_rows)
+        for position, chapter in enumerate(chapters_list):
+            title = chapter.get('title', '')
+            content = chapter.get('content', '')
+            if position < len(rows):
+                row = rows[position]
+                if row.title != title:
+                    row.title = title
+                if row.content != content:
+                    row.set_content(content)
+            else:
+                row = Chapter(position=position, title=title)
+                row.set_content(content)
+                self.chapter_rows.append(row)
+        for row in rows[len(chapters_list):]:
+            self.chapter_rows.remove(row)
+        
+        # The chapters are the text now
+        self.chapters_content = None
+        self._full_text = ''
+        self.refresh_stats()
+        self.update_character_mentions()
     
     def parse_chapters_from_text(self):
         """Parse full_text into individual chapters"""
@@ -220,35 +461,53 @@ class Book(db.Model):
         
         return chapters
     
+    def _ensure_chapter_rows(self):
+        """Move a book that still keeps its text in the legacy columns into chapter rows"""
+        if not self.chapter_rows and (self.chapters_content or self._full_text):
+            self.set_chapters_content(self.get_chapters_content())
+    
+    def _chapter_row(self, index):
+        """
+        The chapter row at index, or None. When the book's chapters are not loaded
+        only that row is read, so editing one chapter doesn't load the whole book.
+        """
+        if index < 0:
+            return None
+        if 'chapter_rows' in inspect(self).unloaded:
+            row = Chapter.query.filter_by(book_id=self.id, position=index).first()
+            if row is not None:
+                return row
+            self._ensure_chapter_rows()
+        return self.chapter_rows[index] if index < len(self.chapter_rows) else None
+    
     def update_chapter(self, index, new_content):
-        """Update a specific chapter's content"""
-        chapters = self.get_chapters_content()
-        if 0 <= index < len(chapters):
-            chapters[index]['content'] = new_content
-            self.set_chapters_content(chapters)
-            # Rebuild full_text
-            self.full_text = '\n\n'.join([ch['content'] for ch in chapters])
-            self.word_count = self.calculate_word_count()
+        """Update a specific chapter's content; only that chapter's row is rewritten"""
+        row = self._chapter_row(index)
+        if row is not None:
+            old_words, old_chars = row.word_count or 0, row.char_count
+            row.set_content(new_content)
+            self._add_chapter_delta(index, row.word_count - old_words, row.char_count - (old_chars or 0))
+            self._update_chapter_mentions(row)
             return True
         return False
     
     def update_chapter_title(self, index, new_title):
         """Update a specific chapter's title"""
-        chapters = self.get_chapters_content()
+        row = self._chapter_row(index)
         chapter_titles = self.get_chapters()
         
-        if 0 <= index < len(chapters):
-            old_title = chapters[index]['title']
-            chapters[index]['title'] = new_title
-            chapters[index]['content'] = chapters[index]['content'].replace(old_title, new_title, 1)
-            self.set_chapters_content(chapters)
+        if row is not None:
+            old_title = row.title
+            row.title = new_title
+            old_words, old_chars = row.word_count or 0, row.char_count
+            row.set_content(row.content.replace(old_title, new_title, 1))
+            self._add_chapter_delta(index, row.word_count - old_words, row.char_count - (old_chars or 0))
             
             if 0 <= index < len(chapter_titles):
                 chapter_titles[index] = new_title
                 self.set_chapters(chapter_titles)
             
-            # Rebuild full_text
-            self.full_text = '\n\n'.join([ch['content'] for ch in chapters])
+            self._update_chapter_mentions(row)
             return True
         return False
     
@@ -256,14 +515,12 @@ class Book(db.Model):
     
     def get_characters(self):
         """Get characters as a list of dicts"""
-        try:
-            return json.loads(self.characters) if self.characters else []
-        except:
-            return []
+        return self._get_json('characters', list)
     
     def set_characters(self, characters_list):
         """Set characters from a list of dicts"""
-        self.characters = json.dumps(characters_list, ensure_ascii=False)
+        self._set_json('characters', characters_list)
+        self.update_character_mentions()
     
     def add_character(self, character):
         """Add a character dict: {name, role, description, traits, arc}"""
@@ -271,27 +528,88 @@ class Book(db.Model):
         characters.append(character)
         self.set_characters(characters)
     
-    def get_world_setting(self):
-        """Get worldbuilding as a dict"""
+    def update_character_mentions(self):
+        """
+        Bring the character mention index up to date with the chapters and characters.
+        Only chapters that changed since the last update are rescanned.
+        Each chapter row keeps its own entry of the index and the book keeps the
+        summary (names and candidate counts). Returns the whole index.
+        """
+        stored = self._get_json('character_mentions', dict)
+        names = [c.get('name', '') for c in self.get_characters()]
+        rows = self.chapter_rows
+        if not rows:
+            # Legacy book without chapter rows: the whole index lives on the book
+            index = mentions.build_index(self.get_chapters_content(), names, stored or None)
+            if index != stored:
+                self._set_json('character_mentions', index)
+            return index
+        
+        entries = [self._chapter_mentions(row) for row in rows]
+        if 'chapters' in stored and not any(entries):
+            entries = stored['chapters']  # Index written before the chapters kept their own entries
+        previous = {'names': stored.get('names', []), 'chapters': entries}
+        chapters = [{'content': row.content, 'hash': row.content_hash} for row in rows]
+        index = mentions.build_index(chapters, names, previous)
+        for row, entry in zip(rows, index['chapters']):
+            if entry != self._chapter_mentions(row):
+                row.mentions = json.dumps(entry, ensure_ascii=False)
+        summary = mentions.index_summary(index)
+        if summary != stored:
+            self._set_json('character_mentions', summary)
+        return index
+    
+    @staticmethod
+    def _chapter_mentions(row):
+        """A chapter row's entry of the mention index ({} if it has none)"""
         try:
-            return json.loads(self.world_setting) if self.world_setting else {}
-        except:
+            return json.loads(row.mentions) if row.mentions else {}
+        except ValueError:
             return {}
     
+    def _update_chapter_mentions(self, row):
+        """
+        Rescan one edited chapter and update its entry and the book summary only.
+        The other chapters are rescanned only when the edit changes the names.
+        """
+        names = [c.get('name', '') for c in self.get_characters()]
+        result = mentions.reindex_chapter(
+            self._get_json('character_mentions', dict), self._chapter_mentions(row),
+            row.content, row.content_hash, names
+        )
+        if result is None:
+            self.update_character_mentions()
+            return
+        summary, entry = result
+        row.mentions = json.dumps(entry, ensure_ascii=False)
+        self._set_json('character_mentions', summary)
+    
+    def get_character_scenes(self, character_name, max_words=1500):
+        """
+        Get the paragraphs where a character appears, as {chapter, title, text}.
+        Returns None if the character is not in the mention index.
+        """
+        index = self.update_character_mentions()
+        name = mentions.find_name(index, character_name)
+        if not name:
+            return None
+        return mentions.character_scenes(self.get_chapters_content(), index, name, max_words)
+    
+    def get_world_setting(self):
+        """Get worldbuilding as a dict"""
+        return self._get_json('world_setting', dict)
+    
     def set_world_setting(self, world_dict):
         """Set worldbuilding from a dict"""
-        self.world_setting = json.dumps(world_dict, ensure_ascii=False)
+        self._set_json('world_setting', world_dict)
     
     def get_ai_analysis(self):
         """Get AI analysis results as a dict"""
-        try:
-            return json.loads(self.ai_analysis) if self.ai_analysis else {}
-        except:
-            return {}
+        return self._get_json('ai_analysis', dict)
     
     def set_ai_analysis(self, analysis_dict):
         """Set AI analysis from a dict"""
-        self.ai_analysis = json.dumps(analysis_dict, ensure_ascii=False)
+        self._set_json('ai_analysis', analysis_dict)
     
     def get_characters_prompt(self):
         """Generate prompt section for characters"""
@@ -334,3 +652,251 @@ class Book(db.Model):
             prompt += f"- Detalhes adicionais: {world['custom']}\n"
         
         return prompt
+
+
+def _forget_parsed(keys):
+    def listener(target, value, oldvalue, initiator):
+        cache = vars(target).get('_parsed_json')
+        if cache:
+            for key in keys:
+                cache.pop(key, None)
+    return listener
+
+
+def _forget_all_parsed(target, *args):
+    if target is not None:  # None when the instance was already garbage collected
+        vars(target).pop('_parsed_json', None)
+
+
+for _attribute, _keys in Book.PARSED_FROM.items():
+    db.event.listen(getattr(Book, _attribute), 'set', _forget_parsed(_keys))
+db.event.listen(Book, 'expire', _forget_all_parsed)
+db.event.listen(Book, 'refresh', _forget_all_parsed)
+
+
+def _refresh_search(mapper, connection, target):
+    state = inspect(target)
+    if state.persistent and not any(state.attrs[name].history.has_changes() for name in ('title', 'theme', 'tags')):
+        return
+    target.refresh_search()
+
+
+db.event.listen(Book, 'before_insert', _refresh_search)
+db.event.listen(Book, 'before_update', _refresh_search)
+
+
+@functools.lru_cache(maxsize=256)
+def _load_options(fields, columns):
+    if fields is None:
+        return (selectinload(Book.chapter_rows),)
+    names = {'id', 'created_at'} | set(columns)  # The key of the listings
+    for field in fields:
+        names.update(Book.FIELD_COLUMNS.get(field, (field,)))
+    if any(field in Book.TEXT_FIELDS for field in fields):
+        rows = selectinload(Book.chapter_rows)
+    else:
+        rows = lazyload(Book.chapter_rows)
+    return (load_only(*(getattr(Book, name) for name in sorted(names))), rows)
+
+
+class Chapter(db.Model):
+    """One chapter of a book; the chapters are the book's text"""
+    __tablename__ = 'chapters'
+    __table_args__ = (
+        db.UniqueConstraint('book_id', 'position', name='uq_chapter'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)  # Chapter index
+    title = db.Column(db.String(500), nullable=False, default='')
+    content = db.Column(db.Text, nullable=False, default='')
+    word_count = db.Column(db.Integer, default=0)
+    char_count = db.Column(db.Integer, nullable=True)
+    content_hash = db.Column(db.String(40), nullable=True)
+    mentions = db.Column(db.Text, nullable=True)  # JSON: this chapter's entry of the character mention index
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Chapter {self.book_id} {self.position}>'
+    
+    def set_content(self, content):
+        """Set the text and the values derived from it"""
+        self.content = content or ''
+        self.word_count = count_words(self.content)
+        self.char_count = len(self.content)
+        self.content_hash = hashlib.sha1(self.content.encode('utf-8')).hexdigest()
+
+
+class GenerationJob(db.Model):
+    """Background book generation job"""
+    __tablename__ = 'generation_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed
+    phase = db.Column(db.String(50), default='queued')  # queued, generating, translating, saving, done
+    params = db.Column(db.Text, nullable=False)  # JSON with the original /generate request
+    chapters_done = db.Column(db.Integer, default=0)
+    chapters_total = db.Column(db.Integer, default=0)
+    book_ids = db.Column(db.Text, default='[]')  # JSON array of created book ids
+    books = db.Column(db.Text, default='[]')  # JSON array of {id, title, language}
+    errors = db.Column(db.Text, default='[]')  # JSON array of error messages
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last sign of life from the worker running it
+    
+    # Checkpoints
+    checkpoints = db.relationship('GenerationCheckpoint', backref='job', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<GenerationJob {self.id} {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'phase': self.phase,
+            'params': self.get_params(),
+            'chapters_done': self.chapters_done or 0,
+            'chapters_total': self.chapters_total or 0,
+            'book_ids': self.get_book_ids(),
+            'books': self.get_books(),
+            'errors': self.get_errors(),
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+    
+    def get_params(self):
+        """Get the generation parameters as a dict"""
+        return json.loads(self.params) if self.params else {}
+    
+    def set_params(self, params_dict):
+        """Set the generation parameters from a dict"""
+        self.params = json.dumps(params_dict, ensure_ascii=False)
+    
+    def get_book_ids(self):
+        """Get created book ids as a list"""
+        return json.loads(self.book_ids) if self.book_ids else []
+    
+    def get_books(self):
+        """Get created books as a list of dicts"""
+        return json.loads(self.books) if self.books else []
+    
+    def add_book(self, book):
+        """Record a created book"""
+        books = self.get_books()
+        books.append({'id': book.id, 'title': book.title, 'language': book.language})
+        self.books = json.dumps(books, ensure_ascii=False)
+        self.book_ids = json.dumps([b['id'] for b in books])
+    
+    def get_errors(self):
+        """Get errors as a list"""
+        return json.loads(self.errors) if self.errors else []
+    
+    def add_error(self, message):
+        """Record an error message"""
+        errors = self.get_errors()
+        errors.append(message)
+        self.errors = json.dumps(errors, ensure_ascii=False)
+
+
+class GenerationCheckpoint(db.Model):
+    """Finished piece of a generation job (outline, chapter or translation)"""
+    __tablename__ = 'generation_checkpoints'
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'kind', 'language', 'position', name='uq_checkpoint'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    job_id = db.Column(db.String(32), db.ForeignKey('generation_jobs.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # outline, chapter, translation
+    language = db.Column(db.String(10), nullable=False, default='')
+    position = db.Column(db.Integer, nullable=False, default=0)  # Chapter index
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<GenerationCheckpoint {self.job_id} {self.kind} {self.language} {self.position}>'
+    
+    def get_payload(self):
+        """Get the checkpoint payload"""
+        return json.loads(self.payload)
+    
+    def set_payload(self, value):
+        """Set the checkpoint payload"""
+        self.payload = json.dumps(value, ensure_ascii=False)
+
+
+class ChapterSummary(db.Model):
+    """
+    Cached summary of one chapter, or of the whole book (position BOOK_POSITION).
+    content_hash identifies the text that was summarized, so stale summaries are detected.
+    """
+    __tablename__ = 'chapter_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('book_id', 'position', name='uq_chapter_summary'),
+    )
+    
+    BOOK_POSITION = -1
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)  # Chapter index, or BOOK_POSITION
+    title = db.Column(db.String(500), nullable=True)
+    content_hash = db.Column(db.String(40), nullable=False)
+    summary = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ChapterSummary {self.book_id} {self.position}>'
+    
+    def to_dict(self):
+        return {
+            'position': self.position,
+            'title': self.title,
+            'summary': self.summary,
+            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+        }
+
+
+class QuizQuestion(db.Model):
+    """
+    Multiple-choice question of a book's quiz bank, about one chapter.
+    content_hash is the hash of the chapter text it was written from; questions
+    about a chapter that changed since are no longer used.
+    """
+    __tablename__ = 'quiz_questions'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False, index=True)
+    chapter = db.Column(db.Integer, nullable=False)  # Chapter index
+    content_hash = db.Column(db.String(40), nullable=False)
+    difficulty = db.Column(db.String(10), nullable=False)  # easy, medium, hard
+    question = db.Column(db.Text, nullable=False)
+    options = db.Column(db.Text, nullable=False)  # JSON list of 4 options
+    correct = db.Column(db.Integer, nullable=False)  # Index of the correct option (0-3)
+    explanation = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<QuizQuestion {self.book_id} {self.chapter} {self.difficulty}>'
+    
+    def get_options(self):
+        """Get the options as a list"""
+        return json.loads(self.options) if self.options else []
+    
+    def set_options(self, options_list):
+        """Set the options from a list"""
+        self.options = json.dumps(options_list, ensure_ascii=False)
+    
+    def to_dict(self):
+        """The question in the format of the quiz page"""
+        return {
+            'question': self.question,
+            'options': self.get_options(),
+            'correct': self.correct,
+            'explanation': self.explanation or '',
+            'chapter': self.chapter
+        }
@@ -0,0 +1,107 @@
+"""
+BookCreatorAI - Schema migrations
+db.create_all() only creates missing tables; this adds columns and indexes introduced after a table
+was created and moves data whose storage changed.
+"""
+
+from sqlalchemy import inspect, or_, text
+from sqlalchemy.orm import load_only, selectinload
+from sqlalchemy.orm.attributes import flag_modified
+
+from models.book import Book, Chapter
+
+
+def add_missing_columns(db):
+    """Add model columns that are missing from existing tables"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                if isinstance(default, bool):
+                    default = int(default)
+                ddl += f" DEFAULT {default!r}" if isinstance(default, str) else f" DEFAULT {default}"
+            
+            with db.engine.begin() as connection:
+                connection.execute(text(ddl))
+            added.append(f'{table.name}.{column.name}')
+    
+    return added
+
+
+def add_missing_indexes(db):
+    """Create model indexes that are missing from existing tables"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=db.engine)
+                added.append(index.name)
+    
+    return added
+
+
+def move_text_to_chapters(db, batch_size=100):
+    """
+    Move the text of books that still keep it in books.chapters_content / books.full_text
+    into the chapters table, one row per chapter. Returns the number of books moved.
+    """
+    pending = db.session.query(Book.id).filter(
+        ~db.session.query(Chapter.id).filter(Chapter.book_id == Book.id).exists(),
+        or_(Book.chapters_content.isnot(None), Book._full_text != '')
+    ).all()
+    ids = [book_id for (book_id,) in pending]
+    
+    for start in range(0, len(ids), batch_size):
+        for book in Book.query.options(selectinload(Book.chapter_rows)).filter(Book.id.in_(ids[start:start + batch_size])):
+            book.set_chapters_content(book.get_chapters_content())
+            flag_modified(book, 'updated_at')  # Keep the date of the last real edit
+        db.session.commit()
+    
+    return len(ids)
+
+
+def fill_missing_stats(db, batch_size=100):
+    """Compute the stored statistics of books saved before they existed. Returns the number of books updated."""
+    ids = [book_id for (book_id,) in db.session.query(Book.id).filter(Book.char_count.is_(None)).all()]
+    
+    for start in range(0, len(ids), batch_size):
+        for book in Book.query.options(selectinload(Book.chapter_rows)).filter(Book.id.in_(ids[start:start + batch_size])):
+            book.refresh_stats()
+            flag_modified(book, 'updated_at')  # Keep the date of the last real edit
+        db.session.commit()
+    
+    return len(ids)
+
+
+def fill_search_columns(db, batch_size=500):
+    """Fill the search columns of books saved before they existed. Returns the number of books updated."""
+    ids = [book_id for (book_id,) in db.session.query(Book.id).filter(Book.search_text.is_(None)).all()]
+    
+    for start in range(0, len(ids), batch_size):
+        columns = load_only(Book.id, Book.title, Book.theme, Book.tags, Book.search_text, Book.search_tags, Book.updated_at)
+        for book in Book.query.options(columns).filter(Book.id.in_(ids[start:start + batch_size])):
+            book.refresh_search()
+            flag_modified(book, 'updated_at')  # Keep the date of the last real edit
+        db.session.commit()
+    
+    return len(ids)
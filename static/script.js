@@ -224,21 +224,39 @@ async function generateBook(event) {
     errorMessage.classList.add('hidden');
     
     try {
-        const response = await fetch(`${API_BASE}/generate`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
+        let data;
+        
+        if (languages.length === 1 && window.EventSource) {
+            // Single language: stream the book as it is written
+            data = await streamBookGeneration({
                 theme: theme,
                 num_chapters: numChapters,
                 num_pages: numPages,
                 style: style,
-                languages: languages
-            })
-        });
-        
-        const data = await response.json();
+                language: languages[0]
+            });
+        } else {
+            const response = await fetch(`${API_BASE}/generate`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({
+                    theme: theme,
+                    num_chapters: numChapters,
+                    num_pages: numPages,
+                    style: style,
+                    languages: languages
+                })
+            });
+            
+            data = await response.json();
+            
+            // Generation runs as a background job: poll until it finishes
+            if (data.success && data.job_id) {
+                data = await waitForGenerationJob(data.job_id);
+            }
+        }
         
         if (data.success) {
             // Show success message
@@ -273,6 +291,103 @@ async function generateBook(event) {
     }
 }
 
+/**
+ * Generate a book over Server-Sent Events, showing title, index and chapters as they arrive
+ */
+function streamBookGeneration(params) {
+    const preview = document.getElementById('streamPreview');
+    const previewTitle = document.getElementById('streamTitle');
+    const previewIndex = document.getElementById('streamIndex');
+    const previewText = document.getElementById('streamText');
+    const chapterTexts = {};
+    
+    if (preview) {
+        preview.classList.remove('hidden');
+        previewTitle.textContent = '';
+        previewIndex.innerHTML = '';
+        previewText.textContent = '';
+    }
+    
+    return new Promise((resolve) => {
+        const source = new EventSource(`${API_BASE}/generate/stream?${new URLSearchParams(params)}`);
+        
+        const finish = (result) => {
+            source.close();
+            if (preview) preview.classList.add('hidden');
+            resolve(result);
+        };
+        
+        source.addEventListener('title', (e) => {
+            if (preview) previewTitle.textContent = JSON.parse(e.data).title;
+        });
+        
+        source.addEventListener('index', (e) => {
+            if (!preview) return;
+            const li = document.createElement('li');
+            li.textContent = JSON.parse(e.data).title;
+            previewIndex.appendChild(li);
+        });
+        
+        source.addEventListener('chapter', (e) => {
+            const data = JSON.parse(e.data);
+            chapterTexts[data.index] = (chapterTexts[data.index] || '') + data.text;
+            if (preview) previewText.textContent = chapterTexts[data.index].slice(-600);
+        });
+        
+        source.addEventListener('chapter_done', (e) => {
+            const data = JSON.parse(e.data);
+            if (preview && previewIndex.children[data.index]) {
+                previewIndex.children[data.index].classList.add('text-green-400');
+            }
+        });
+        
+        source.addEventListener('done', (e) => {
+            const data = JSON.parse(e.data);
+            finish({ success: true, book_id: data.book_id, title: data.title });
+        });
+        
+        source.addEventListener('error', (e) => {
+            // Server-sent error events carry data; connection errors do not
+            const error = e.data ? JSON.parse(e.data).error : 'Erro de conexão. Por favor, tente novamente.';
+            finish({ success: false, error: error });
+        });
+    });
+}
+
+/**
+ * Poll a generation job until it completes or fails
+ */
+async function waitForGenerationJob(jobId) {
+    const loadingText = document.querySelector('#loadingState p');
+    
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        
+        const response = await fetch(`${API_BASE}/api/jobs/${jobId}`);
+        const data = await response.json();
+        if (!data.success) {
+            return data;
+        }
+        
+        const job = data.job;
+        if (loadingText && job.chapters_total) {
+            loadingText.textContent = `A gerar o seu livro... (${job.chapters_done}/${job.chapters_total} capítulos)`;
+        }
+        
+        if (job.status === 'completed' || job.status === 'failed') {
+            if (!job.books.length) {
+                return { success: false, error: job.errors.join('\n') };
+            }
+            return {
+                success: true,
+                book_id: job.books[0].id,
+                title: job.books[0].title,
+                books: job.books
+            };
+        }
+    }
+}
+
 /**
  * Show error message
  */
@@ -286,8 +401,41 @@ function showError(message) {
     errorText.textContent = message;
 }
 
+// Listing shown on the list page: its URL and the cursor of its next page
+let booksPage = { url: null, cursor: null, count: 0, search: false };
+
+/**
+ * Remember where the next page of the listing starts and show "load more" if there is one
+ */
+function setBooksPage(url, data, count, search) {
+    booksPage = { url, cursor: data.next_cursor || null, count, search };
+    const loadMore = document.getElementById('loadMoreBooks');
+    if (loadMore) loadMore.classList.toggle('hidden', !booksPage.cursor);
+    if (search) updateResultCount(count, !!booksPage.cursor);
+}
+
+/**
+ * Append the next page of the current listing
+ */
+async function loadMoreBooks() {
+    if (!booksPage.cursor) return;
+    const separator = booksPage.url.includes('?') ? '&' : '?';
+    
+    try {
+        const response = await fetch(`${booksPage.url}${separator}cursor=${encodeURIComponent(booksPage.cursor)}`);
+        const data = await response.json();
+        
+        if (data.success) {
+            renderBooks(data.books, true);
+            setBooksPage(booksPage.url, data, booksPage.count + data.books.length, booksPage.search);
+        }
+    } catch (error) {
+        console.error('Error loading more books:', error);
+    }
+}
+
 /**
- * Load all books for the list page
+ * Load the first page of books for the list page
  */
 async function loadBooks() {
     const loadingBooks = document.getElementById('loadingBooks');
@@ -295,7 +443,8 @@ async function loadBooks() {
     const booksGrid = document.getElementById('booksGrid');
     
     try {
-        const response = await fetch(`${API_BASE}/api/books`);
+        const url = `${API_BASE}/api/books`;
+        const response = await fetch(url);
         const data = await response.json();
         
         loadingBooks.classList.add('hidden');
@@ -303,6 +452,7 @@ async function loadBooks() {
         if (data.success && data.books.length > 0) {
             booksGrid.classList.remove('hidden');
             renderBooks(data.books);
+            setBooksPage(url, data, data.books.length, false);
         } else {
             emptyState.classList.remove('hidden');
         }
@@ -316,9 +466,9 @@ async function loadBooks() {
 /**
  * Render books in the grid
  */
-function renderBooks(books) {
+function renderBooks(books, append = false) {
     const booksGrid = document.getElementById('booksGrid');
-    booksGrid.innerHTML = '';
+    if (!append) booksGrid.innerHTML = '';
     
     books.forEach((book, index) => {
         const card = createBookCard(book);
@@ -610,9 +760,11 @@ async function searchBooks() {
     if (loadingBooks) loadingBooks.classList.remove('hidden');
     if (booksGrid) booksGrid.classList.add('hidden');
     if (emptyState) emptyState.classList.add('hidden');
+    setBooksPage(null, {}, 0, false);
     
     try {
-        const response = await fetch(`${API_BASE}/api/books/search?${params}`);
+        const url = `${API_BASE}/api/books/search?${params}`;
+        const response = await fetch(url);
         const data = await response.json();
         
         if (loadingBooks) loadingBooks.classList.add('hidden');
@@ -620,7 +772,7 @@ async function searchBooks() {
         if (data.success && data.books.length > 0) {
             if (booksGrid) booksGrid.classList.remove('hidden');
             renderBooks(data.books);
-            updateResultCount(data.count);
+            setBooksPage(url, data, data.count, true);
         } else {
             if (emptyState) emptyState.classList.remove('hidden');
             updateResultCount(0);
@@ -632,10 +784,11 @@ async function searchBooks() {
     }
 }
 
-function updateResultCount(count) {
+function updateResultCount(count, more = false) {
     const countEl = document.getElementById('resultCount');
     if (countEl) {
-        countEl.textContent = `${count} livro${count !== 1 ? 's' : ''} encontrado${count !== 1 ? 's' : ''}`;
+        const plural = count !== 1 || more;
+        countEl.textContent = `${count}${more ? '+' : ''} livro${plural ? 's' : ''} encontrado${plural ? 's' : ''}`;
     }
 }
 
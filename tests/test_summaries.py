@@ -0,0 +1,91 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('LLM_FAKE_LATENCY', '0')
+os.environ.setdefault('LLM_CACHE_ENABLED', 'false')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'books.db'))
+
+import app as book_app
+from models.book import db, Book, ChapterSummary
+from utils import summaries
+
+
+def make_book(chapter_count=3):
+    with book_app.app.app_context():
+        book = Book(title='Teste', theme='tema', style='romance')
+        book.set_chapters([f'Capítulo {i + 1}' for i in range(chapter_count)])
+        book.set_chapters_content([
+            {'title': f'Capítulo {i + 1}', 'content': f'Capítulo {i + 1}\n\nA Maria foi ao mar {i}.'}
+            for i in range(chapter_count)
+        ])
+        db.session.add(book)
+        db.session.commit()
+        return book.id
+
+
+def test_concurrent_first_summaries(monkeypatch):
+    """Two requests summarizing a book for the first time both succeed and save one row per chapter"""
+    book_id = make_book()
+    # Both requests read the (empty) saved summaries before either one writes
+    barrier = threading.Barrier(2, timeout=10)
+    original = summaries.summarize_chapter
+
+    def summarize_chapter(title, content):
+        if title == 'Capítulo 1':
+            barrier.wait()
+        return original(title, content)
+
+    monkeypatch.setattr(summaries, 'summarize_chapter', summarize_chapter)
+    results, errors = [], []
+
+    def request():
+        with book_app.app.app_context():
+            try:
+                tree, _ = summaries.get_summary_tree(db.session.get(Book, book_id))
+                results.append(tree)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(results) == 2 and all(len(tree['chapters']) == 3 for tree in results)
+    with book_app.app.app_context():
+        positions = sorted(row.position for row in ChapterSummary.query.filter_by(book_id=book_id))
+    assert positions == [ChapterSummary.BOOK_POSITION, 0, 1, 2]
+
+
+def test_failed_chapter_keeps_the_others(monkeypatch):
+    """A failing chapter doesn't discard the summaries of the others; only it is redone"""
+    book_id = make_book()
+    original = summaries.summarize_chapter
+    calls = []
+    failing = {'Capítulo 2'}
+
+    def summarize_chapter(title, content):
+        calls.append(title)
+        if title in failing:
+            raise RuntimeError('LLM indisponível')
+        return original(title, content)
+
+    monkeypatch.setattr(summaries, 'summarize_chapter', summarize_chapter)
+    with book_app.app.app_context():
+        with pytest.raises(RuntimeError):
+            summaries.get_summary_tree(db.session.get(Book, book_id))
+        db.session.rollback()
+        positions = sorted(row.position for row in ChapterSummary.query.filter_by(book_id=book_id))
+        assert positions == [0, 2]
+
+        calls.clear()
+        failing.clear()
+        tree, _ = summaries.get_summary_tree(db.session.get(Book, book_id))
+    assert calls == ['Capítulo 2']
+    assert len(tree['chapters']) == 3 and tree['book']
@@ -0,0 +1,157 @@
+"""
+BookCreatorAI - Book Response Parser
+Single-pass parser for the ===SECTION=== responses of the book prompts. It reads the
+response as it streams and reports the title, index entries, synopses and chapter
+bodies as soon as each one is complete.
+"""
+
+import re
+
+# Section markers of the prompts (and the spellings the model sometimes uses instead)
+SECTIONS = {
+    'TÍTULO': 'title', 'TITULO': 'title', 'TITLE': 'title',
+    'ÍNDICE': 'index', 'INDICE': 'index', 'INDEX': 'index',
+    'SINOPSES': 'synopses', 'SYNOPSES': 'synopses',
+    'TEXTO COMPLETO': 'text', 'TEXTO': 'text', 'FULL TEXT': 'text', 'TEXT': 'text'
+}
+
+DEFAULT_TITLE = "Livro Sem Título"
+
+
+class BookStreamParser:
+    """
+    Incremental parser: feed() it the chunks of a response and it returns the
+    events that became complete, as (event, data):
+
+        ('title', {'title'})
+        ('index', {'index', 'title'})                       # one per index line
+        ('synopsis', {'number', 'synopsis'})
+        ('chapter', {'index', 'title', 'content', 'start', 'end'})
+
+    Chapters are the bodies of the text section, split at chapter headings in any of
+    chapter_words ("Capítulo 3", "Chapter III", "## Kapitel 3: ..."); start and end
+    are UTF-8 byte offsets in the response. Only complete lines are parsed, so each
+    character is looked at a constant number of times however the response is chunked.
+    """
+
+    def __init__(self, chapter_words):
+        words = '|'.join(sorted({re.escape(word) for word in chapter_words}, key=len, reverse=True))
+        self._chapter_word_re = re.compile(rf'\b(?:{words})\b', re.IGNORECASE)
+        self._heading_re = re.compile(
+            rf'^\s*(?:#+\s*|\*\*)?(?:{words})\s+(?:\d+|[IVXLCDM]+)\b', re.IGNORECASE
+        )
+
+        self.title = None
+        self.index = []
+        self.synopses = {}
+        self.chapters = []
+
+        self._section = None
+        self._pending = ''
+        self._offset = 0  # Bytes of the response consumed as complete lines
+        self._chapter = None  # Chapter being read: [title, start, lines, end]
+        self._closed = False
+
+    def feed(self, chunk):
+        """Add the next chunk of the response; returns the events it completed"""
+        if not chunk:
+            return []
+        self._pending += chunk
+        cut = self._pending.rfind('\n')
+        if cut < 0:
+            return []
+        complete, self._pending = self._pending[:cut], self._pending[cut + 1:]
+
+        events = []
+        for line in complete.split('\n'):
+            self._line(line, events)
+        return events
+
+    def close(self):
+        """End of the response: parse the last line and finish the open chapter"""
+        if self._closed:
+            return []
+        self._closed = True
+        events = []
+        if self._pending:
+            line, self._pending = self._pending, ''
+            self._line(line, events, newline=False)
+        self._finish_chapter(events)
+        return events
+
+    def _line(self, line, events, newline=True):
+        start = self._offset
+        end = start + (len(line) if line.isascii() else len(line.encode('utf-8')))
+        self._offset = end + (1 if newline else 0)
+
+        stripped = line.strip()
+        if stripped.startswith('===') and stripped.find('===', 3) > 3:
+            name_end = stripped.find('===', 3)
+            section = SECTIONS.get(stripped[3:name_end].strip().upper())
+            if section:
+                self._finish_chapter(events)
+                self._section = section
+                stripped = stripped[name_end + 3:].strip()
+                if not stripped:
+                    return
+                # The rest of the marker line is the first line of the section
+                trailing = line[len(line.rstrip()):]
+                start = end - len(trailing.encode('utf-8')) - len(stripped.encode('utf-8'))
+                line = stripped
+
+        if self._section == 'text':
+            self._text_line(line, stripped, start, end, events)
+        elif not stripped:
+            return
+        elif self._section == 'title':
+            if self.title is None:
+                self.title = stripped.strip('#*').strip() or DEFAULT_TITLE
+                events.append(('title', {'title': self.title}))
+        elif self._section == 'index':
+            entry = stripped.lstrip('-*').replace('**', '').strip()
+            if entry and (entry[0].isdigit() or self._chapter_word_re.search(entry)):
+                events.append(('index', {'index': len(self.index), 'title': entry}))
+                self.index.append(entry)
+        elif self._section == 'synopses':
+            number, sep, synopsis = stripped.partition(':')
+            if sep and number.strip().isdigit():
+                self.synopses[int(number.strip())] = synopsis.strip()
+                events.append(('synopsis', {'number': int(number.strip()), 'synopsis': synopsis.strip()}))
+
+    def _text_line(self, line, stripped, start, end, events):
+        if self._heading_re.match(stripped):
+            title = stripped.lstrip('#').replace('**', '').strip()
+            if self._chapter and self._chapter[0] is None:
+                self._chapter[0] = title
+            else:
+                self._finish_chapter(events)
+                self._chapter = [title, start, [], end]
+        elif self._chapter is None:
+            # Text before the first heading belongs to the first chapter
+            if not stripped:
+                return
+            self._chapter = [None, start, [], end]
+        if stripped or self._chapter[2]:
+            self._chapter[2].append(line)
+        if stripped:
+            self._chapter[3] = end
+
+    def _finish_chapter(self, events):
+        if self._chapter is None:
+            return
+        title, start, lines, end = self._chapter
+        self._chapter = None
+        index = len(self.chapters)
+        if title is None:
+            title = self.index[index] if index < len(self.index) else ''
+        chapter = {'index': index, 'title': title, 'content': '\n'.join(lines).strip(), 'start': start, 'end': end}
+        self.chapters.append(chapter)
+        events.append(('chapter', chapter))
+
+
+def parse(response_text, chapter_words):
+    """Parse a complete response; returns the closed BookStreamParser"""
+    parser = BookStreamParser(chapter_words)
+    parser.feed(response_text)
+    parser.close()
+    return parser
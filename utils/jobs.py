@@ -0,0 +1,190 @@
+"""
+BookCreatorAI - Background Jobs
+Runs long book generations outside the HTTP request
+"""
+
+import secrets
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+
+import config
+from models.book import db, GenerationJob, GenerationCheckpoint
+
+_executor = ThreadPoolExecutor(
+    max_workers=config.GENERATION_WORKERS,
+    thread_name_prefix='bookjob'
+)
+
+# Jobs owned by this process (queued or running); their heartbeat is kept fresh
+_active_jobs = set()
+_active_lock = threading.Lock()
+_monitor_started = False
+
+
+def new_job_id():
+    """Generate a unique job id"""
+    return secrets.token_hex(16)
+
+
+def run_in_app_context(app, func, *args, **kwargs):
+    """Call func(*args, **kwargs) inside an application context, printing any error"""
+    with app.app_context():
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            traceback.print_exc()
+            raise
+
+
+def submit(app, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) on the background executor.
+    The function runs inside an application context so it can use the database.
+    """
+    return _executor.submit(run_in_app_context, app, func, *args, **kwargs)
+
+
+def submit_job(app, runner, job_id):
+    """Run runner(job_id) in the background while this process keeps the job's heartbeat"""
+    with _active_lock:
+        _active_jobs.add(job_id)
+
+    def run():
+        try:
+            runner(job_id)
+        finally:
+            with _active_lock:
+                _active_jobs.discard(job_id)
+
+    return submit(app, run)
+
+
+def start_monitor(app, runner):
+    """
+    Start the thread that refreshes the heartbeat of this process' jobs
+    and resumes jobs whose worker died (stale heartbeat).
+    """
+    global _monitor_started
+    if _monitor_started:
+        return
+    _monitor_started = True
+
+    thread = threading.Thread(target=_monitor_loop, args=(app, runner), name='bookjob-monitor', daemon=True)
+    thread.start()
+
+
+def _monitor_loop(app, runner):
+    while True:
+        with app.app_context():
+            try:
+                touch_heartbeats()
+                for job_id in claim_stale_jobs():
+                    print(f"Resuming generation job {job_id}")
+                    submit_job(app, runner, job_id)
+            except Exception:
+                traceback.print_exc()
+                db.session.rollback()
+        time.sleep(config.JOB_HEARTBEAT_SECONDS)
+
+
+def touch_heartbeats():
+    """Mark the jobs owned by this process as alive"""
+    with _active_lock:
+        job_ids = list(_active_jobs)
+    if not job_ids:
+        return
+
+    db.session.execute(
+        update(GenerationJob)
+        .where(GenerationJob.id.in_(job_ids))
+        .values(heartbeat_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+
+def claim_stale_jobs():
+    """
+    Claim unfinished jobs whose heartbeat is older than JOB_STALE_SECONDS.
+    The claim is an atomic UPDATE, so only one worker process resumes each job.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=config.JOB_STALE_SECONDS)
+    is_stale = or_(GenerationJob.heartbeat_at == None, GenerationJob.heartbeat_at < cutoff)
+
+    candidates = GenerationJob.query.filter(
+        GenerationJob.status.in_(['queued', 'running']),
+        is_stale
+    ).all()
+
+    claimed = []
+    for job in candidates:
+        result = db.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job.id, is_stale)
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            claimed.append(job.id)
+
+    return claimed
+
+
+class JobCheckpoint:
+    """
+    Saves finished pieces of a generation job so a restarted job can skip them.
+    Must be used from the thread that owns the job's database session.
+    """
+
+    def __init__(self, job):
+        self.job = job
+
+    def _get(self, kind, language='', position=0):
+        checkpoint = self.job.checkpoints.filter_by(kind=kind, language=language, position=position).first()
+        return checkpoint.get_payload() if checkpoint else None
+
+    def _save(self, kind, payload, language='', position=0):
+        checkpoint = self.job.checkpoints.filter_by(kind=kind, language=language, position=position).first()
+        if not checkpoint:
+            checkpoint = GenerationCheckpoint(job_id=self.job.id, kind=kind, language=language, position=position)
+            db.session.add(checkpoint)
+        checkpoint.set_payload(payload)
+        self.job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+    def load_outline(self):
+        """Get the saved outline, if any"""
+        return self._get('outline')
+
+    def save_outline(self, outline):
+        """Save the book outline"""
+        self._save('outline', outline)
+
+    def load_chapters(self):
+        """Get the saved chapters as a dict index -> content"""
+        return {
+            checkpoint.position: checkpoint.get_payload()
+            for checkpoint in self.job.checkpoints.filter_by(kind='chapter')
+        }
+
+    def save_chapter(self, index, content):
+        """Save a finished chapter and update the job progress"""
+        self._save('chapter', content, position=index)
+        self.job.chapters_done = self.job.checkpoints.filter_by(kind='chapter').count()
+        db.session.commit()
+
+    def load_translation(self, language):
+        """Get a saved translation, if any"""
+        return self._get('translation', language=language)
+
+    def save_translation(self, language, book_data):
+        """Save a finished translation"""
+        self._save('translation', book_data, language=language)
+
+    def clear(self):
+        """Remove every checkpoint of the job"""
+        self.job.checkpoints.delete()
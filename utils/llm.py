@@ -0,0 +1,294 @@
+"""
+BookCreatorAI - LLM Gateway
+Single entry point for every Gemini call: model reuse, timeouts and retries
+"""
+
+import inspect
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import google.generativeai as genai
+
+import config
+from utils import llm_backends, metrics
+from utils.llm_cache import ResponseCache, cache_key
+from utils.ratelimit import RateLimiter, RateLimitExceeded, estimate_tokens
+from utils.singleflight import SingleFlight
+
+# HTTP status codes worth retrying (quota and transient server errors)
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+_models = {}
+_models_lock = threading.Lock()
+
+# Newer SDK versions take a per-request timeout; older ones need a deadline enforced here
+_supports_request_options = 'request_options' in inspect.signature(genai.GenerativeModel.generate_content).parameters
+_deadline_executor = ThreadPoolExecutor(max_workers=config.LLM_MAX_CONCURRENCY, thread_name_prefix='llm')
+
+# Requests/minute and tokens/minute quota shared by all worker processes
+limiter = RateLimiter(
+    config.RATE_LIMIT_DB,
+    requests_per_minute=config.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=config.LLM_TOKENS_PER_MINUTE,
+    max_wait=config.RATE_LIMIT_MAX_WAIT
+)
+
+# Responses of deterministic prompts, for the routes that opt in
+cache = ResponseCache(
+    config.LLM_CACHE_DB,
+    max_memory_entries=config.LLM_CACHE_MEMORY_ENTRIES,
+    max_disk_bytes=config.LLM_CACHE_MAX_BYTES
+)
+
+# Identical cacheable prompts in flight at the same time share one upstream call
+_single_flight = SingleFlight()
+
+
+class LLMError(Exception):
+    """Raised when a Gemini call fails after all retries"""
+
+
+class DeadlineExceeded(Exception):
+    """A call (or the next chunk of a stream) took longer than its deadline; not retried"""
+
+
+class LLMResponse:
+    """Text of a Gemini response plus the metadata the gateway tracks"""
+
+    def __init__(self, text, model=None, cached=False, usage=None):
+        self.text = text
+        self.model = model
+        self.cached = cached
+        self.usage = usage  # see get_usage(); None for cached responses
+
+    def __repr__(self):
+        return f'<LLMResponse {self.model} {len(self.text)} chars>'
+
+
+def configure(api_key):
+    """Configure the Gemini client once for the whole process"""
+    genai.configure(api_key=api_key)
+
+
+def get_model(model_name=None):
+    """
+    Get a shared model instance (its client and transport are reused).
+    The model comes from the backend chosen by config.LLM_BACKEND (see utils.llm_backends).
+    """
+    model_name = model_name or config.LLM_MODEL
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = llm_backends.create_model(model_name)
+        return _models[model_name]
+
+
+def is_retryable(error):
+    """Check if a Gemini error is a quota or transient server error"""
+    if isinstance(error, DeadlineExceeded):
+        return False  # The abandoned request may still be running; don't pile up more
+    if isinstance(error, (FutureTimeoutError, TimeoutError)):
+        return True
+    code = getattr(error, 'code', None)
+    if callable(code):
+        # gRPC errors expose code() instead of an HTTP status
+        code = getattr(code(), 'name', None)
+        return code in ('RESOURCE_EXHAUSTED', 'UNAVAILABLE', 'INTERNAL', 'DEADLINE_EXCEEDED')
+    return code in RETRYABLE_CODES
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter"""
+    ceiling = min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def get_usage(response, prompt, text):
+    """
+    Token counts and cost of a response, from its usage_metadata.
+    Counts are estimated from the text lengths when the metadata is missing.
+    """
+    metadata = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(metadata, 'prompt_token_count', None)
+    output_tokens = getattr(metadata, 'candidates_token_count', None)
+    estimated = not prompt_tokens
+    if estimated:
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+    output_tokens = output_tokens or 0
+    return {
+        'prompt_tokens': prompt_tokens,
+        'output_tokens': output_tokens,
+        'cost': metrics.estimate_cost(prompt_tokens, output_tokens),
+        'estimated': estimated
+    }
+
+
+def _with_deadline(func, timeout):
+    """
+    Run func on the deadline executor and wait at most timeout seconds once it has
+    started (and at most timeout seconds for a free thread). Raises DeadlineExceeded.
+    """
+    running = threading.Event()
+
+    def run():
+        running.set()
+        return func()
+
+    future = _deadline_executor.submit(run)
+    if not running.wait(timeout) and future.cancel():
+        raise DeadlineExceeded(f"no free LLM thread after {timeout:g}s")
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        raise DeadlineExceeded(f"no response after {timeout:g}s") from None
+
+
+def _call(model, prompt, generation_config, timeout, stream):
+    kwargs = {'generation_config': generation_config, 'stream': stream}
+    if _supports_request_options:
+        return model.generate_content(prompt, request_options={'timeout': timeout}, **kwargs)
+    if stream:
+        # The chunks are bounded by stream() as they are read
+        return model.generate_content(prompt, **kwargs)
+    return _with_deadline(lambda: model.generate_content(prompt, **kwargs), timeout)
+
+
+def _with_retries(route, model_name, prompt, func, budget=None):
+    """
+    Call func, retrying quota and transient errors with backoff. No retry starts
+    once it would end past budget seconds from the first attempt (default LLM_TIMEOUT).
+    """
+    budget = budget or config.LLM_TIMEOUT
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            # Queue for quota instead of sending a request that would be rejected
+            limiter.acquire(estimate_tokens(prompt))
+            return func()
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            if attempt >= config.LLM_MAX_RETRIES or not is_retryable(e):
+                raise LLMError(f"{route or 'llm'}: {e}") from e
+            delay = backoff_delay(attempt)
+            if time.monotonic() - started + delay > budget:
+                raise LLMError(f"{route or 'llm'}: {e} (no time left to retry)") from e
+            print(f"LLM retry {attempt + 1}/{config.LLM_MAX_RETRIES} for {route} in {delay:.1f}s: {e}")
+            metrics.record_retry(route, model_name)
+            time.sleep(delay)
+            attempt += 1
+
+
+def generate(prompt, route=None, model=None, timeout=None, generation_config=None, cache_ttl=None):
+    """
+    Generate a complete response for a prompt.
+    Quota and transient errors are retried with jittered exponential backoff.
+    Routes whose prompt fully determines the answer pass cache_ttl (seconds)
+    to reuse responses keyed on (model, prompt, generation_config); concurrent
+    identical cacheable calls also share a single upstream request.
+    Every call is recorded in utils.metrics.
+    Returns an LLMResponse.
+    """
+    model_name = model or config.LLM_MODEL
+    timeout = timeout or config.LLM_TIMEOUT
+
+    def attempt():
+        response = _call(get_model(model_name), prompt, generation_config, timeout, stream=False)
+        return LLMResponse(response.text, model=model_name, usage=get_usage(response, prompt, response.text))
+
+    def fetch():
+        started = time.monotonic()
+        try:
+            response = _with_retries(route, model_name, prompt, attempt, budget=timeout)
+        except Exception:
+            metrics.record_call(route, model_name, time.monotonic() - started, error=True)
+            raise
+        metrics.record_call(route, model_name, time.monotonic() - started, usage=response.usage)
+        return response
+
+    def cached(text):
+        metrics.record_call(route, model_name, 0, cached=True)
+        return LLMResponse(text, model=model_name, cached=True)
+
+    if not (cache_ttl and config.LLM_CACHE_ENABLED):
+        return fetch()
+
+    key = cache_key(model_name, prompt, generation_config)
+    text = cache.get(key)
+    if text is not None:
+        return cached(text)
+
+    def fetch_once():
+        # Threads of this process are coalesced by the single-flight map;
+        # other worker processes are coalesced by a lock row in the shared cache store
+        lease = timeout + config.LLM_RETRY_MAX_DELAY
+        while True:
+            text = cache.get(key)
+            if text is not None:
+                return cached(text)
+            if cache.try_lock(key, lease):
+                try:
+                    response = fetch()
+                    if response.text:
+                        cache.set(key, response.text, cache_ttl)
+                    return response
+                finally:
+                    cache.unlock(key)
+            time.sleep(config.LLM_SINGLEFLIGHT_POLL)
+
+    return _single_flight.do(key, fetch_once)
+
+
+def stream(prompt, route=None, model=None, timeout=None, generation_config=None, meter=None):
+    """
+    Generate a response as a stream of text chunks.
+    Errors are only retried until the first chunk has been received. The first chunk
+    must arrive within timeout and each later one within LLM_STREAM_CHUNK_TIMEOUT
+    (DeadlineExceeded otherwise).
+    The call is recorded in utils.metrics once the stream ends, fails or is closed
+    early by its consumer; pass a UsageMeter as meter when the generator is consumed
+    outside the context that should pay for it.
+    """
+    model_name = model or config.LLM_MODEL
+    timeout = timeout or config.LLM_TIMEOUT
+
+    def start():
+        iterator = iter(_call(get_model(model_name), prompt, generation_config, timeout, stream=True))
+        first = _with_deadline(lambda: next(iterator, None), timeout)
+        return first, iterator
+
+    started = time.monotonic()
+    try:
+        first, iterator = _with_retries(route, model_name, prompt, start, budget=timeout)
+    except Exception:
+        metrics.record_call(route, model_name, time.monotonic() - started, error=True, meter=meter)
+        raise
+    if first is None:
+        metrics.record_call(route, model_name, time.monotonic() - started, usage=get_usage(None, prompt, ''), meter=meter)
+        return
+
+    # The last chunk carries the usage metadata of the whole response
+    last = first
+    parts = [first.text or ""]
+    failed = False
+    try:
+        yield parts[0]
+        while True:
+            chunk = _with_deadline(lambda: next(iterator, None), config.LLM_STREAM_CHUNK_TIMEOUT)
+            if chunk is None:
+                break
+            last = chunk
+            parts.append(chunk.text or "")
+            yield parts[-1]
+    except Exception as e:
+        failed = True
+        raise LLMError(f"{route or 'llm'}: {e}") from e
+    finally:
+        # Also runs on GeneratorExit when the consumer stops early: the tokens received were paid for
+        metrics.record_call(
+            route, model_name, time.monotonic() - started,
+            usage=get_usage(last, prompt, ''.join(parts)), error=failed, meter=meter
+        )
@@ -0,0 +1,301 @@
+"""
+BookCreatorAI - LLM Backends
+Model objects behind the gateway, selected by config.LLM_BACKEND:
+gemini (the real API), fake (canned offline responses), record (gemini,
+saving every response as a cassette) and replay (serves recorded cassettes)
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import google.generativeai as genai
+
+import config
+from utils.llm_cache import cache_key
+from utils.ratelimit import estimate_tokens
+
+BACKENDS = ('gemini', 'fake', 'record', 'replay')
+
+# Characters per streamed chunk of the fake and replay backends
+CHUNK_SIZE = 80
+
+
+class CassetteNotFound(LookupError):
+    """Raised in replay mode when a prompt was never recorded"""
+
+
+class UsageMetadata:
+    """Token counts in the shape of Gemini's usage_metadata"""
+
+    def __init__(self, prompt_token_count=0, candidates_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class StaticResponse:
+    """A complete response (or one streamed chunk) with .text and .usage_metadata"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class StaticStream:
+    """Streams a known text in chunks, pacing them at tokens_per_second (0 = no delay)"""
+
+    def __init__(self, text, usage_metadata, tokens_per_second=0):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self.tokens_per_second = tokens_per_second
+
+    def __iter__(self):
+        chunks = [self.text[i:i + CHUNK_SIZE] for i in range(0, len(self.text), CHUNK_SIZE)] or ['']
+        for i, chunk in enumerate(chunks):
+            if self.tokens_per_second:
+                time.sleep(estimate_tokens(chunk) / self.tokens_per_second)
+            # Like Gemini, only the last chunk carries the usage of the whole response
+            yield StaticResponse(chunk, self.usage_metadata if i == len(chunks) - 1 else None)
+
+
+# ==================== FAKE ====================
+
+FAKE_WORDS = (
+    'a', 'o', 'de', 'que', 'e', 'do', 'da', 'em', 'um', 'uma', 'para', 'com', 'não', 'se', 'por',
+    'mais', 'como', 'mas', 'ao', 'ele', 'ela', 'das', 'tinha', 'sobre', 'noite', 'cidade', 'porta',
+    'caminho', 'silêncio', 'mar', 'luz', 'sombra', 'olhos', 'mão', 'voz', 'tempo', 'segredo', 'casa',
+    'Maria', 'João', 'Lisboa', 'castelo', 'floresta', 'carta', 'memória', 'vento', 'chuva', 'rio'
+)
+
+
+def _sentence(words):
+    text = ' '.join(words)
+    return text[0].upper() + text[1:] + '.'
+
+
+def _fake_words(rng, count):
+    """count words of pseudo-Portuguese prose, split into sentences and paragraphs"""
+    sentences = []
+    words = []
+    for _ in range(count):
+        words.append(rng.choice(FAKE_WORDS))
+        if len(words) >= rng.randint(8, 18):
+            sentences.append(_sentence(words))
+            words = []
+    if words:
+        sentences.append(_sentence(words))
+    paragraphs = [' '.join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+    return '\n\n'.join(paragraphs)
+
+
+def _fake_chapter_count(prompt):
+    for pattern in (r'Número de capítulos: (\d+)', r'EXATAMENTE (\d+) capítulos'):
+        match = re.search(pattern, prompt)
+        if match:
+            return int(match.group(1))
+    # Translation prompts list the original index instead
+    match = re.search(r'Índice:\n(.*?)\n\n', prompt, re.S)
+    if match:
+        return len([line for line in match.group(1).split('\n') if line.strip()])
+    return 3
+
+
+def _fake_sections(prompt, rng):
+    """Answer a prompt that asks for ===SECTION=== blocks with every section it names"""
+    num_chapters = _fake_chapter_count(prompt)
+    match = re.search(r'===ÍNDICE===\n(\S+) 1:', prompt)
+    chapter_word = match.group(1) if match else 'Capítulo'
+    chapters = [f"{chapter_word} {i + 1}: {_fake_words(rng, 3).rstrip('.')}" for i in range(num_chapters)]
+
+    parts = []
+    for section in dict.fromkeys(re.findall(r'===([^=\n]+)===', prompt)):
+        if section == 'TÍTULO':
+            body = _fake_words(rng, 4).rstrip('.')
+        elif section == 'ÍNDICE':
+            body = '\n'.join(chapters)
+        elif section == 'SINOPSES':
+            body = '\n'.join(f"{i + 1}: {_fake_words(rng, 25)}" for i in range(num_chapters))
+        elif section == 'GLOSSÁRIO':
+            body = 'Maria = Maria\nJoão = João\nLisboa = Lisboa'
+        elif section.startswith('FORMATO'):
+            continue
+        else:
+            body = '\n\n'.join(f"{title}\n\n{_fake_words(rng, 150)}" for title in chapters)
+        parts.append(f"==={section}===\n{body}")
+    return '\n\n'.join(parts)
+
+
+def _fake_json(prompt, rng):
+    """Fill the JSON template shown in the prompt, repeating array items as many times as asked"""
+    start = min((i for i in (prompt.find('[', prompt.find('JSON')), prompt.find('{', prompt.find('JSON'))) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    # Templates use "..." lines to mean "more items"
+    template = re.sub(r',?\s*\n\s*\.\.\.\s*\n', '\n', prompt[start:])
+    try:
+        value, _ = json.JSONDecoder().raw_decode(template)
+    except ValueError:
+        return None
+
+    if isinstance(value, list) and value:
+        match = re.search(r'(\d+)\s+(?:perguntas|temas|personagens|variações|enredos|questões)', prompt)
+        count = int(match.group(1)) if match else 3
+        value = [_fake_fill(value[0], rng, i) for i in range(count)]
+    else:
+        value = _fake_fill(value, rng, 0)
+    return json.dumps(value, ensure_ascii=False, indent=2)
+
+
+def _fake_fill(value, rng, index):
+    if isinstance(value, dict):
+        return {key: _fake_fill(item, rng, index) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fake_fill(item, rng, index) for item in value]
+    if isinstance(value, str):
+        return f"{value.rstrip('.? ')} {index + 1}" if len(value) < 30 else _fake_words(rng, 12)
+    return value
+
+
+def fake_text(prompt):
+    """
+    Deterministic canned answer for a prompt: the same prompt always gets the same text.
+    Sectioned prompts (===TÍTULO=== ...) get every section they ask for, JSON prompts get
+    their template filled in, and everything else gets prose of the requested length.
+    """
+    rng = random.Random(cache_key('fake', prompt))
+    if '===TÍTULO===' in prompt or '===ÍNDICE===' in prompt:
+        return _fake_sections(prompt, rng)
+
+    if 'JSON' in prompt:
+        text = _fake_json(prompt, rng)
+        if text is not None:
+            return text
+
+    match = re.search(r'aproximadamente (\d+) palavras', prompt)
+    words = min(int(match.group(1)), 20000) if match else 120
+    text = _fake_words(rng, words)
+
+    # Chapter prompts ask for the text to start with the chapter title
+    match = re.search(r'(?:começando com|título traduzido:) "([^"]+)"', prompt)
+    if match:
+        text = f"{match.group(1)}\n\n{text}"
+    return text
+
+
+class FakeModel:
+    """Offline stand-in for GenerativeModel with simulated latency and token rate"""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        text = fake_text(prompt)
+        usage = UsageMetadata(estimate_tokens(prompt), estimate_tokens(text))
+        time.sleep(config.LLM_FAKE_LATENCY)
+        if stream:
+            return StaticStream(text, usage, config.LLM_FAKE_TOKENS_PER_SECOND)
+        if config.LLM_FAKE_TOKENS_PER_SECOND:
+            time.sleep(usage.candidates_token_count / config.LLM_FAKE_TOKENS_PER_SECOND)
+        return StaticResponse(text, usage)
+
+
+# ==================== RECORD / REPLAY ====================
+
+class CassetteStore:
+    """One JSON file per response in LLM_CASSETTE_DIR, named by the hash of model, prompt and config"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def load(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, cassette):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write then rename so a concurrent replay never reads a partial file
+            temp_path = self._path(key) + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(cassette, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self._path(key))
+
+
+def _cassette(model_name, prompt, text, usage_metadata):
+    return {
+        'model': model_name,
+        'prompt_preview': prompt[:200],
+        'text': text,
+        'prompt_token_count': getattr(usage_metadata, 'prompt_token_count', None) or estimate_tokens(prompt),
+        'candidates_token_count': getattr(usage_metadata, 'candidates_token_count', None) or estimate_tokens(text)
+    }
+
+
+class RecordingModel:
+    """Calls Gemini and saves each complete response as a cassette"""
+
+    def __init__(self, model_name, store):
+        self.model_name = model_name
+        self.store = store
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        key = cache_key(self.model_name, prompt, generation_config)
+        response = self.model.generate_content(prompt, generation_config=generation_config, stream=stream, **kwargs)
+        if not stream:
+            self.store.save(key, _cassette(self.model_name, prompt, response.text, response.usage_metadata))
+            return response
+        return self._record_stream(key, prompt, response)
+
+    def _record_stream(self, key, prompt, response):
+        parts = []
+        usage_metadata = None
+        for chunk in response:
+            parts.append(chunk.text or '')
+            usage_metadata = getattr(chunk, 'usage_metadata', None) or usage_metadata
+            yield chunk
+        self.store.save(key, _cassette(self.model_name, prompt, ''.join(parts), usage_metadata))
+
+
+class ReplayModel:
+    """Serves recorded cassettes; prompts that were never recorded raise CassetteNotFound"""
+
+    def __init__(self, model_name, store):
+        self.model_name = model_name
+        self.store = store
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        key = cache_key(self.model_name, prompt, generation_config)
+        cassette = self.store.load(key)
+        if cassette is None:
+            raise CassetteNotFound(f"Sem gravação para este prompt ({key[:12]}) em {self.store.directory}")
+
+        usage = UsageMetadata(cassette['prompt_token_count'], cassette['candidates_token_count'])
+        if stream:
+            return StaticStream(cassette['text'], usage)
+        return StaticResponse(cassette['text'], usage)
+
+
+def create_model(model_name):
+    """Create the model object for config.LLM_BACKEND"""
+    backend = config.LLM_BACKEND
+    if backend == 'gemini':
+        return genai.GenerativeModel(model_name)
+    if backend == 'fake':
+        return FakeModel(model_name)
+    if backend == 'record':
+        return RecordingModel(model_name, CassetteStore(config.LLM_CASSETTE_DIR))
+    if backend == 'replay':
+        return ReplayModel(model_name, CassetteStore(config.LLM_CASSETTE_DIR))
+    raise ValueError(f"LLM_BACKEND inválido: {backend} (opções: {', '.join(BACKENDS)})")
@@ -0,0 +1,180 @@
+"""
+BookCreatorAI - LLM Response Cache
+Content-addressed cache: in-process LRU in front of a SQLite store shared by all workers
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(model, prompt, generation_config=None):
+    """Hash of everything that determines a response"""
+    payload = json.dumps(
+        {'model': model, 'prompt': prompt, 'config': generation_config or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of response texts.
+    The memory tier is an LRU bounded by entry count; the disk tier is a SQLite
+    file bounded by total bytes. Both honour per-entry expiry times.
+    """
+
+    # Disk size is checked every EVICT_EVERY writes instead of on each one
+    EVICT_EVERY = 50
+
+    def __init__(self, path, max_memory_entries=500, max_disk_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> (expires_at, text)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        connection = self._connect()
+        connection.execute('''CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )''')
+        connection.execute('CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses (accessed_at)')
+        connection.execute('''CREATE TABLE IF NOT EXISTS inflight (
+            key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )''')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def _remember(self, key, expires_at, text):
+        with self._lock:
+            self._memory[key] = (expires_at, text)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Get a cached text, or None if it is missing or expired"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                del self._memory[key]
+
+        connection = self._connect()
+        row = connection.execute('SELECT value, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if not row:
+            return None
+        if row[1] <= now:
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            return None
+
+        connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        self._remember(key, row[1], row[0])
+        return row[0]
+
+    def set(self, key, text, ttl):
+        """Store a text for ttl seconds"""
+        now = time.time()
+        expires_at = now + ttl
+        self._remember(key, expires_at, text)
+
+        connection = self._connect()
+        connection.execute(
+            'INSERT OR REPLACE INTO responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+            (key, text, len(text.encode('utf-8')), expires_at, now)
+        )
+
+        # Shared by request and chapter pool threads; counted under the lock so evictions stay on schedule
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def try_lock(self, key, lease):
+        """
+        Take the cross-worker lock for fetching key, for at most lease seconds.
+        Returns False if another worker holds a live lock.
+        """
+        connection = self._connect()
+        now = time.time()
+        owner = self._owner()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT expires_at FROM inflight WHERE key = ?', (key,)).fetchone()
+            if row and row[0] > now:
+                connection.execute('COMMIT')
+                return False
+            connection.execute(
+                'INSERT OR REPLACE INTO inflight (key, owner, expires_at) VALUES (?, ?, ?)',
+                (key, owner, now + lease)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return True
+
+    def unlock(self, key):
+        """
+        Release the cross-worker lock for key, if this thread still holds it.
+        A lock whose lease expired may have been taken by another worker since.
+        """
+        self._connect().execute('DELETE FROM inflight WHERE key = ? AND owner = ?', (key, self._owner()))
+
+    @staticmethod
+    def _owner():
+        """Lock owner: the calling process and thread"""
+        return f'{os.getpid()}:{threading.get_ident()}'
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones until the store fits in max_disk_bytes"""
+        connection = self._connect()
+        connection.execute('DELETE FROM responses WHERE expires_at <= ?', (time.time(),))
+
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+
+        excess = total - self.max_disk_bytes
+        freed = 0
+        victims = []
+        for key, size in connection.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        connection.executemany('DELETE FROM responses WHERE key = ?', victims)
+
+        with self._lock:
+            for (key,) in victims:
+                self._memory.pop(key, None)
@@ -0,0 +1,272 @@
+"""
+BookCreatorAI - JSON Responses
+Finds the JSON payload in a model response, repairs the usual defects (code fences,
+smart quotes, trailing commas, raw newlines in strings, truncation) and checks it
+against the shape each endpoint expects. Truncated lists are completed by asking
+only for the missing items.
+"""
+
+import json
+import re
+
+from utils import llm, metrics
+from utils.text import normalize
+
+_FENCE_RE = re.compile(r'```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|$)', re.DOTALL)
+
+_OPEN_QUOTES = '“„'
+_CLOSE_QUOTES = '”'
+
+
+class JSONExtractionError(ValueError):
+    """The response has no usable JSON payload"""
+
+
+def _payload_start(text):
+    """Position of the first [ or { of the payload, inside a code fence if there is one"""
+    match = _FENCE_RE.search(text)
+    if match and re.search(r'[\[{]', match.group(1)):
+        text = match.group(1)
+    starts = [i for i in (text.find('['), text.find('{')) if i >= 0]
+    if not starts:
+        raise JSONExtractionError("A resposta não contém JSON")
+    return text, min(starts)
+
+
+def _repair(text, start):
+    """
+    Scan the payload once and rewrite it as strict JSON.
+    Returns (candidates, truncated): candidates are repaired texts to try in order
+    (the whole payload, then shorter cuts when it was truncated).
+    """
+    out = []
+    stack = []
+    cuts = []  # (length of out, stack) at commas and closed values, for truncated payloads
+    in_string = False
+    closer = '"'
+    escape = False
+
+    for ch in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == '\\':
+                escape = True
+                out.append(ch)
+            elif ch == closer or (closer != '"' and ch in _CLOSE_QUOTES + '"'):
+                in_string = False
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')  # Straight quote inside a string opened with a smart quote
+            elif ch == '\n':
+                out.append('\\n')
+            elif ch in '\r\t':
+                out.append(' ')
+            else:
+                out.append(ch)
+            continue
+
+        if ch == '"' or ch in _OPEN_QUOTES + _CLOSE_QUOTES:
+            in_string = True
+            closer = '"' if ch == '"' else _CLOSE_QUOTES
+            out.append('"')
+        elif ch in '[{':
+            stack.append(ch)
+            out.append(ch)
+        elif ch in ']}':
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                return [''.join(out)], False
+            cuts.append((len(out), tuple(stack)))
+        elif ch == ',':
+            cuts.append((len(out), tuple(stack)))
+            out.append(ch)
+        else:
+            out.append(ch)
+
+    # Truncated. A list keeps its complete items only (the missing ones can be asked
+    # for again); an object is closed where it stopped, then cut back value by value.
+    candidates = []
+    if stack and stack[0] == '[':
+        candidates.extend(_close(out[:length], list(cut_stack)) for length, cut_stack in reversed(cuts) if len(cut_stack) == 1)
+        candidates.append('[]')
+    else:
+        if in_string:
+            candidates.append(_close(out + ['"'], stack))
+        candidates.append(_close(list(out), stack))
+        candidates.extend(_close(out[:length], list(cut_stack)) for length, cut_stack in reversed(cuts))
+    return candidates, True
+
+
+def _drop_trailing_comma(out):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ',':
+        del out[i]
+
+
+def _close(out, stack):
+    text = ''.join(out).rstrip()
+    if text.endswith(','):
+        text = text[:-1]
+    if text.endswith(':'):
+        text += ' null'
+    return text + ''.join(']' if opener == '[' else '}' for opener in reversed(stack))
+
+
+def parse(text):
+    """
+    Parse the JSON payload of a model response.
+    Returns (value, truncated); truncated is True when the payload was cut off and
+    only its complete part could be recovered.
+    """
+    text, start = _payload_start(text or '')
+    candidates, truncated = _repair(text, start)
+    for candidate in candidates:
+        try:
+            return json.loads(candidate), truncated
+        except json.JSONDecodeError:
+            continue
+    raise JSONExtractionError("JSON inválido na resposta")
+
+
+class Schema:
+    """
+    Expected shape of a response: an object, or a list of objects (many=True),
+    with fields {name: type}. Values are converted to the field type, missing
+    fields get an empty value, and list items without every required field are dropped.
+    """
+
+    EMPTY = {str: '', int: 0, float: 0.0, list: [], dict: {}}
+
+    def __init__(self, fields, required=(), many=False):
+        self.fields = fields
+        self.required = required
+        self.many = many
+
+    def _convert(self, value, kind):
+        if value is None:
+            return type(self.EMPTY[kind])(self.EMPTY[kind])
+        if kind is str:
+            if isinstance(value, list):
+                return ', '.join(str(item) for item in value)
+            return str(value).strip()
+        if kind is list:
+            if isinstance(value, list):
+                return value
+            return [value] if str(value).strip() else []
+        if kind is dict:
+            return value if isinstance(value, dict) else {}
+        if isinstance(value, str):
+            value = value.strip().replace(',', '.')  # "7,5"
+        try:
+            return kind(float(value)) if kind is int else kind(value)
+        except (TypeError, ValueError):
+            return self.EMPTY[kind]
+
+    def clean_item(self, item):
+        """The item with every field converted, or None when it is not usable"""
+        if not isinstance(item, dict):
+            return None
+        cleaned = {name: self._convert(item.get(name), kind) for name, kind in self.fields.items()}
+        if any(cleaned[name] in ('', [], {}) for name in self.required):
+            return None
+        return cleaned
+
+    def clean(self, value):
+        """Check and normalize a parsed payload; raises JSONExtractionError if unusable"""
+        if not self.many:
+            if isinstance(value, list) and len(value) == 1:
+                value = value[0]
+            cleaned = self.clean_item(value)
+            if cleaned is None:
+                raise JSONExtractionError("A resposta não tem o formato esperado")
+            return cleaned
+
+        if isinstance(value, dict):
+            value = [value]
+        items = []
+        seen = set()
+        key = (self.required or tuple(self.fields))[0]
+        for item in value if isinstance(value, list) else []:
+            cleaned = self.clean_item(item)
+            if cleaned is None:
+                continue
+            identity = normalize(str(cleaned[key]))
+            if identity in seen:
+                continue
+            seen.add(identity)
+            items.append(cleaned)
+        return items
+
+
+# Shapes of the JSON endpoints
+THEMES = Schema({'title': str, 'description': str, 'appeal': str}, required=('title',), many=True)
+PLOTS = Schema(
+    {'title': str, 'synopsis': str, 'tone': str, 'conflicts': list, 'chapters': list},
+    required=('title', 'synopsis'), many=True
+)
+ANALYSIS = Schema(
+    {
+        'scores': dict, 'overall_score': float, 'strengths': list, 'improvements': list,
+        'detected_tone': str, 'detected_genre': str, 'summary': str
+    },
+    required=('scores',)
+)
+CHARACTERS = Schema(
+    {'name': str, 'role': str, 'description': str, 'traits': str, 'arc': str},
+    required=('name',), many=True
+)
+WORLD = Schema({
+    'time_period': str, 'location': str, 'atmosphere': str, 'rules': str,
+    'technology': str, 'society': str, 'custom': str
+})
+CHARACTER_LIST = Schema({'name': str, 'role': str}, required=('name',), many=True)
+QUIZ_QUESTIONS = Schema(
+    {'question': str, 'options': list, 'correct': int, 'explanation': str},
+    required=('question', 'options'), many=True
+)
+
+
+def generate(prompt, schema, route=None, count=None, **kwargs):
+    """
+    Call llm.generate and return (value, usage) with the payload cleaned by schema.
+    For lists with a count, a response that was cut off (or lost items to validation)
+    is completed with one more call that asks only for the missing items.
+    usage is in the UsageMeter.to_dict() format, for Book.add_usage.
+    Raises JSONExtractionError when no usable payload is found.
+    """
+    usage = metrics.UsageMeter()
+    response = llm.generate(prompt, route=route, **kwargs)
+    if response.usage:
+        usage.add(response.usage)
+
+    value, truncated = parse(response.text)
+    value = schema.clean(value)
+
+    if schema.many and count and len(value) < count:
+        missing = count - len(value)
+        follow_up = f"""{prompt}
+
+=== CONTINUAÇÃO ===
+A resposta anterior {'foi interrompida' if truncated else 'ficou incompleta'}. Estes {len(value)} itens já estão feitos:
+{json.dumps(value, ensure_ascii=False)}
+
+Gera APENAS os {missing} itens em falta, diferentes destes, como um array JSON no mesmo formato."""
+        try:
+            response = llm.generate(follow_up, route=route, **kwargs)
+            if response.usage:
+                usage.add(response.usage)
+            extra, _ = parse(response.text)
+            value = schema.clean(value + schema.clean(extra))[:count]
+        except (JSONExtractionError, llm.LLMError):
+            pass  # Keep the items already recovered
+
+    if schema.many and not value:
+        raise JSONExtractionError("A resposta não tem itens válidos")
+    return value, usage.to_dict()
@@ -0,0 +1,204 @@
+"""
+BookCreatorAI - Character Mentions
+Index of the paragraphs where each character appears, kept per chapter so an edit
+only rescans the chapter that changed
+"""
+
+import hashlib
+import re
+from collections import Counter
+
+from utils.passages import STOPWORDS
+
+# Names found automatically must appear at least this often mid-sentence
+MIN_AUTO_MENTIONS = 3
+MAX_AUTO_NAMES = 20
+
+# Capitalized words (optionally several in a row: "Ana Sofia Reis")
+_NAME_RE = re.compile(r"\b[A-ZÀ-Ý][a-zà-ÿ'’]+(?:\s+[A-ZÀ-Ý][a-zà-ÿ'’]+)*\b")
+_DIALOGUE_RE = re.compile(r'(^|\n)\s*[—–-]|["“«]')
+
+# Capitalized words that are never character names
+NON_NAMES = {
+    'capitulo', 'capítulo', 'chapter', 'chapitre', 'kapitel', 'capitolo',
+    'senhor', 'senhora', 'deus', 'sim', 'não', 'mas', 'então', 'depois', 'quando', 'ainda'
+}
+
+
+def split_paragraphs(content):
+    """Paragraphs of a chapter; their positions are what the index stores"""
+    return [paragraph.strip() for paragraph in re.split(r'\n\s*\n', content or '') if paragraph.strip()]
+
+
+def chapter_hash(content):
+    return hashlib.sha1((content or '').encode('utf-8')).hexdigest()
+
+
+def count_name_candidates(paragraphs):
+    """Count capitalized words and phrases that are not at the start of a sentence"""
+    counts = Counter()
+    for paragraph in paragraphs:
+        for match in _NAME_RE.finditer(paragraph):
+            before = paragraph[:match.start()].rstrip()
+            if not before or before[-1] in '.!?…:—–-"“«\n':
+                continue
+            name = match.group(0)
+            if name.lower() in NON_NAMES or name.lower() in STOPWORDS:
+                continue
+            counts[name] += 1
+    return counts
+
+
+def _aliases(names):
+    """Map every way of writing a name (full name and first name) to the name"""
+    aliases = {}
+    for name in names:
+        aliases.setdefault(name, name)
+        first = name.split()[0]
+        if first != name and len(first) > 2 and first.lower() not in NON_NAMES:
+            aliases.setdefault(first, name)
+    return aliases
+
+
+def _scan(paragraphs, names):
+    """name -> positions of the paragraphs that mention it"""
+    if not names:
+        return {}
+    aliases = _aliases(names)
+    pattern = re.compile(r'\b(' + '|'.join(sorted((re.escape(a) for a in aliases), key=len, reverse=True)) + r')\b')
+
+    found = {}
+    for position, paragraph in enumerate(paragraphs):
+        for name in {aliases[match] for match in pattern.findall(paragraph)}:
+            found.setdefault(name, []).append(position)
+    return found
+
+
+def build_index(chapters_content, declared_names, previous=None):
+    """
+    Build or update a mention index:
+    {'names': [...], 'chapters': [{'hash', 'candidates', 'mentions': {name: [paragraph positions]}}]}
+    Names are the declared ones (Book.get_characters()) plus the capitalized names that recur
+    across the book. Chapters whose hash is unchanged are only scanned for names they were
+    not scanned for yet. Chapters may carry their 'hash' to save hashing their content.
+    """
+    previous_chapters = (previous or {}).get('chapters', [])
+    previous_names = set((previous or {}).get('names', []))
+
+    chapters = []
+    paragraphs_by_chapter = []
+    for i, chapter in enumerate(chapters_content):
+        content = chapter.get('content', '')
+        digest = chapter.get('hash') or chapter_hash(content)
+        old = previous_chapters[i] if i < len(previous_chapters) else None
+        if old and old.get('hash') == digest:
+            # Split again only if there are new names to scan for
+            paragraphs_by_chapter.append(None)
+            chapters.append({'hash': digest, 'candidates': old['candidates'], 'mentions': old['mentions'], 'fresh': False})
+        else:
+            paragraphs = split_paragraphs(content)
+            paragraphs_by_chapter.append(paragraphs)
+            chapters.append({'hash': digest, 'candidates': count_name_candidates(paragraphs), 'mentions': {}, 'fresh': True})
+
+    totals = Counter()
+    for chapter in chapters:
+        totals.update(chapter['candidates'])
+    names = choose_names(declared_names, totals)
+
+    for chapter, paragraphs, source in zip(chapters, paragraphs_by_chapter, chapters_content):
+        pending = names if chapter.pop('fresh') else [name for name in names if name not in previous_names]
+        chapter['mentions'] = {name: positions for name, positions in chapter['mentions'].items() if name in names}
+        if pending:
+            if paragraphs is None:
+                paragraphs = split_paragraphs(source.get('content', ''))
+            chapter['mentions'].update(_scan(paragraphs, pending))
+        chapter['candidates'] = dict(chapter['candidates'])
+
+    return {'names': names, 'chapters': chapters}
+
+
+def choose_names(declared_names, candidate_totals):
+    """The declared names plus the capitalized names that recur across the book"""
+    totals = Counter(candidate_totals)
+    auto_names = [name for name, count in totals.most_common(MAX_AUTO_NAMES) if count >= MIN_AUTO_MENTIONS]
+    return list(dict.fromkeys([name.strip() for name in declared_names if name and name.strip()] + auto_names))
+
+
+def index_summary(index):
+    """The book-wide part of an index: its names and the candidate counts of all chapters"""
+    totals = Counter()
+    for chapter in index['chapters']:
+        totals.update(chapter['candidates'])
+    return {'names': index['names'], 'candidates': dict(totals)}
+
+
+def reindex_chapter(summary, old_entry, content, digest, declared_names):
+    """
+    Rescan one edited chapter of an index whose chapter entries are stored apart
+    from its summary (index_summary). Returns (summary, entry) for the chapter,
+    or None when the edit changes the names, so every chapter must be rescanned (build_index).
+    """
+    if not summary or 'candidates' not in summary:
+        return None
+    paragraphs = split_paragraphs(content)
+    candidates = count_name_candidates(paragraphs)
+    totals = Counter(summary['candidates'])
+    totals.subtract((old_entry or {}).get('candidates', {}))
+    totals.update(candidates)
+    totals = +totals  # Drop names no chapter mentions any more
+    if set(choose_names(declared_names, totals)) != set(summary['names']):
+        return None
+
+    entry = {'hash': digest or chapter_hash(content), 'candidates': dict(candidates), 'mentions': _scan(paragraphs, summary['names'])}
+    return {'names': summary['names'], 'candidates': dict(totals)}, entry
+
+
+def find_name(index, character_name):
+    """The indexed name a user-typed character name refers to, or None"""
+    wanted = character_name.strip().lower()
+    aliases = _aliases(index.get('names', []))
+    for alias, name in aliases.items():
+        if alias.lower() == wanted:
+            return name
+    for name in index.get('names', []):
+        if wanted in name.lower() or name.lower() in wanted:
+            return name
+    return None
+
+
+def _spread_order(count):
+    """Positions 0..count-1 ordered so that any prefix is spread over the whole range"""
+    return sorted(range(count), key=lambda i: (i * 0.6180339887) % 1)
+
+
+def character_scenes(chapters_content, index, name, max_words=1500):
+    """
+    Paragraphs that mention a character, as {chapter, title, text} in reading order.
+    When they do not fit in max_words, dialogue paragraphs are preferred and the
+    rest are sampled across the whole book, so late appearances are not lost.
+    """
+    scenes = []
+    for chapter_index, (chapter, entry) in enumerate(zip(chapters_content, index.get('chapters', []))):
+        positions = entry['mentions'].get(name)
+        if not positions:
+            continue
+        paragraphs = split_paragraphs(chapter.get('content', ''))
+        for position in positions:
+            if position < len(paragraphs):
+                scenes.append((chapter_index, position, chapter.get('title', ''), paragraphs[position]))
+
+    dialogue = [scene for scene in scenes if _DIALOGUE_RE.search(scene[3])]
+    narrative = [scene for scene in scenes if not _DIALOGUE_RE.search(scene[3])]
+
+    selected = []
+    words = 0
+    for group, share in ((dialogue, 0.6), (narrative, 1.0)):
+        for i in _spread_order(len(group)):
+            scene_words = len(group[i][3].split())
+            if words + scene_words > max_words * share:
+                continue
+            selected.append(group[i])
+            words += scene_words
+
+    selected.sort()
+    return [{'chapter': chapter_index, 'title': title, 'text': text} for chapter_index, _, title, text in selected]
@@ -0,0 +1,194 @@
+"""
+BookCreatorAI - LLM Telemetry
+Per-route/per-model counters and latency histograms in Prometheus text format,
+plus usage meters that add up the cost of the calls made for one book
+"""
+
+import contextvars
+import threading
+from contextlib import contextmanager
+
+import config
+
+# Latency buckets in seconds; chapter generations take tens of seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def estimate_cost(prompt_tokens, output_tokens):
+    """Cost in USD of a call, from the per-million-token prices in config"""
+    return (prompt_tokens * config.LLM_INPUT_PRICE + output_tokens * config.LLM_OUTPUT_PRICE) / 1_000_000
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name, help_text, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labels, label_values, [('le', bound)])
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labels, label_values, [('le', '+Inf')])
+                lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {series[-2]:.6f}')
+                lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+class UsageMeter:
+    """Running total of the LLM usage of one unit of work (e.g. one book)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, usage):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage['prompt_tokens']
+            self.output_tokens += usage['output_tokens']
+            self.cost += usage['cost']
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens,
+            'cost': self.cost
+        }
+
+
+request_duration = Histogram(
+    'llm_request_duration_seconds', 'Latency of LLM calls, including retries', ('route', 'model')
+)
+requests_total = Counter(
+    'llm_requests_total', 'LLM calls by outcome (ok, error, cached)', ('route', 'model', 'status')
+)
+tokens_total = Counter(
+    'llm_tokens_total', 'LLM tokens by direction (prompt, output)', ('route', 'model', 'type')
+)
+estimated_tokens_total = Counter(
+    'llm_estimated_tokens_total', 'Tokens that were estimated because the response had no usage metadata', ('route', 'model')
+)
+retries_total = Counter(
+    'llm_retries_total', 'Retried LLM attempts', ('route', 'model')
+)
+cost_total = Counter(
+    'llm_cost_usd_total', 'Estimated LLM cost in USD', ('route', 'model')
+)
+
+REGISTRY = [request_duration, requests_total, tokens_total, estimated_tokens_total, retries_total, cost_total]
+
+# Meter of the work running in the current context (see metered())
+_current_meter = contextvars.ContextVar('llm_usage_meter', default=None)
+
+
+@contextmanager
+def metered():
+    """
+    Collect the usage of every LLM call made in this context into a UsageMeter.
+    Thread pools must run their tasks with contextvars.copy_context().run
+    for the calls made in worker threads to be counted.
+    """
+    meter = UsageMeter()
+    token = _current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+
+
+def record_call(route, model, duration, usage=None, error=False, cached=False, meter=None):
+    """
+    Record one finished LLM call.
+    Its usage is added to meter, or to the meter of the current context if none is given.
+    """
+    route = route or 'unknown'
+    if cached:
+        requests_total.inc(route, model, 'cached')
+        return
+
+    request_duration.observe(duration, route, model)
+    requests_total.inc(route, model, 'error' if error else 'ok')
+    if not usage:
+        return
+
+    tokens_total.inc(route, model, 'prompt', amount=usage['prompt_tokens'])
+    tokens_total.inc(route, model, 'output', amount=usage['output_tokens'])
+    if usage.get('estimated'):
+        estimated_tokens_total.inc(route, model, amount=usage['prompt_tokens'] + usage['output_tokens'])
+    cost_total.inc(route, model, amount=usage['cost'])
+
+    meter = meter or _current_meter.get()
+    if meter is not None:
+        meter.add(usage)
+
+
+def record_retry(route, model):
+    """Record a retried attempt"""
+    retries_total.inc(route or 'unknown', model)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,60 @@
+"""
+BookCreatorAI - Keyset Pagination
+Book listings are paged newest first on (created_at, id). The cursor holds the key of
+the last book of a page, so every page is a range read on an index, however deep
+into the library it is.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+import config
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not produced by encode_cursor"""
+
+
+def encode_cursor(book):
+    """Opaque cursor pointing after book"""
+    key = json.dumps([book.created_at.isoformat(), book.id])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of a cursor; raises InvalidCursor"""
+    try:
+        key = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, book_id = json.loads(key)
+        return datetime.fromisoformat(created_at), int(book_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Cursor inválido")
+
+
+def page_limit(value):
+    """The limit query parameter, between 1 and BOOKS_PAGE_MAX (BOOKS_PAGE_SIZE when absent or invalid)"""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return config.BOOKS_PAGE_SIZE
+    return max(1, min(limit, config.BOOKS_PAGE_MAX))
+
+
+def paginate(query, model, cursor=None, limit=None):
+    """
+    One page of query, newest first. Returns (items, next_cursor); next_cursor is
+    None on the last page. Raises InvalidCursor for a bad cursor.
+    """
+    limit = limit or config.BOOKS_PAGE_SIZE
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < item_id)
+        ))
+    items = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
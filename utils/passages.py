@@ -0,0 +1,172 @@
+"""
+BookCreatorAI - Passage Retrieval
+Splits a book into paragraph passages and ranks them against a question with BM25,
+so AI routes can send the relevant parts of a long book instead of its first pages
+"""
+
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from utils.text import normalize
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Passages are whole paragraphs merged up to about this many words
+PASSAGE_WORDS = 180
+
+# Function words of the app's languages; they match everywhere and carry no meaning
+STOPWORDS = set("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas para com sem
+e ou mas que se ao aos à às é foi era ser são está estão tem tinha há lhe lhes me te nos vos
+eu tu ele ela eles elas isto isso aquilo este esta esse essa aquele aquela seu sua seus suas
+meu minha teu tua não sim mais muito como quando onde quem qual quais porque já também só
+the an and or but of to in on at by for with from is are was were be been it its this that
+these those he she they them his her their not no as into than then so do does did what who
+le la les un une des du et est dans pour pas sur qui ce il elle der die das und ist nicht ein eine
+il lo gli di che non per con
+""".split())
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Index terms of a text: normalized words without stopwords and single characters"""
+    return [
+        word for word in _WORD_RE.findall(normalize(text))
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+def split_passages(chapters_content, max_words=PASSAGE_WORDS):
+    """
+    Split chapters into passages of whole paragraphs of about max_words words.
+    Paragraphs longer than max_words are split on sentence boundaries,
+    and sentences longer than that (unpunctuated text) every max_words words.
+    Returns a list of {chapter, title, text}.
+    """
+    passages = []
+    for chapter_index, chapter in enumerate(chapters_content):
+        title = chapter.get('title', '')
+        content = chapter.get('content', '')
+        # The chapter starts with its own title; it is not a passage
+        if title and content.startswith(title):
+            content = content[len(title):]
+
+        units = []
+        for paragraph in re.split(r'\n\s*\n', content):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if len(paragraph.split()) <= max_words:
+                units.append(paragraph)
+                continue
+            for sentence in re.split(r'(?<=[.!?…])\s+', paragraph):
+                words = sentence.split()
+                for start in range(0, len(words), max_words):
+                    units.append(' '.join(words[start:start + max_words]))
+
+        current = []
+        current_words = 0
+        for unit in units:
+            words = len(unit.split())
+            if current and current_words + words > max_words:
+                passages.append({'chapter': chapter_index, 'title': title, 'text': '\n\n'.join(current)})
+                current, current_words = [], 0
+            current.append(unit)
+            current_words += words
+        if current:
+            passages.append({'chapter': chapter_index, 'title': title, 'text': '\n\n'.join(current)})
+
+    return passages
+
+
+class PassageIndex:
+    """BM25 index over the passages of one book"""
+
+    def __init__(self, passages):
+        self.passages = passages
+        self.lengths = []
+        self.postings = {}  # term -> [(passage id, term frequency)]
+
+        for passage_id, passage in enumerate(passages):
+            # The chapter title counts as part of each of its passages
+            terms = Counter(tokenize(f"{passage['title']} {passage['text']}"))
+            self.lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((passage_id, frequency))
+
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+
+    def search(self, query, k=8):
+        """
+        Get the k passages that best match the query, best first.
+        Returns a list of (score, passage id); passages without any query term are left out.
+        """
+        scores = {}
+        count = len(self.passages)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for passage_id, frequency in postings:
+                length_ratio = self.lengths[passage_id] / self.average_length
+                denominator = frequency + BM25_K1 * (1 - BM25_B + BM25_B * length_ratio)
+                scores[passage_id] = scores.get(passage_id, 0) + idf * frequency * (BM25_K1 + 1) / denominator
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, passage_id) for passage_id, score in ranked[:k]]
+
+    def select(self, query, k=8, max_words=None):
+        """
+        Get the passages to put in a prompt: the top k for the query, at most max_words in total,
+        in reading order. Falls back to the opening passages when nothing matches.
+        """
+        hits = [passage_id for _, passage_id in self.search(query, k)]
+        if not hits:
+            hits = list(range(min(k, len(self.passages))))
+
+        selected = []
+        words = 0
+        for passage_id in hits:
+            passage_words = len(self.passages[passage_id]['text'].split())
+            if max_words and selected and words + passage_words > max_words:
+                continue
+            selected.append(passage_id)
+            words += passage_words
+        return sorted(selected)
+
+
+_indexes = OrderedDict()  # book id -> (content hash, PassageIndex)
+_indexes_lock = threading.Lock()
+MAX_CACHED_INDEXES = 64
+
+
+def get_book_index(book):
+    """
+    Get the passage index of a book, reusing the one built for the same chapter contents.
+    The cache is keyed on a hash of the chapters, so edits rebuild the index.
+    """
+    chapters_content = book.get_chapters_content()
+    digest = hashlib.sha1(json.dumps(chapters_content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    with _indexes_lock:
+        cached = _indexes.get(book.id)
+        if cached and cached[0] == digest:
+            _indexes.move_to_end(book.id)
+            return cached[1]
+
+    index = PassageIndex(split_passages(chapters_content))
+
+    with _indexes_lock:
+        _indexes[book.id] = (digest, index)
+        _indexes.move_to_end(book.id)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
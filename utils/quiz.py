@@ -0,0 +1,221 @@
+"""
+BookCreatorAI - Quiz Question Bank
+Multiple-choice questions written per chapter and stored per book, so a quiz is
+sampled from the database and covers the whole book
+"""
+
+import contextvars
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from models.book import db, Book, QuizQuestion
+from utils import jobs, llm_json, metrics
+from utils.text import normalize
+from utils.summaries import content_hash
+
+DIFFICULTIES = {
+    'easy': 'Perguntas simples sobre factos básicos da história.',
+    'medium': 'Perguntas que requerem boa compreensão da história e personagens.',
+    'hard': 'Perguntas difíceis sobre detalhes, simbolismo e análise profunda.'
+}
+
+# One fill at a time per (book, difficulty)
+_fill_locks = {}
+_fill_locks_guard = threading.Lock()
+
+# Background fills run on their own pool, apart from the book generation jobs
+_fill_executor = ThreadPoolExecutor(max_workers=config.QUIZ_FILL_WORKERS, thread_name_prefix='quizfill')
+_queued_fills = set()  # (book, difficulty) queued or running on _fill_executor
+
+
+def _fill_lock(book_id, difficulty):
+    with _fill_locks_guard:
+        return _fill_locks.setdefault((book_id, difficulty), threading.Lock())
+
+
+def question_key(text):
+    """Key used to detect the same question written twice"""
+    return ' '.join(normalize(text).replace('?', ' ').split())
+
+
+def validate_questions(items, seen=None):
+    """
+    Keep the well-formed questions of a model answer: a question, four distinct
+    non-empty options and correct in 0-3. Questions already in seen (keys from
+    question_key) are dropped, and the keys of the kept ones are added to it.
+    """
+    seen = set() if seen is None else seen
+    valid = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        question = str(item.get('question') or '').strip()
+        options = item.get('options')
+        if not question or not isinstance(options, list) or len(options) != 4:
+            continue
+        options = [str(option).strip() for option in options]
+        if not all(options) or len({normalize(option) for option in options}) != 4:
+            continue
+        try:
+            correct = int(item.get('correct'))
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= correct <= 3:
+            continue
+        key = question_key(question)
+        if key in seen:
+            continue
+        seen.add(key)
+        valid.append({
+            'question': question,
+            'options': options,
+            'correct': correct,
+            'explanation': str(item.get('explanation') or '').strip()
+        })
+    return valid
+
+
+def write_questions(book_title, chapter, difficulty, count, avoid=()):
+    """Ask the model for count questions about one chapter; returns the questions it wrote"""
+    avoid_text = ""
+    if avoid:
+        avoid_text = "\n\nNão repitas estas perguntas:\n" + "\n".join(f"- {question}" for question in avoid)
+
+    prompt = f"""Cria perguntas de escolha múltipla sobre um capítulo do livro "{book_title}".
+
+=== {chapter.get('title', '')} ===
+{chapter.get('content', '')}
+
+=== TAREFA ===
+Cria {count} perguntas sobre este capítulo.
+Dificuldade: {difficulty} - {DIFFICULTIES[difficulty]}{avoid_text}
+
+=== FORMATO JSON ===
+Responde APENAS com JSON válido neste formato:
+[
+  {{
+    "question": "Pergunta aqui?",
+    "options": ["Opção A", "Opção B", "Opção C", "Opção D"],
+    "correct": 0,
+    "explanation": "Explicação da resposta correta"
+  }}
+]
+
+O campo "correct" é o índice (0-3) da opção correta.
+Responde APENAS com o JSON, sem texto adicional."""
+
+    try:
+        questions, _ = llm_json.generate(prompt, llm_json.QUIZ_QUESTIONS, route='quiz_bank', count=count)
+    except llm_json.JSONExtractionError:
+        return []
+    return questions
+
+
+def current_questions(book, difficulty):
+    """
+    Questions of the bank that still match the book, by chapter index.
+    Questions about chapters that changed or no longer exist are deleted (the caller commits).
+    """
+    hashes = [content_hash(chapter.get('content')) for chapter in book.get_chapters_content()]
+    by_chapter = {}
+    for question in book.quiz_questions.filter_by(difficulty=difficulty):
+        if question.chapter < len(hashes) and question.content_hash == hashes[question.chapter]:
+            by_chapter.setdefault(question.chapter, []).append(question)
+        else:
+            db.session.delete(question)
+    return by_chapter
+
+
+def fill_bank(book_id, difficulty):
+    """
+    Write questions for every chapter with fewer than QUIZ_QUESTIONS_PER_CHAPTER,
+    in parallel (CHAPTER_WORKERS), and save them. Waits for a fill already running
+    for the same book and difficulty, then only writes what is still missing.
+    Returns the number of questions added.
+    """
+    with _fill_lock(book_id, difficulty):
+        book = db.session.get(Book, book_id)
+        if not book:
+            return 0
+        chapters = book.get_chapters_content()
+        by_chapter = current_questions(book, difficulty)
+        missing = {
+            i: config.QUIZ_QUESTIONS_PER_CHAPTER - len(by_chapter.get(i, []))
+            for i in range(len(chapters))
+            if len(by_chapter.get(i, [])) < config.QUIZ_QUESTIONS_PER_CHAPTER
+        }
+        seen = {question_key(q.question) for questions in by_chapter.values() for q in questions}
+
+        with metrics.metered() as usage:
+            with ThreadPoolExecutor(max_workers=config.CHAPTER_WORKERS) as executor:
+                futures = {
+                    i: executor.submit(
+                        contextvars.copy_context().run, write_questions, book.title, chapters[i], difficulty, count,
+                        [q.question for q in by_chapter.get(i, [])]
+                    )
+                    for i, count in missing.items()
+                }
+                answers = {i: future.result() for i, future in futures.items()}
+
+        added = 0
+        for i in sorted(answers):
+            digest = content_hash(chapters[i].get('content'))
+            for item in validate_questions(answers[i], seen)[:missing[i]]:
+                question = QuizQuestion(
+                    book_id=book.id, chapter=i, content_hash=digest, difficulty=difficulty,
+                    question=item['question'], correct=item['correct'], explanation=item['explanation']
+                )
+                question.set_options(item['options'])
+                db.session.add(question)
+                added += 1
+
+        book.add_usage(usage.to_dict())
+        db.session.commit()
+        return added
+
+
+def fill_bank_in_background(app, book_id, difficulty):
+    """
+    Queue fill_bank on the quiz pool. Skipped (returns None) when a fill for the
+    same book and difficulty is already queued or running.
+    """
+    key = (book_id, difficulty)
+    with _fill_locks_guard:
+        if key in _queued_fills or (key in _fill_locks and _fill_locks[key].locked()):
+            return None
+        _queued_fills.add(key)
+
+    def run():
+        try:
+            return fill_bank(book_id, difficulty)
+        finally:
+            with _fill_locks_guard:
+                _queued_fills.discard(key)
+
+    return _fill_executor.submit(jobs.run_in_app_context, app, run)
+
+
+def bank_is_low(by_chapter, num_chapters):
+    """True when some chapter has no questions or the bank holds fewer than QUIZ_BANK_MIN_QUESTIONS"""
+    total = sum(len(questions) for questions in by_chapter.values())
+    return total < config.QUIZ_BANK_MIN_QUESTIONS or len(by_chapter) < num_chapters
+
+
+def sample(by_chapter, num_questions, rng=random):
+    """
+    Pick num_questions questions spread over the chapters: one random question
+    per chapter in turn, starting from a random chapter. Returned in reading order.
+    """
+    pools = {chapter: rng.sample(questions, len(questions)) for chapter, questions in by_chapter.items()}
+    order = list(pools)
+    rng.shuffle(order)
+
+    picked = []
+    while len(picked) < num_questions and any(pools.values()):
+        for chapter in order:
+            if pools[chapter] and len(picked) < num_questions:
+                picked.append(pools[chapter].pop())
+    picked.sort(key=lambda question: (question.chapter, question.id))
+    return picked
@@ -0,0 +1,114 @@
+"""
+BookCreatorAI - Gemini Rate Limiter
+Token buckets for requests/minute and tokens/minute shared by every worker process
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+
+
+class RateLimitExceeded(Exception):
+    """Raised when the quota does not free up within the maximum wait"""
+
+
+def estimate_tokens(text):
+    """Rough token count for a prompt (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Two token buckets (requests and tokens) stored in a SQLite file.
+    BEGIN IMMEDIATE takes the database write lock, so refills and withdrawals
+    are atomic across threads and gunicorn worker processes.
+    A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, path, requests_per_minute, tokens_per_minute, max_wait=60):
+        self.path = path
+        self.max_wait = max_wait
+        self.limits = {
+            'requests': requests_per_minute,
+            'tokens': tokens_per_minute
+        }
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        connection = self._connect()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def _try_acquire(self, amounts):
+        """
+        Refill the buckets and withdraw the amounts if they are all available.
+        Returns 0 on success, otherwise the seconds until the amounts should be available.
+        """
+        connection = self._connect()
+        now = time.time()
+        wait = 0
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            levels = {}
+            for name, amount in amounts.items():
+                capacity = self.limits[name]
+                row = connection.execute('SELECT level, updated_at FROM buckets WHERE name = ?', (name,)).fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60)
+                levels[name] = level
+                if level < amount:
+                    wait = max(wait, (amount - level) * 60 / capacity)
+
+            for name, level in levels.items():
+                if not wait:
+                    level -= amounts[name]
+                connection.execute(
+                    'INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)',
+                    (name, level, now)
+                )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        return wait
+
+    def acquire(self, tokens=0):
+        """
+        Take one request and the given number of tokens, waiting for the buckets to refill.
+        Returns the number of seconds waited.
+        """
+        amounts = {}
+        if self.limits['requests']:
+            amounts['requests'] = 1
+        if self.limits['tokens']:
+            # A single prompt larger than the whole bucket would never fit
+            amounts['tokens'] = min(tokens, self.limits['tokens'])
+        if not amounts:
+            return 0
+
+        started = time.time()
+        while True:
+            wait = self._try_acquire(amounts)
+            waited = time.time() - started
+            if not wait:
+                return waited
+            if waited + wait > self.max_wait:
+                raise RateLimitExceeded(
+                    f"Quota do Gemini esgotada: aguarde {int(wait)}s e tente novamente."
+                )
+            # Jitter spreads the retries of workers that are waiting at the same time
+            time.sleep(min(wait, 1) + random.uniform(0, 0.1))
@@ -0,0 +1,40 @@
+"""
+BookCreatorAI - Single-flight
+Concurrent calls with the same key share one execution
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Keyed map of in-flight calls; callers with a key already in flight wait for its result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Run func() once for all concurrent callers with the same key.
+        Every caller gets the same result (or the same exception).
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+        return future.result()
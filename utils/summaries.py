@@ -0,0 +1,205 @@
+"""
+BookCreatorAI - Summary Tree
+Cached summaries of a book at three levels (passages -> chapters -> book), so prompts
+can carry the whole story in a few hundred words. Only chapters whose text changed
+are summarized again.
+"""
+
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+import config
+from models.book import db, ChapterSummary
+from utils import llm, metrics
+from utils.mentions import split_paragraphs
+
+
+def content_hash(text):
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+
+def split_sections(content, max_words):
+    """Group the paragraphs of a chapter into sections of at most about max_words words"""
+    sections = []
+    current = []
+    current_words = 0
+    for paragraph in split_paragraphs(content):
+        words = len(paragraph.split())
+        if current and current_words + words > max_words:
+            sections.append('\n\n'.join(current))
+            current, current_words = [], 0
+        current.append(paragraph)
+        current_words += words
+    if current:
+        sections.append('\n\n'.join(current))
+    return sections
+
+
+def summarize_chapter(title, content):
+    """
+    Summarize one chapter in 3-5 sentences.
+    Long chapters are summarized section by section first, then the section summaries are combined.
+    """
+    sections = split_sections(content, config.SUMMARY_SECTION_WORDS)
+    if len(sections) > 1:
+        partials = []
+        for i, section in enumerate(sections, 1):
+            prompt = f"""Resume esta parte ({i} de {len(sections)}) do capítulo "{title}" em 2-3 frases.
+Inclui os acontecimentos, as personagens envolvidas e o que mudou.
+
+{section}
+
+Responde APENAS com o resumo."""
+            partials.append(llm.generate(prompt, route='summarize_section').text.strip())
+        content = "\n".join(f"- {partial}" for partial in partials)
+        source = "Resumos das partes do capítulo, por ordem"
+    else:
+        source = "Texto do capítulo"
+
+    prompt = f"""Resume o capítulo "{title}" em 3-5 frases.
+Inclui os acontecimentos principais, as personagens envolvidas e como o capítulo termina.
+
+{source}:
+{content}
+
+Responde APENAS com o resumo, sem títulos."""
+    return llm.generate(prompt, route='summarize_chapter').text.strip()
+
+
+def summarize_book(title, chapter_summaries):
+    """Summarize the whole story from its chapter summaries"""
+    chapters_text = "\n".join(f"{item['title']}: {item['summary']}" for item in chapter_summaries)
+    prompt = f"""Resume a história completa do livro "{title}" num parágrafo de 6-10 frases,
+a partir dos resumos dos capítulos. Inclui o início, os principais desenvolvimentos e o ponto em que a história termina.
+
+{chapters_text}
+
+Responde APENAS com o resumo."""
+    return llm.generate(prompt, route='summarize_book').text.strip()
+
+
+def save_summary(book_id, position, title, digest, summary):
+    """
+    Insert or update the summary at position. Two requests may summarize the same
+    book at the same time, so the row is upserted rather than added.
+    """
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(ChapterSummary).values(
+        book_id=book_id, position=position, title=title, content_hash=digest,
+        summary=summary, updated_at=datetime.utcnow()
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['book_id', 'position'],
+        set_={column: statement.excluded[column] for column in ('title', 'content_hash', 'summary', 'updated_at')}
+    ))
+
+
+def get_summary_tree(book):
+    """
+    Get the summaries of a book: {'book': str, 'chapters': [{'title', 'summary'}]}.
+    Missing or stale chapter summaries are generated in parallel (CHAPTER_WORKERS) and
+    saved, and the book summary is regenerated when any chapter summary changed.
+    If a chapter fails, the others are still saved before its error is raised.
+    The new summaries are committed here, so they are kept even if the caller fails later.
+    Also returns the LLM usage spent, which the caller adds to the book.
+    """
+    chapters = book.get_chapters_content()
+    saved = {summary.position: summary for summary in book.summaries}
+
+    titles = [chapter.get('title') or f'Capítulo {position + 1}' for position, chapter in enumerate(chapters)]
+    digests = [content_hash(chapter.get('content')) for chapter in chapters]
+    stale = [
+        position for position in range(len(chapters))
+        if position not in saved or saved[position].content_hash != digests[position]
+    ]
+
+    with metrics.metered() as usage:
+        # Only the LLM calls run in the pool; the session is used from this thread only
+        with ThreadPoolExecutor(max_workers=config.CHAPTER_WORKERS) as executor:
+            futures = {
+                position: executor.submit(
+                    contextvars.copy_context().run, summarize_chapter,
+                    titles[position], chapters[position].get('content', '')
+                )
+                for position in stale
+            }
+            fresh, error = {}, None
+            for position, future in futures.items():
+                try:
+                    fresh[position] = future.result()
+                except Exception as e:
+                    error = error or e
+
+        if error is not None:
+            # Keep the chapters that were summarized; the next request only redoes the failed ones
+            for position in fresh:
+                save_summary(book.id, position, titles[position], digests[position], fresh[position])
+            db.session.commit()
+            raise error
+
+        chapter_summaries = []
+        for position in range(len(chapters)):
+            if position in fresh:
+                chapter_summaries.append({'title': titles[position], 'summary': fresh[position], 'hash': digests[position]})
+            else:
+                row = saved[position]
+                chapter_summaries.append({'title': row.title, 'summary': row.summary, 'hash': row.content_hash})
+
+        book_digest = content_hash(''.join(item['hash'] for item in chapter_summaries))
+        book_row = saved.get(ChapterSummary.BOOK_POSITION)
+        book_summary = book_row.summary if book_row else ''
+        update_book = chapter_summaries and (not book_row or book_row.content_hash != book_digest)
+        if update_book:
+            book_summary = summarize_book(book.title, chapter_summaries)
+
+    # Written after the LLM calls, so the database isn't locked while they run
+    for position in fresh:
+        save_summary(book.id, position, titles[position], digests[position], fresh[position])
+    if update_book:
+        save_summary(book.id, ChapterSummary.BOOK_POSITION, book.title, book_digest, book_summary)
+    # Chapters that no longer exist
+    if any(position >= len(chapters) for position in saved):
+        db.session.execute(db.delete(ChapterSummary).where(
+            ChapterSummary.book_id == book.id, ChapterSummary.position >= len(chapters)
+        ))
+    db.session.commit()
+
+    return {
+        'book': book_summary if chapter_summaries else '',
+        'chapters': [{'title': item['title'], 'summary': item['summary']} for item in chapter_summaries]
+    }, usage.to_dict()
+
+
+def format_summary_context(tree, opening_chapters=0, recent_chapters=0):
+    """
+    Text of the summary tree for a prompt: the book summary plus chapter summaries.
+    Only the first opening_chapters and the last recent_chapters chapters are listed
+    (the book summary covers the rest); with both at 0 every chapter is listed.
+    """
+    chapters = list(enumerate(tree['chapters']))
+    if opening_chapters or recent_chapters:
+        keep = set(range(opening_chapters)) | set(range(len(chapters) - recent_chapters, len(chapters)))
+        chapters = [(i, item) for i, item in chapters if i in keep]
+    lines = [f"Resumo do livro: {tree['book']}", "", "Resumo dos capítulos:"]
+    lines.extend(f"- {item['title']}: {item['summary']}" for _, item in chapters)
+    return "\n".join(lines)
+
+
+def tail_words(text, count):
+    """The last count words of a text, starting at a paragraph boundary when possible"""
+    words = (text or '').split(' ')
+    if len(words) <= count:
+        return text or ''
+    tail = ' '.join(words[-count:])
+    boundary = tail.find('\n\n')
+    return tail[boundary + 2:] if 0 <= boundary < len(tail) // 2 else tail
+
+
+def head_words(text, count):
+    """The first count words of a text"""
+    words = (text or '').split(' ')
+    return ' '.join(words[:count])
@@ -0,0 +1,12 @@
+"""
+BookCreatorAI - Text Helpers
+Small string helpers shared by retrieval, JSON repair and the quiz bank
+"""
+
+import unicodedata
+
+
+def normalize(text):
+    """Lowercase and strip accents, so 'Coração' and 'coracao' match"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))